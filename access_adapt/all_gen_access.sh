@@ -102,3 +102,7 @@ else
         access_adapt/do_gen_access.sh gen$i gen$((i+1))
     done
 fi
+
+if [ "$(./elmconfig.py get run.coverage_service)" == "True" ]; then
+    python elm_covservice.py stop --spool "$ELMFUZZ_RUNDIR"/covservice
+fi
@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 
 pip install https://github.com/cychen2021/idontwannadoresearch/archive/refs/tags/v0.0.48.zip
-pip install tqdm ruamel.yaml requests plotext
+pip install tqdm ruamel.yaml requests plotext aiohttp zstandard
@@ -106,3 +106,7 @@ else
         ./do_gen.sh gen$i gen$((i+1))
     done
 fi
+
+if [ "$(./elmconfig.py get run.coverage_service)" == "True" ]; then
+    python elm_covservice.py stop --spool "$ELMFUZZ_RUNDIR"/covservice
+fi
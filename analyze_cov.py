@@ -1,38 +1,33 @@
 #!/usr/bin/env python3
 
 import argparse
-import json
-from collections import defaultdict
 import re
 import plotext as plt
 import os
 
+from covmap import load_table
+
 gen_re = re.compile(r'gen(\d+)')
 
 def print_cov(covfiles):
     data = []
     for covfile in covfiles:
         gen = int(gen_re.search(covfile).group(1))
-        with open(covfile, 'r') as f:
-            cov = json.load(f)
-        for model, generators in cov.items():
-            for generator, cov in generators.items():
-                data.append((gen, model, generator, len(cov)))
+        table = load_table(covfile)
+        for (model, generator), count in zip(table.keys, table.counts()):
+            data.append((gen, model, generator, int(count)))
     return data
 
 def cumulative_cov(covfiles):
-    cov_by_gen = defaultdict(set)
+    cov_by_gen = {}
     for covfile in covfiles:
         gen = int(gen_re.search(covfile).group(1))
-        with open(covfile, 'r') as f:
-            cov = json.load(f)
-        for model, generators in cov.items():
-            for generator, cov in generators.items():
-                cov_by_gen[gen].update(cov)
-    cumulative = set()
+        union = load_table(covfile).union()
+        cov_by_gen[gen] = cov_by_gen[gen] | union if gen in cov_by_gen else union
+    cumulative = None
     data = []
     for gen, cov in sorted(cov_by_gen.items()):
-        cumulative.update(cov)
+        cumulative = cov if cumulative is None else cumulative | cov
         data.append((gen, len(cumulative)))
     return data
 
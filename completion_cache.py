@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from typing import Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'elmfuzz', 'completions')
+
+class CompletionCache:
+    """On-disk cache of LLM completions, keyed by a hash of the request.
+
+    Each entry is a JSON file under `cache_dir`, named after the SHA-256 of
+    the model, prompt, generation parameters and sample index, so re-running
+    the same generation returns the same responses without asking the model.
+    The cache is kept under `max_bytes` by evicting the least recently used
+    entries; a hit touches the entry's mtime, which serves as its LRU stamp.
+    """
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = 1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model: str, prompt: str, temperature: float, max_new_tokens: int,
+            repetition_penalty: float, stop, sample: int) -> str:
+        blob = json.dumps([
+            model, prompt, temperature, max_new_tokens,
+            repetition_penalty, list(stop or []), sample,
+        ], ensure_ascii=False)
+        return hashlib.sha256(blob.encode('utf-8', errors='surrogatepass')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                res = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return res
+
+    def put(self, key: str, res: dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write atomically so a crash never leaves a truncated entry behind
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(res, f)
+        os.replace(tmp, path)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        print(f'Evicted {removed} entries from completion cache {self.cache_dir}',
+              file=sys.stderr, flush=True)
+
+    def summary(self) -> str:
+        return f'Completion cache: {self.hits} hits, {self.misses} misses'
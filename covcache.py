@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+# Per-input coverage cache and afl-showmap scheduling.
+#
+# Replaying each generator's whole output directory through afl-showmap runs
+# the target on inputs it has already seen: variants often produce the same
+# outputs, within a generation and across generations. The cache maps
+# (target binary, input sha256) to the edges that input covers. collect()
+# hashes every input, runs afl-showmap (one map per input, -o to a
+# directory) only on the distinct inputs that aren't cached, and builds each
+# generator's coverage from the cached entries.
+#
+# The inputs to run are split into one work unit per worker (`jobs` of them)
+# of about equal cost, a fixed per-input overhead plus the input's size, by
+# longest-processing-time-first assignment. Each unit is one afl-showmap run,
+# so each worker starts one forkserver and streams its whole share of the
+# inputs through it, and the workers finish at about the same time rather
+# than one being left with a long unit at the end. Without a cache,
+# collect() is just this scheduler.
+#
+# The cache for a target is an append-only file named after the target's
+# sha256, of records
+#   32-byte input sha256, uint32 edge count, uint32 edge ids
+# A torn record at the end (from a killed run) is ignored and overwritten.
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import heapq
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from hashcache import hash_file
+
+RECORD_HEADER = struct.Struct('<32sI')
+# Cost of running an input, besides its size, in bytes
+INPUT_COST = 4096
+
+class CoverageCache:
+    """Edges covered by each input of one target, cached in `cache_dir`"""
+    def __init__(self, cache_dir: str, target_hash: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, f'{target_hash}.cov')
+        self.entries: Dict[bytes, np.ndarray] = {}
+        self.lock = threading.Lock()
+        end = 0
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        while end + RECORD_HEADER.size <= len(data):
+            digest, count = RECORD_HEADER.unpack_from(data, end)
+            start = end + RECORD_HEADER.size
+            if start + 4 * count > len(data):
+                break
+            self.entries[digest] = np.frombuffer(data, dtype='<u4', count=count, offset=start)
+            end = start + 4 * count
+        self.f = open(self.path, 'ab')
+        if end < len(data):
+            self.f.truncate(end)
+
+    @classmethod
+    def for_target(cls, cache_dir: str, target: str) -> 'CoverageCache':
+        return cls(cache_dir, hash_file(target))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, digest: bytes) -> Optional[np.ndarray]:
+        return self.entries.get(digest)
+
+    def put_many(self, items: List[Tuple[bytes, np.ndarray]]):
+        records = []
+        for digest, edges in items:
+            edges = np.asarray(edges, dtype='<u4')
+            records.append(RECORD_HEADER.pack(digest, len(edges)) + edges.tobytes())
+        with self.lock:
+            for digest, edges in items:
+                self.entries[digest] = np.asarray(edges, dtype='<u4')
+            self.f.write(b''.join(records))
+            self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def read_map(path: str) -> np.ndarray:
+    """Edge ids of an afl-showmap output ("edge:count" lines)"""
+    with open(path) as f:
+        edges = [int(line.partition(':')[0]) for line in f if line.strip()]
+    return np.array(edges, dtype='<u4')
+
+def showmap_inputs(showmap: str, prog: str, inputs: Dict[str, str]) -> Optional[Dict[str, np.ndarray]]:
+    """Edges covered by each input ({name: path}), from one afl-showmap run.
+    An input with no map (a crash or hang) covers nothing. None if showmap
+    produced no maps at all, which is more likely a broken setup than inputs
+    that all failed, and shouldn't be cached."""
+    with tempfile.TemporaryDirectory() as d:
+        indir = os.path.join(d, 'in')
+        outdir = os.path.join(d, 'out')
+        os.mkdir(indir)
+        for name, path in inputs.items():
+            try:
+                os.link(path, os.path.join(indir, name))
+            except OSError:
+                shutil.copy(path, os.path.join(indir, name))
+        cmd = [showmap, '-q', '-i', indir, '-o', outdir, '-m', 'none', '--', prog, '@@']
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       env={'AFL_QUIET': '1'})
+        if not os.path.isdir(outdir) or not os.listdir(outdir):
+            return None
+        res = {}
+        for name in inputs:
+            map_path = os.path.join(outdir, name)
+            res[name] = read_map(map_path) if os.path.exists(map_path) else np.zeros(0, dtype='<u4')
+        return res
+
+def _hash_dir(gendir: str) -> List[Tuple[bytes, str, int]]:
+    digests = []
+    for entry in os.scandir(gendir):
+        if entry.is_file():
+            digests.append((bytes.fromhex(hash_file(entry.path)), entry.path, entry.stat().st_size))
+    return digests
+
+def plan_units(inputs: List[Tuple[bytes, str, int]], workers: int) -> List[List[Tuple[bytes, str]]]:
+    """Split (digest, path, size) inputs into one work unit per worker (fewer
+    if there are fewer inputs) of about equal cost, largest first"""
+    if not inputs:
+        return []
+    n_units = min(len(inputs), workers)
+    loads = [(0, i) for i in range(n_units)]
+    units: List[List[Tuple[bytes, str]]] = [[] for _ in range(n_units)]
+    for digest, path, size in sorted(inputs, key=lambda x: x[2], reverse=True):
+        load, i = heapq.heappop(loads)
+        units[i].append((digest, path))
+        heapq.heappush(loads, (load + INPUT_COST + size, i))
+    order = sorted(loads, reverse=True)
+    return [units[i] for _, i in order]
+
+def collect(showmap: str, prog: str, gendirs: Dict[Tuple[str, str], str],
+            cache: Optional[CoverageCache] = None, jobs: int = 64,
+            progress=None) -> Dict[Tuple[str, str], List[str]]:
+    """Coverage of each generator's output directory as afl-showmap -C would
+    give it ("edge:count" strings, count being the number of inputs that hit
+    the edge), running showmap once on each distinct input that isn't cached.
+    `progress` counts the inputs run, and moves on as each work unit finishes."""
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        hashed = dict(zip(gendirs, executor.map(_hash_dir, gendirs.values())))
+        # Each distinct uncached input is run once, whichever generators produced it
+        misses: Dict[bytes, Tuple[str, int]] = {}
+        total = hits = 0
+        for files in hashed.values():
+            for digest, path, size in files:
+                total += 1
+                if cache is not None and cache.get(digest) is not None:
+                    hits += 1
+                else:
+                    misses.setdefault(digest, (path, size))
+        units = plan_units([(d, p, size) for d, (p, size) in misses.items()], jobs)
+        if cache is not None:
+            print(f'Coverage cache: {hits}/{total} inputs cached', file=sys.stderr)
+        print(f'Running {len(misses)} distinct inputs in {len(units)} afl-showmap work units',
+              file=sys.stderr)
+        if progress is not None:
+            progress.total = len(misses)
+
+        def run_unit(unit):
+            maps = showmap_inputs(showmap, prog, {d.hex(): p for d, p in unit})
+            if maps is None:
+                print(f'afl-showmap produced no maps for {len(unit)} inputs'
+                      + ('; not caching them' if cache is not None else ''), file=sys.stderr)
+                return {d: np.zeros(0, dtype='<u4') for d, _ in unit}
+            res = {d: maps[d.hex()] for d, _ in unit}
+            if cache is not None:
+                cache.put_many(list(res.items()))
+            return res
+        uncached = {}
+        futures = {executor.submit(run_unit, unit): unit for unit in units}
+        for future in as_completed(futures):
+            uncached.update(future.result())
+            if progress is not None:
+                progress.update(len(futures[future]))
+
+    # Demultiplex the per-input maps back to the generators that produced them
+    coverage = {}
+    for key, files in hashed.items():
+        maps = [uncached[d] if d in uncached else cache.get(d) for d, _, _ in files]
+        if maps:
+            edges, counts = np.unique(np.concatenate(maps), return_counts=True)
+        else:
+            edges, counts = [], []
+        coverage[key] = [f'{e:06d}:{c}' for e, c in zip(edges, counts)]
+    return coverage
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+
+# Coverage as packed bitmaps.
+#
+# afl-showmap -C writes one "edge:hit" line per covered edge, where edge is an
+# index into the AFL map. Kept as Python sets of those strings, the coverage
+# of targets with 2M-entry maps (cpython3, cvc5, librsvg) is large and slow to
+# compare. A CoverageMap is a packed bit per map entry (uint8, MSB first, as
+# np.packbits gives), plus optionally the hit count of each covered edge, so
+# union, subset and size are a few vectorized operations over map_size/8
+# bytes.
+#
+# A CoverageTable holds the maps of every generator in a coverage file as one
+# 2D array. It is saved as a coverage store (coverage.bin, getcov --bitmap),
+# which CoverageStore reads lazily. load_table() reads a store or a
+# coverage.json, and `python covmap.py import/export` converts between them;
+# a store with hit counts exports to the same "%06d:%d" strings getcov wrote.
+
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_MAP_SIZE = 65536
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+_M1, _M2, _M4, _H01 = (np.uint64(0x5555555555555555), np.uint64(0x3333333333333333),
+                       np.uint64(0x0f0f0f0f0f0f0f0f), np.uint64(0x0101010101010101))
+
+def map_size() -> int:
+    """Map size of the target, from AFL_MAP_SIZE as for afl-showmap"""
+    return int(os.environ.get('AFL_MAP_SIZE', DEFAULT_MAP_SIZE))
+
+def _nbytes(size: int) -> int:
+    # Whole uint64 words, so the bits can be counted a word at a time
+    return (size + 63) // 64 * 8
+
+def parse_edges(lines: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Edge ids and hit counts of "edge:hit" (or bare "edge") lines"""
+    edges, hits = [], []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        edge, _, hit = line.partition(':')
+        edges.append(int(edge))
+        hits.append(int(hit) if hit else 1)
+    return np.array(edges, dtype=np.int64), np.array(hits, dtype=np.int64)
+
+class CoverageMap:
+    """Set of covered edges as a packed bitmap. Supports len(), |, &, -,
+    issubset, == and hashing like a frozenset of edge ids. `hits`, if kept,
+    is the hit count of each covered edge in ascending edge order; the
+    results of set operations don't keep it."""
+    __slots__ = ('bits', 'hits', '_count')
+
+    def __init__(self, bits: np.ndarray, hits: Optional[np.ndarray] = None):
+        self.bits = bits
+        self.hits = hits
+        self._count = None
+
+    @classmethod
+    def empty(cls, size: Optional[int] = None) -> 'CoverageMap':
+        return cls(np.zeros(_nbytes(size or map_size()), dtype=np.uint8))
+
+    @classmethod
+    def from_edges(cls, edges: Iterable, size: Optional[int] = None,
+                   with_hits: bool = False) -> 'CoverageMap':
+        """Map of afl-showmap "edge:hit" strings or edge ids; grown past
+        `size` if an edge doesn't fit"""
+        ids, counts = parse_edges(map(str, edges))
+        size = size or map_size()
+        if len(ids) and ids.max() >= size:
+            size = int(ids.max()) + 1
+        unpacked = np.zeros(_nbytes(size) * 8, dtype=np.uint8)
+        unpacked[ids] = 1
+        hits = None
+        if with_hits:
+            covered, index = np.unique(ids, return_inverse=True)
+            hits = np.zeros(len(covered), dtype=np.uint32)
+            np.maximum.at(hits, index, counts.astype(np.uint32))
+        return cls(np.packbits(unpacked), hits)
+
+    @classmethod
+    def from_showmap(cls, path: str, size: Optional[int] = None,
+                     with_hits: bool = False) -> 'CoverageMap':
+        with open(path) as f:
+            return cls.from_edges(f, size, with_hits)
+
+    @property
+    def size(self) -> int:
+        return len(self.bits) * 8
+
+    def edges(self) -> np.ndarray:
+        """Covered edge ids, ascending"""
+        return np.flatnonzero(np.unpackbits(self.bits))
+
+    def to_list(self) -> List[str]:
+        """Edge ids as strings, the form select_seeds keeps elites in"""
+        return [str(e) for e in self.edges()]
+
+    def __len__(self) -> int:
+        if self._count is None:
+            self._count = int(popcount_rows(self.bits))
+        return self._count
+
+    def __bool__(self) -> bool:
+        return bool(self.bits.any())
+
+    def _aligned(self, other: 'CoverageMap') -> Tuple[np.ndarray, np.ndarray]:
+        a, b = self.bits, other.bits
+        if len(a) < len(b):
+            a = np.pad(a, (0, len(b) - len(a)))
+        elif len(b) < len(a):
+            b = np.pad(b, (0, len(a) - len(b)))
+        return a, b
+
+    def __or__(self, other: 'CoverageMap') -> 'CoverageMap':
+        a, b = self._aligned(other)
+        return CoverageMap(a | b)
+
+    def __ior__(self, other: 'CoverageMap') -> 'CoverageMap':
+        if len(other.bits) > len(self.bits):
+            return self | other
+        self.bits[:len(other.bits)] |= other.bits
+        self.hits = None
+        self._count = None
+        return self
+
+    def __and__(self, other: 'CoverageMap') -> 'CoverageMap':
+        a, b = self._aligned(other)
+        return CoverageMap(a & b)
+
+    def __sub__(self, other: 'CoverageMap') -> 'CoverageMap':
+        a, b = self._aligned(other)
+        return CoverageMap(a & ~b)
+
+    def union(self, *others: 'CoverageMap') -> 'CoverageMap':
+        res = self.copy()
+        for other in others:
+            res |= other
+        return res
+
+    def issubset(self, other: 'CoverageMap') -> bool:
+        a, b = self._aligned(other)
+        return not np.any(a & ~b)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CoverageMap):
+            return NotImplemented
+        a, b = self._aligned(other)
+        return np.array_equal(a, b)
+
+    def __hash__(self) -> int:
+        return hash(np.trim_zeros(self.bits, 'b').tobytes())
+
+    def copy(self) -> 'CoverageMap':
+        return CoverageMap(self.bits.copy(), None if self.hits is None else self.hits.copy())
+
+    def __repr__(self) -> str:
+        return f'CoverageMap({len(self)} of {self.size} edges)'
+
+def popcount_rows(bits: np.ndarray) -> np.ndarray:
+    """Number of set bits in each row of a packed array (the total for 1D)"""
+    if bits.shape[-1] % 8 or not bits.flags.c_contiguous:
+        return _POPCOUNT[bits].sum(axis=-1, dtype=np.int64)
+    # SWAR popcount of each uint64 word
+    x = bits.view(np.uint64)
+    x = x - ((x >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return ((x * _H01) >> np.uint64(56)).sum(axis=-1, dtype=np.int64)
+
+def stack(maps: List[CoverageMap]) -> np.ndarray:
+    """Bits of maps as the rows of a 2D array, padded to the largest"""
+    nbytes = max([len(m.bits) for m in maps], default=0)
+    bits = np.zeros((len(maps), nbytes), dtype=np.uint8)
+    for i, m in enumerate(maps):
+        bits[i, :len(m.bits)] = m.bits
+    return bits
+
+def subset_matrix(bits: np.ndarray) -> np.ndarray:
+    """subset[i, j] is whether row i's edges are a subset of row j's"""
+    n = len(bits)
+    res = np.zeros((n, n), dtype=bool)
+    for j in range(n):
+        # Rows with no edges outside row j
+        res[:, j] = ~np.any(bits & ~bits[j], axis=1)
+    return res
+
+class CoverageTable:
+    """Coverage maps of every (model, generator) in a coverage file"""
+    def __init__(self, keys: List[Tuple[str, str]], bits: np.ndarray,
+                 hits: Optional[List[np.ndarray]] = None):
+        self.keys = keys
+        self.bits = bits
+        self.hits = hits
+
+    @classmethod
+    def from_dict(cls, cov: Dict[str, Dict[str, Iterable]], size: Optional[int] = None,
+                  with_hits: bool = False) -> 'CoverageTable':
+        """Table of a {model: {generator: edges}} dict, as in coverage.json"""
+        keys = []
+        maps = []
+        for model, generators in cov.items():
+            for generator, edges in generators.items():
+                keys.append((model, generator))
+                maps.append(CoverageMap.from_edges(edges, size, with_hits))
+        bits = stack(maps) if maps else np.zeros((0, _nbytes(size or map_size())), dtype=np.uint8)
+        return cls(keys, bits, [m.hits for m in maps] if with_hits else None)
+
+    @classmethod
+    def from_json(cls, path: str, **kwargs) -> 'CoverageTable':
+        with open(path) as f:
+            return cls.from_dict(json.load(f), **kwargs)
+
+    def save(self, path: str):
+        write_store(path, self)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __getitem__(self, i: int) -> CoverageMap:
+        return CoverageMap(self.bits[i], None if self.hits is None else self.hits[i])
+
+    def maps(self, model: Optional[str] = None) -> Dict[str, Dict[str, CoverageMap]]:
+        """{model: {generator: CoverageMap}}, the shape of coverage.json;
+        only the given model's if one is given"""
+        res: Dict[str, Dict[str, CoverageMap]] = {}
+        for i, (m, generator) in enumerate(self.keys):
+            if model is None or m == model:
+                res.setdefault(m, {})[generator] = self[i]
+        return res
+
+    def to_dict(self) -> Dict[str, Dict[str, List[str]]]:
+        """{model: {generator: edges}} as coverage.json has it. Edges are
+        "edge:hits" strings as getcov writes them if hit counts were kept,
+        else bare edge ids."""
+        res: Dict[str, Dict[str, List[str]]] = {}
+        for i, (model, generator) in enumerate(self.keys):
+            m = self[i]
+            edges = m.edges()
+            if m.hits is not None:
+                res.setdefault(model, {})[generator] = [f'{e:06d}:{h}' for e, h in zip(edges, m.hits)]
+            else:
+                res.setdefault(model, {})[generator] = [str(e) for e in edges]
+        return res
+
+    def counts(self) -> np.ndarray:
+        """Edges covered by each generator"""
+        return popcount_rows(self.bits)
+
+    def union(self) -> CoverageMap:
+        """Edges covered by any generator"""
+        if not len(self):
+            return CoverageMap(np.zeros(self.bits.shape[-1], dtype=np.uint8))
+        return CoverageMap(np.bitwise_or.reduce(self.bits, axis=0))
+
+# Coverage store (coverage.bin): a header indexing one row per generator,
+# then the rows, each 8-byte aligned. A row is the packed bitmap, or the
+# sorted uint32 edge ids when that is smaller, followed by the hit counts of
+# the row's edges if they were kept, as the smallest unsigned type that
+# holds every count in the store. The header has each row's
+# edge count, and the union of all rows is stored as one more row, so
+# counting edges reads no rows and cumulative coverage reads one per file.
+#
+#   STORE_MAGIC, uint32 header length, header JSON, padding, rows
+#
+# The file is memory-mapped and rows are only decoded when accessed.
+
+STORE_MAGIC = b'ELMCOV\x01\x00'
+
+def _align(n: int) -> int:
+    return (n + 7) // 8 * 8
+
+def _hits_dtype(maps: List[CoverageMap]) -> Optional[np.dtype]:
+    """Smallest unsigned type that holds every hit count; None without them"""
+    hits = [m.hits for m in maps if m.hits is not None]
+    if not hits:
+        return None
+    top = max([int(h.max()) for h in hits if len(h)], default=0)
+    for dtype in (np.uint8, np.uint16):
+        if top <= np.iinfo(dtype).max:
+            return np.dtype(dtype).newbyteorder('<')
+    return np.dtype('<u4')
+
+def _encode_row(m: CoverageMap, nbytes: int, hits_dtype: Optional[np.dtype] = None) -> Tuple[str, bytes, int]:
+    """(encoding, data, edge count) of a map padded to nbytes; ids rows are
+    used when 4 bytes per edge is less than the bitmap"""
+    bits = np.zeros(nbytes, dtype=np.uint8)
+    bits[:len(m.bits)] = m.bits
+    edges = np.flatnonzero(np.unpackbits(bits))
+    if len(edges) * 4 < nbytes:
+        encoding, data = 'ids', edges.astype(np.uint32).tobytes()
+    else:
+        encoding, data = 'bits', bits.tobytes()
+    if hits_dtype is not None:
+        hits = m.hits if m.hits is not None else np.zeros(len(edges), dtype=np.uint32)
+        data = data + hits.astype(hits_dtype).tobytes()
+    return encoding, data, len(edges)
+
+def write_store(path: str, table):
+    """Write a CoverageTable (or anything with keys and indexable maps) as a
+    coverage store"""
+    maps = [table[i] for i in range(len(table))]
+    nbytes = _align(max([len(m.bits) for m in maps], default=_nbytes(map_size())))
+    hits_dtype = _hits_dtype(maps)
+    union = np.zeros(nbytes, dtype=np.uint8)
+    entries = []
+    rows = []
+    offset = 0
+    for (model, generator), m in zip(table.keys, maps):
+        encoding, data, count = _encode_row(m, nbytes, hits_dtype)
+        union[:len(m.bits)] |= m.bits
+        entries.append([model, generator, encoding, offset, count])
+        rows.append(data + b'\0' * (_align(len(data)) - len(data)))
+        offset += _align(len(data))
+    encoding, data, count = _encode_row(CoverageMap(union), nbytes)
+    rows.append(data)
+    header = json.dumps({
+        'map_bytes': nbytes,
+        'hits': None if hits_dtype is None else hits_dtype.str,
+        'entries': entries,
+        'union': [encoding, offset, count],
+    }).encode()
+    start = _align(len(STORE_MAGIC) + 4 + len(header))
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(STORE_MAGIC + struct.pack('<I', len(header)) + header)
+        f.write(b'\0' * (start - f.tell()))
+        for row in rows:
+            f.write(row)
+    os.replace(tmp, path)
+
+def is_store(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(STORE_MAGIC)) == STORE_MAGIC
+
+class CoverageStore:
+    """Memory-mapped coverage store, read like a CoverageTable"""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+                raise ValueError(f'{path} is not a coverage store')
+            (length,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(length))
+            self.data_start = _align(len(STORE_MAGIC) + 4 + length)
+            size = os.fstat(f.fileno()).st_size
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.map_bytes = header['map_bytes']
+        self.hits_dtype = None if header['hits'] is None else np.dtype(header['hits'])
+        self.entries = header['entries']
+        self.keys = [(e[0], e[1]) for e in self.entries]
+        self._union = header['union']
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _row(self, offset: int, count: int, dtype) -> np.ndarray:
+        return np.frombuffer(self.mm, dtype=dtype, count=count, offset=self.data_start + offset)
+
+    def __getitem__(self, i: int) -> CoverageMap:
+        _, _, encoding, offset, count = self.entries[i]
+        return self._decode(encoding, offset, count, self.hits_dtype)
+
+    def _decode(self, encoding: str, offset: int, count: int,
+                hits_dtype: Optional[np.dtype] = None) -> CoverageMap:
+        if encoding == 'ids':
+            edges = self._row(offset, count, np.uint32)
+            unpacked = np.zeros(self.map_bytes * 8, dtype=np.uint8)
+            unpacked[edges] = 1
+            bits = np.packbits(unpacked)
+            offset += 4 * count
+        else:
+            bits = self._row(offset, self.map_bytes, np.uint8).copy()
+            offset += self.map_bytes
+        hits = None
+        if hits_dtype is not None:
+            hits = self._row(offset, count, hits_dtype)
+        m = CoverageMap(bits, hits)
+        m._count = count
+        return m
+
+    maps = CoverageTable.maps
+    to_dict = CoverageTable.to_dict
+
+    def counts(self) -> np.ndarray:
+        return np.array([e[4] for e in self.entries], dtype=np.int64)
+
+    def union(self) -> CoverageMap:
+        return self._decode(*self._union)
+
+def bitmap_path(covfile: str) -> str:
+    return os.path.splitext(covfile)[0] + '.bin'
+
+def load_table(path: str):
+    """Coverage of a store or a coverage .json file; for a .json file, the
+    store written next to it is read instead if there is one"""
+    if not is_store(path):
+        store = bitmap_path(path)
+        if os.path.exists(store) and os.path.getmtime(store) >= os.path.getmtime(path):
+            return CoverageStore(store)
+        return CoverageTable.from_json(path)
+    return CoverageStore(path)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert coverage between coverage.json and coverage stores')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help='Write a store next to each coverage.json')
+    import_parser.add_argument('covfiles', nargs='+', type=str)
+    import_parser.add_argument('--no-hits', action='store_true',
+                               help="Don't keep hit counts; the store then exports bare edge ids")
+    export_parser = subparsers.add_parser('export', help='Write a store back out as coverage.json')
+    export_parser.add_argument('store', type=str)
+    export_parser.add_argument('-o', '--output', type=str, default=None,
+                               help='Output file; stdout if not given')
+    args = parser.parse_args()
+    if args.command == 'import':
+        for covfile in args.covfiles:
+            table = CoverageTable.from_json(covfile, with_hits=not args.no_hits)
+            table.save(bitmap_path(covfile))
+            print(f'{covfile}: {len(table)} generators, {len(table.union())} edges', file=sys.stderr)
+    else:
+        cov = CoverageStore(args.store).to_dict()
+        if args.output is None:
+            json.dump(cov, sys.stdout)
+        else:
+            with open(args.output, 'w') as f:
+                json.dump(cov, f)
@@ -37,10 +37,10 @@ else
     # Hopefully eventually we will also have MAP-Elites
     if [ "$selection_strategy" == "elites" ]; then
         echo "$selection_strategy: Selecting best seeds from all generations"
-        cov_files=("$ELMFUZZ_RUNDIR"/*/logs/coverage.json)
+        cov_files=("$ELMFUZZ_RUNDIR"/*/logs/coverage.bin)
     elif [ "$selection_strategy" == "best_of_generation" ]; then
         echo "$selection_strategy: Selecting best seeds from previous generation"
-        cov_files=("$ELMFUZZ_RUNDIR/${prev_gen}/logs/coverage.json")
+        cov_files=("$ELMFUZZ_RUNDIR/${prev_gen}/logs/coverage.bin")
     elif [ "$selection_strategy" == "lattice" ]; then
         echo "$selection_strategy: Selecting seeds from the lattice"
     else
@@ -48,7 +48,7 @@ else
         exit 1
     fi
     if [ "$selection_strategy" == "lattice" ]; then
-        cov_file="$ELMFUZZ_RUNDIR"/${prev_gen}/logs/coverage.json
+        cov_file="$ELMFUZZ_RUNDIR"/${prev_gen}/logs/coverage.bin
         input_elite_file="$ELMFUZZ_RUNDIR"/${prev_gen}/logs/elites.json
         output_elite_file="$ELMFUZZ_RUNDIR"/${next_gen}/logs/elites.json
         # baseline="$ELMFUZZ_RUNDIR"/baseedges
@@ -90,43 +90,72 @@ else
     VARIANT_ARGS=""
 fi
 echo "Generating next generation: ${NUM_VARIANTS} variants for each seed with each model"
-for model_name in $MODELS ; do
-    MODEL=$(basename "$model_name")
-    GVLOG="${LOGDIR}/meta"
-    GOLOG="${LOGDIR}/outputgen_${MODEL}.jsonl"
-    GVOUT=$(./elmconfig.py get run.genvariant_dir -s MODEL=${MODEL} -s GEN=${next_gen})
-    GOOUT=$(./elmconfig.py get run.genoutput_dir -s MODEL=${MODEL} -s GEN=${next_gen})
-    echo "====================== $model_name ======================"
-    # TODO: have genvariants_parallel.py do all the models at once
-    # Will have to add in model-specific args to the config and merge
-    # in the starcoder_diff script
-    python genvariants_parallel.py $VARIANT_ARGS \
-        -M "${model_name}" -O "$GVOUT" -L "$GVLOG" \
-        "$ELMFUZZ_RUNDIR"/${next_gen}/seeds/*.py | \
-        python genoutputs.py -L "${GOLOG}" -O "${GOOUT}" -g "${next_gen}"
-    rm "$GOLOG"
+# All models run concurrently in one invocation; genvariants_parallel and
+# genoutputs fill in the {MODEL} placeholder themselves.
+GVLOG="${LOGDIR}/meta"
+GOLOG="${LOGDIR}/outputgen.jsonl"
+GVOUT=$(./elmconfig.py get run.genvariant_dir -s MODEL='{MODEL}' -s GEN=${next_gen})
+GOOUT=$(./elmconfig.py get run.genoutput_dir -s MODEL='{MODEL}' -s GEN=${next_gen})
+# In store-nothing mode the outputs only live in a RAM-backed scratch directory
+# until their coverage is measured; the manifest records enough to regenerate them.
+GO_ARGS=""
+# Coverage is kept in a compact store (see covmap.py) rather than as
+# coverage.json; `python covmap.py export` turns it back into the same JSON
+COV_ARGS="--bitmap ${LOGDIR}/coverage.bin"
+if [ "$(./elmconfig.py get run.store_nothing)" == "True" ]; then
+    GOOUT=$(./elmconfig.py get run.scratch_dir -s MODEL='{MODEL}' -s GEN=${next_gen})
+    MANIFEST="${LOGDIR}/outputs.manifest.jsonl"
+    GO_ARGS="$GO_ARGS --manifest ${MANIFEST}"
+    COV_ARGS="$COV_ARGS --manifest ${MANIFEST}"
+fi
+# Empty outputs and copies of an earlier output can't add coverage
+if [ "$(./elmconfig.py get run.screen_outputs)" == "True" ]; then
+    GO_ARGS="$GO_ARGS --screen ${LOGDIR}/screen.json"
+fi
+# Every variant first runs a probe batch; the rest of the generation's
+# iterations go to the variants with the most unique outputs per second
+ADAPTIVE_PROBE=$(awk -v n="$(./elmconfig.py get cli.genoutputs.driver.num_iterations)" \
+    -v f="$(./elmconfig.py get run.adaptive_probe_fraction)" 'BEGIN { print int(n * f) }')
+if [ "$ADAPTIVE_PROBE" -gt 0 ]; then
+    GO_ARGS="$GO_ARGS --adaptive-probe ${ADAPTIVE_PROBE}"
+fi
+# One coverage service serves every generation; the directory holding all the
+# generations' outputs is bind-mounted into it
+if [ "$(./elmconfig.py get run.coverage_service)" == "True" ]; then
+    COV_ARGS="$COV_ARGS --service ${ELMFUZZ_RUNDIR}/covservice --service-root $(realpath -m "$GOOUT"/../../..)"
+fi
+# The seed for mutators and cut points is kept in the log dir, so re-running a
+# generation sends the same prompts and is answered from the completion cache
+python genvariants_parallel.py $VARIANT_ARGS \
+    --all-models -O "$GVOUT" -L "$GVLOG" --seed-file "${LOGDIR}/variant_seed" \
+    "$ELMFUZZ_RUNDIR"/${next_gen}/seeds/*.py | \
+    python genoutputs.py -L "${GOLOG}" -O "${GOOUT}" -g "${next_gen}" $GO_ARGS
+rm "$GOLOG"
 
-    # python shrink_variants_in_dir.py --source-dir "${GVOUT}"
-done
+# python shrink_variants_in_dir.py --source-dir "${GVOUT}"
 
 # Collect the coverage of the generators
 echo "Collecting coverage of the generators"
 all_models_genout_dir=$(realpath -m "$GOOUT"/..)
 
 if [ $TYPE == "fuzzbench" ] || [ $TYPE == "oss-fuzz" ] || [ $TYPE == "docker" ]; then
-    python getcov_fuzzbench.py --image elmfuzz/"$PROJECT_NAME" --input "$all_models_genout_dir" --covfile "${LOGDIR}/coverage.json"
+    python getcov_fuzzbench.py --image elmfuzz/"$PROJECT_NAME" --input "$all_models_genout_dir" --covfile "${LOGDIR}/coverage.json" $COV_ARGS \
+        --tmp-prefix "$(dirname "$all_models_genout_dir")/fuzzdata-"
+    # The container writes JSON; the store holds the same edges and hit counts
+    rm "${LOGDIR}/coverage.json"
 else
-    python getcov.py -O "${LOGDIR}/coverage.json" "$all_models_genout_dir"
+    # Inputs already run in earlier generations are looked up in the coverage cache
+    python getcov.py $COV_ARGS --cache "$ELMFUZZ_RUNDIR"/covcache "$all_models_genout_dir"
 fi
 
 
 for model_name in $MODELS ; do
-    GOOUT=$(./elmconfig.py get run.genoutput_dir -s MODEL=${MODEL} -s GEN=${next_gen})
-    rm -rf "$GOOUT"
+    MODEL=$(basename "$model_name")
+    rm -rf "${GOOUT//\{MODEL\}/$MODEL}"
 done
 
 # Plot coverage
-python analyze_cov.py -m $num_gens -p "$ELMFUZZ_RUNDIR"/*/logs/coverage.json
+python analyze_cov.py -m $num_gens -p "$ELMFUZZ_RUNDIR"/*/logs/coverage.bin
 
 # Create a stamp file to indicate that this generation is finished
 touch "$ELMFUZZ_RUNDIR"/stamps/${next_gen}.stamp
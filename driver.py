@@ -2,6 +2,8 @@ from collections import namedtuple
 import io
 import json
 import os
+import pickle
+import selectors
 import shutil
 import sys
 import argparse
@@ -17,6 +19,10 @@ from concurrent.futures import ProcessPoolExecutor, as_completed
 import logging
 
 from drive_log import set_loglevel
+from rngstream import derive_seed, new_seed, open_stream
+from resultlog import ResultLogWriter
+from runstats import RunStats, StatusWriter
+from seedindex import read_seed_list
 logger = logging.getLogger('root')
 
 class ExceptionInfo(NamedTuple):
@@ -54,6 +60,7 @@ class ResultInfo(NamedTuple):
     memory_used: int
     stdout: str
     stderr: str
+    cpu_time: Union[float,None] = None
 
 class Result(NamedTuple):
     # Filled in by the callee
@@ -65,6 +72,8 @@ class Result(NamedTuple):
     function_name: Union[str,None] = None
     output_file: Union[str,None] = None
     args: Union[argparse.Namespace,None] = None
+    # Seed of the RNG stream the generator read from, if not /dev/urandom
+    rng_seed: Union[int,None] = None
 
     def _convert(self, item):
         """
@@ -93,24 +102,38 @@ class Result(NamedTuple):
         )
 
 
-# Context manager for timing out a function
+# Context manager for timing out a function. Both limits are in (possibly
+# fractional) seconds: timeout is wall-clock time, cpu_timeout is CPU time
+# (user + system) used by the process while inside the context.
 class TimedExecution():
-    def __init__(self, timeout):
+    def __init__(self, timeout, cpu_timeout=None):
         self.timeout = timeout
+        self.cpu_timeout = cpu_timeout
         self.timed_out = False
         self.start_time = None
+        self.start_cpu = None
+        self.cpu_time = None
         self.old_handler = None
+        self.old_prof_handler = None
 
     def __enter__(self):
         self.start_time = time.time()
+        self.start_cpu = time.process_time()
         self.old_handler = signal.signal(signal.SIGALRM, self._handle_timeout)
-        signal.alarm(self.timeout)
+        signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        if self.cpu_timeout:
+            self.old_prof_handler = signal.signal(signal.SIGPROF, self._handle_cpu_timeout)
+            signal.setitimer(signal.ITIMER_PROF, self.cpu_timeout)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        signal.alarm(0)
+        signal.setitimer(signal.ITIMER_REAL, 0)
         signal.signal(signal.SIGALRM, self.old_handler)
+        if self.cpu_timeout:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self.old_prof_handler)
         self.time_taken = time.time() - self.start_time
+        self.cpu_time = time.process_time() - self.start_cpu
         self.timed_out = False
         return self
 
@@ -119,6 +142,11 @@ class TimedExecution():
         self.timed_out = True
         raise TimeoutError(f"Timed out after {self.timeout} seconds")
 
+    def _handle_cpu_timeout(self, signum, frame):
+        self.time_taken = time.time() - self.start_time
+        self.timed_out = True
+        raise TimeoutError(f"Used more than {self.cpu_timeout} seconds of CPU time")
+
 # Context manager to run in a temporary directory
 class TemporaryDirectoryContext():
     def __init__(self, *args, **kwargs):
@@ -154,10 +182,10 @@ class MemoryLimit():
 
 # Context manager that combines the above
 class Sandbox():
-    def __init__(self, timeout, memory_limit):
-        self.timeout = TimedExecution(timeout)
+    def __init__(self, timeout, memory_limit, use_tempdir=True, cpu_timeout=None):
+        self.timeout = TimedExecution(timeout, cpu_timeout)
         self.memory_limit = MemoryLimit(memory_limit)
-        self.tempdir = TemporaryDirectoryContext()
+        self.tempdir = TemporaryDirectoryContext() if use_tempdir else nullcontext()
         self.stdout = io.StringIO()
         self.stderr = io.StringIO()
         self.capture_stdout = redirect_stdout(self.stdout)
@@ -184,6 +212,7 @@ class Sandbox():
             memory_used = self.memory_limit.mem_usage,
             stdout = self.stdout.getvalue(),
             stderr = self.stderr.getvalue(),
+            cpu_time = self.timeout.cpu_time,
         )
 
 class TooBigException(Exception):
@@ -204,8 +233,11 @@ def generate_one(
         output_file: str,
         function: Callable[[BinaryIO, BinaryIO, BinaryIO],None],
         args: argparse.Namespace,
+        rng_seed: Union[int,None] = None,
+        use_tempdir: bool = True,
     ) -> Result:
-    # Function takes a file-like BytesIO object (/dev/urandom)
+    # Function takes a file-like BytesIO object (an RNG stream seeded
+    # with rng_seed, or /dev/urandom if there is no seed)
     # and a writable BytesIO file object (output file)
 
     # Ensure the directory exists
@@ -215,10 +247,10 @@ def generate_one(
 
     global ELMFUZZ_RUNDIR
 
-    with open('/dev/urandom', 'rb') as rng, \
+    with open('/dev/urandom', 'rb') if rng_seed is None else open_stream(rng_seed) as rng, \
          SizeLimitedBinaryFile(open(output_file, 'wb'), max_size=args.size_limit) as output:
         try:
-            with Sandbox(args.timeout, args.max_mem) as s:
+            with Sandbox(args.timeout, args.max_mem, use_tempdir, args.cpu_timeout) as s:
                 function(rng, output)
             r = Result(
                 result_type = GenResult.Success,
@@ -253,7 +285,7 @@ def generate_one(
             )
     if r.result_type is not GenResult.Success:
         os.remove(output_file)
-    return r
+    return r._replace(rng_seed=rng_seed)
 
 def get_function(module_path, function_name, args):
     try:
@@ -293,6 +325,10 @@ def make_parser(description):
     parser.add_argument(
         '-n', '--num', type=int, default=1,
         help='Number of times to run the function')
+    parser.add_argument(
+        '--start-index', type=int, default=0,
+        help='Number the outputs (and derive their seeds) starting from this index, '
+             'so that a later run can add outputs next to an earlier one')
     parser.add_argument(
         '-S', '--size-limit', type=int, default=50*1024,
         help='Maximum size of the output file (in bytes)')
@@ -303,8 +339,11 @@ def make_parser(description):
         '-s', '--output-suffix', type=str, default='.dat',
         help='Output suffix')
     parser.add_argument(
-        '-t', '--timeout', type=int, default=10,
+        '-t', '--timeout', type=float, default=10,
         help='Timeout for the run (in seconds)')
+    parser.add_argument(
+        '-C', '--cpu-timeout', type=float, default=None,
+        help='Limit on the CPU time (user + system) of each run (in seconds); None means no limit')
     parser.add_argument(
         '-M', '--max-mem', type=int, default=1024*1024*1024,
         help='Maximum memory usage (in bytes)')
@@ -314,9 +353,30 @@ def make_parser(description):
     # parser.add_argument(
     #     '--real-feedback', action='store_true', default=False,
     # )
+    parser.add_argument(
+        '--fork-server', action='store_true',
+        help='Fork a child per output from a parent that imported the module once, '
+             'instead of running outputs in a process pool')
+    parser.add_argument(
+        '-R', '--seed', type=int, default=None,
+        help='Seed for the RNG streams given to the generator; each output gets its own seed '
+             'derived from this one, which is recorded as rng_seed in its result. None picks a random seed')
+    parser.add_argument(
+        '--log-format', choices=['jsonl', 'columnar'], default='jsonl',
+        help='Format of the log file: one JSON result per line, or the compact '
+             'columnar format of resultlog.py')
+    parser.add_argument(
+        '--status-file', type=str, default=None,
+        help='Keep counts of the result types so far in this JSON file while running')
+    parser.add_argument(
+        '--status-interval', type=float, default=5.0,
+        help='Minimum time between updates of the status file (in seconds)')
     parser.add_argument('-q', '--quiet', action='store_true')
     parser.add_argument('-v', '--verbose', action='store_true')
-    parser.add_argument('-i', '--inputs', type=str)
+    parser.add_argument('-i', '--inputs', type=str,
+        help="Seed inputs, separated by ';'")
+    parser.add_argument('-I', '--inputs-file', type=str, default=None,
+        help='File listing the seed inputs, one per line (or a seed index); used instead of -i')
     return parser
 
 def fill_result(result, module_path, function_name, output_file, args):
@@ -328,39 +388,197 @@ def fill_result(result, module_path, function_name, output_file, args):
         function_name = function_name,
         output_file = output_file,
         args = args,
+        rng_seed = result.rng_seed,
     )
 
-def main():
-    parser = make_parser('Run an input generator function in a loop')
-    args = parser.parse_args()
-    set_loglevel(logger, args)
+def _fork_one(output_file, function, args, rng_seed, scratch_dir):
+    """Fork a child that runs generate_one and sends back the Result through
+    a pipe. Returns the child's pid and the read end of the pipe."""
+    # The child runs in scratch_dir, so a relative output path would land there
+    output_file = os.path.abspath(output_file)
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            os.close(r)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            os.chdir(scratch_dir)
+            result = generate_one(output_file, function, args, rng_seed=rng_seed, use_tempdir=False)
+            data = pickle.dumps(result)
+            with os.fdopen(w, 'wb') as pipe:
+                pipe.write(data)
+        except BaseException:
+            code = 1
+        finally:
+            os._exit(code)
+    os.close(w)
+    return pid, r
+
+def _child_failed(output_file, message, args, rng_seed) -> Result:
+    try:
+        os.remove(output_file)
+    except FileNotFoundError:
+        pass
+    return Result(
+        result_type = GenResult.Error,
+        error = ExceptionInfo.from_exception(ChildProcessError(message), args.module_path),
+        data = None,
+        rng_seed = rng_seed,
+    )
 
-    seed_inputs: list[str] = list(map(lambda x: x.strip(), args.inputs.split(';')))
+class _Child(NamedTuple):
+    pid: int
+    output_file: str
+    rng_seed: Union[int,None]
+    scratch_dir: str
+    deadline: float
+    chunks: List[bytes]
+
+def fork_server(function, outputs: List[Tuple[str,Union[int,None]]], args, jobs=None):
+    """Run function once per (output file, RNG seed) pair, each in a child
+    forked from this process, so the module is imported once and nothing
+    needs to be pickled. Yields (output_file, Result) as the children finish.
+
+    Each child enforces its own timeout and memory limit like generate_one
+    always has; as a watchdog, the parent kills children that are still
+    running a second after their timeout, e.g. because they are stuck in C
+    code where SIGALRM can't interrupt them."""
+    jobs = jobs or os.cpu_count() or 1
+    pending = list(reversed(outputs))
+    running = {}
+    sel = selectors.DefaultSelector()
+
+    def reap(fd):
+        child = running.pop(fd)
+        sel.unregister(fd)
+        os.close(fd)
+        _, status = os.waitpid(child.pid, 0)
+        shutil.rmtree(child.scratch_dir, ignore_errors=True)
+        return child, status
+
+    with TemporaryDirectory() as scratch_root:
+        n = 0
+        while pending or running:
+            while pending and len(running) < jobs:
+                output_file, rng_seed = pending.pop()
+                scratch_dir = os.path.join(scratch_root, str(n))
+                os.mkdir(scratch_dir)
+                n += 1
+                pid, fd = _fork_one(output_file, function, args, rng_seed, scratch_dir)
+                running[fd] = _Child(pid, output_file, rng_seed, scratch_dir, time.time() + args.timeout + 1, [])
+                sel.register(fd, selectors.EVENT_READ)
+            wait = max(0, min(child.deadline for child in running.values()) - time.time())
+            for key, _ in sel.select(wait):
+                chunk = os.read(key.fd, 65536)
+                if chunk:
+                    running[key.fd].chunks.append(chunk)
+                    continue
+                # EOF: the child is done
+                child, status = reap(key.fd)
+                try:
+                    result = pickle.loads(b''.join(child.chunks))
+                except Exception:
+                    code = os.waitstatus_to_exitcode(status)
+                    result = _child_failed(child.output_file, f'Generator process exited with status {code}', args, child.rng_seed)
+                yield child.output_file, result
+            now = time.time()
+            for fd in [fd for fd, child in running.items() if child.deadline <= now]:
+                os.kill(running[fd].pid, signal.SIGKILL)
+                child, _ = reap(fd)
+                try:
+                    os.remove(child.output_file)
+                except FileNotFoundError:
+                    pass
+                yield child.output_file, Result(
+                    result_type = GenResult.Timeout,
+                    error = None,
+                    data = None,
+                    rng_seed = child.rng_seed,
+                )
+    sel.close()
+
+def run_generator(args, executor):
+    """Load the generator function and run it args.num times per seed input
+    in executor (or in forked children with --fork-server), writing one Result
+    per line to args.logfile (or stdout)."""
+    if args.inputs_file is not None:
+        seed_inputs: list[str] = read_seed_list(args.inputs_file)
+    else:
+        seed_inputs: list[str] = list(map(lambda x: x.strip(), args.inputs.split(';')))
+
+    status = None
+    if args.status_file is not None:
+        run_stats = RunStats(num_iterations=args.num * len(seed_inputs), total_modules=1)
+        status = StatusWriter(run_stats, args.status_file, args.status_interval)
 
     # if not args.real_feedback:
-    with open(args.logfile, 'w') if args.logfile else nullcontext(sys.stdout) as f:
+    with (ResultLogWriter(args.logfile) if args.logfile and args.log_format == 'columnar'
+          else open(args.logfile, 'w') if args.logfile else nullcontext(sys.stdout)) as f:
         module_path = os.path.abspath(args.module_path)
-        function_name = args.function
-        function_or_result = get_function(module_path, function_name, args)
-        if isinstance(function_or_result, Result):
-            result = function_or_result
-            final_result = fill_result(result, module_path, function_name, None, args)
-            print(final_result.json(), file=f)
-            return
-
-        function = function_or_result
-        with ProcessPoolExecutor() as executor:
-            futures = {}
-            for seed_input in seed_inputs:
-                for i in range(args.num):
-                    output_file = f'{args.output_prefix}_{os.path.basename(seed_input).replace(".", "-")}_{i:08}{args.output_suffix}'
-                    future = executor.submit(generate_one, output_file, function, args)
-                    futures[future] = output_file
-            for future in as_completed(futures):
-                output_file = futures[future]
-                result = future.result()
-                final_result = fill_result(result, module_path, function_name, output_file, args)
-                print(final_result.json(), file=f)
+        module_name = os.path.basename(module_path)
+        def log_result(final_result, count=1):
+            if isinstance(f, ResultLogWriter):
+                f.append(final_result._convert(final_result))
+            else:
+                # Flushed, so the results so far survive if the batch is killed
+                print(final_result.json(), file=f, flush=True)
+            if status is not None:
+                status.stats.add(module_name, final_result.result_type.value, count)
+                status.update()
+        try:
+            _run_outputs(args, seed_inputs, module_path, module_name, executor, log_result)
+        finally:
+            if status is not None:
+                status.stats.modules_done = 1
+                status.update(force=True)
+
+def _run_outputs(args, seed_inputs, module_path, module_name, executor, log_result):
+    function_name = args.function
+    function_or_result = get_function(module_path, function_name, args)
+    if isinstance(function_or_result, Result):
+        result = function_or_result
+        final_result = fill_result(result, module_path, function_name, None, args)
+        log_result(final_result, args.num * len(seed_inputs))
+        return
+
+    function = function_or_result
+    if args.fork_server:
+        outputs = [
+            (f'{args.output_prefix}_{os.path.basename(seed_input).replace(".", "-")}_{i:08}{args.output_suffix}',
+             derive_seed(args.seed, module_name, os.path.basename(seed_input), i))
+            for seed_input in seed_inputs
+            for i in range(args.start_index, args.start_index + args.num)
+        ]
+        for output_file, result in fork_server(function, outputs, args):
+            final_result = fill_result(result, module_path, function_name, output_file, args)
+            log_result(final_result)
+        return
+    futures = {}
+    for seed_input in seed_inputs:
+        for i in range(args.start_index, args.start_index + args.num):
+            output_file = f'{args.output_prefix}_{os.path.basename(seed_input).replace(".", "-")}_{i:08}{args.output_suffix}'
+            rng_seed = derive_seed(args.seed, module_name, os.path.basename(seed_input), i)
+            future = executor.submit(generate_one, output_file, function, args, rng_seed)
+            futures[future] = output_file
+    for future in as_completed(futures):
+        output_file = futures[future]
+        result = future.result()
+        final_result = fill_result(result, module_path, function_name, output_file, args)
+        log_result(final_result)
+
+def main(argv=None):
+    parser = make_parser('Run an input generator function in a loop')
+    args = parser.parse_args(argv)
+    set_loglevel(logger, args)
+    if args.seed is None:
+        args.seed = new_seed()
+
+    if args.fork_server:
+        run_generator(args, None)
+        return
+    with ProcessPoolExecutor() as executor:
+        run_generator(args, executor)
     # else:
     #     with open(args.logfile, 'w') if args.logfile else nullcontext(sys.stdout) as log_f:
     #         module_path = os.path.abspath(args.module_path)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+# Long-running coverage service.
+#
+# Instead of one `docker run` (and Python startup) per generation,
+# getcov_fuzzbench --service starts this once inside the benchmark image and
+# feeds it work through a spool directory. The spool, the directory the
+# outputs are written under and this file's directory are bind-mounted at the
+# same paths inside and outside the container, so outputs are read in place
+# rather than moved and the image doesn't need rebuilding.
+#
+# The service imports the project's elm_getcov_inside_docker.py once and runs
+# its `main` for each job, so the coverage is computed exactly as before.
+# Spool layout:
+#   service.json   how the service was started (pid, image, mounts)
+#   alive          heartbeat, touched every HEARTBEAT seconds while running
+#   <id>.job       a job: {"args": [...]} for the script's main; claimed by
+#                  renaming it to <id>.running
+#   <id>.log       the job's output, written as it runs
+#   <id>.cov       the coverage the script wrote
+#   <id>.status    {"ok": ..., "error": ..., "elapsed": ...} once it's done
+#   stop           ask the service to exit once the current job is done
+# Jobs are run one at a time in order of submission.
+#
+# The client side (start_service, run_job, stop_service) runs on the host;
+# with image=None the service is started as a plain host process, which is
+# how it can be tested without a container.
+#
+#   python3 elm_covservice.py serve --spool DIR --script elm_getcov_inside_docker.py
+#   python3 elm_covservice.py stop --spool DIR
+
+import argparse
+import contextlib
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from typing import List, Optional
+
+HEARTBEAT = 2.0
+# A heartbeat older than this means the service is gone
+STALE_AFTER = 30.0
+POLL_INTERVAL = 0.2
+
+def _write_json(path: str, obj):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+def _load_script(path: str):
+    spec = importlib.util.spec_from_file_location('elm_getcov_inside_docker', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _heartbeat(path: str, done: threading.Event):
+    while not done.is_set():
+        with open(path, 'w') as f:
+            f.write(str(os.getpid()))
+        done.wait(HEARTBEAT)
+
+def _next_job(spool: str) -> Optional[str]:
+    jobs = []
+    for entry in os.scandir(spool):
+        if entry.name.endswith('.job'):
+            jobs.append((entry.stat().st_mtime_ns, entry.name))
+    for _, name in sorted(jobs):
+        job_id = name[:-len('.job')]
+        try:
+            os.rename(os.path.join(spool, name), os.path.join(spool, f'{job_id}.running'))
+        except FileNotFoundError:
+            continue
+        return job_id
+    return None
+
+def _run_job(script, spool: str, job_id: str):
+    with open(os.path.join(spool, f'{job_id}.running')) as f:
+        job = json.load(f)
+    start = time.time()
+    error = None
+    with open(os.path.join(spool, f'{job_id}.log'), 'w', buffering=1) as log, \
+         contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            script.main.main(args=job['args'], standalone_mode=False)
+        except KeyboardInterrupt:
+            raise
+        except BaseException:
+            error = traceback.format_exc()
+            print(error)
+    _write_json(os.path.join(spool, f'{job_id}.status'), {
+        'ok': error is None,
+        'error': error,
+        'elapsed': time.time() - start,
+    })
+    os.remove(os.path.join(spool, f'{job_id}.running'))
+
+def serve(spool: str, script_path: str, idle_timeout: float):
+    """Run jobs from spool until asked to stop or idle for idle_timeout seconds"""
+    os.makedirs(spool, exist_ok=True)
+    script = _load_script(script_path)
+    alive = os.path.join(spool, 'alive')
+    stop = os.path.join(spool, 'stop')
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(alive, done), daemon=True).start()
+    print(f'Coverage service {os.getpid()} serving {spool}', file=sys.stderr, flush=True)
+    last_job = time.monotonic()
+    try:
+        while not os.path.exists(stop):
+            job_id = _next_job(spool)
+            if job_id is None:
+                if idle_timeout > 0 and time.monotonic() - last_job > idle_timeout:
+                    print(f'Coverage service idle for {idle_timeout:.0f}s; exiting', file=sys.stderr)
+                    break
+                time.sleep(POLL_INTERVAL)
+                continue
+            print(f'Running coverage job {job_id}', file=sys.stderr, flush=True)
+            _run_job(script, spool, job_id)
+            last_job = time.monotonic()
+    finally:
+        done.set()
+        for path in (alive, stop):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+def is_alive(spool: str) -> bool:
+    try:
+        return time.time() - os.path.getmtime(os.path.join(spool, 'alive')) < STALE_AFTER
+    except FileNotFoundError:
+        return False
+
+def service_info(spool: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(spool, 'service.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def container_name(spool: str) -> str:
+    return 'elmcov-' + hashlib.sha1(os.path.abspath(spool).encode()).hexdigest()[:12]
+
+def _wait_alive(spool: str, proc: Optional[subprocess.Popen], timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while not is_alive(spool):
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f'Coverage service exited with status {proc.returncode} on startup')
+        if time.monotonic() > deadline:
+            raise RuntimeError(f'Coverage service did not start within {timeout:.0f}s')
+        time.sleep(POLL_INTERVAL)
+
+def start_service(spool: str, mounts: List[str], image: Optional[str] = None,
+                  sif_root: Optional[str] = None, script: str = '/src/elm_getcov_inside_docker.py',
+                  idle_timeout: float = 7200):
+    """Start the service unless one is already running on spool with the same
+    image and mounts. The spool and mounts are bound at the same paths inside
+    the container; with image=None it runs on the host."""
+    spool = os.path.abspath(spool)
+    mounts = sorted({os.path.abspath(m) for m in mounts + [spool]}
+                    | {os.path.dirname(os.path.abspath(__file__))})
+    wanted = {'image': image, 'mounts': mounts, 'script': script}
+    info = service_info(spool)
+    if is_alive(spool):
+        if info is not None and all(info.get(k) == v for k, v in wanted.items()):
+            return
+        print('Coverage service was started with a different image or mounts; restarting it', file=sys.stderr)
+        stop_service(spool)
+    os.makedirs(spool, exist_ok=True)
+    for name in ('alive', 'stop'):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(spool, name))
+    # This file is bind-mounted along with the rest, so any image with python3 will do
+    service_path = os.path.abspath(__file__)
+    serve_cmd = ['python3', service_path, 'serve', '--spool', spool, '--script', script,
+                 '--idle-timeout', str(idle_timeout)]
+    proc = None
+    log = open(os.path.join(spool, 'service.log'), 'a')
+    if image is None:
+        proc = subprocess.Popen([sys.executable] + serve_cmd[1:], stdout=log, stderr=log,
+                                stdin=subprocess.DEVNULL, start_new_session=True)
+    elif sif_root is None:
+        name = container_name(spool)
+        subprocess.run(['docker', 'rm', '-f', name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        cmd = ['docker', 'run', '-d', '--rm', '--name', name]
+        for m in mounts:
+            cmd.extend(['-v', f'{m}:{m}'])
+        cmd.append(image)
+        cmd.extend(serve_cmd)
+        print(' '.join(cmd))
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=sys.stderr)
+    else:
+        cmd = ['apptainer', 'exec', '--cleanenv']
+        for m in mounts:
+            cmd.extend(['--bind', f'{m}:{m}:rw'])
+        cmd.append(os.path.join(sif_root, image))
+        cmd.extend(serve_cmd)
+        print(' '.join(cmd))
+        proc = subprocess.Popen(cmd, stdout=log, stderr=log, stdin=subprocess.DEVNULL,
+                                start_new_session=True)
+    log.close()
+    _write_json(os.path.join(spool, 'service.json'), {
+        **wanted,
+        'pid': proc.pid if proc is not None else None,
+        'started': time.time(),
+    })
+    _wait_alive(spool, proc)
+
+def run_job(spool: str, args: List[str], output: str, out=sys.stdout) -> float:
+    """Submit a job running the script's main with args (its --output is
+    added), stream its log to out while it runs and move the coverage it
+    writes to output. Returns the time the job took."""
+    job_id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+    cov = os.path.join(spool, f'{job_id}.cov')
+    _write_json(os.path.join(spool, f'{job_id}.tmp'), {'args': args + ['--output', cov]})
+    os.rename(os.path.join(spool, f'{job_id}.tmp'), os.path.join(spool, f'{job_id}.job'))
+    log_path = os.path.join(spool, f'{job_id}.log')
+    status_path = os.path.join(spool, f'{job_id}.status')
+    log = None
+    try:
+        while True:
+            finished = os.path.exists(status_path)
+            if log is None and os.path.exists(log_path):
+                log = open(log_path)
+            if log is not None:
+                chunk = log.read()
+                if chunk:
+                    out.write(chunk)
+                    out.flush()
+            if finished:
+                break
+            if not is_alive(spool):
+                raise RuntimeError(f'Coverage service on {spool} died while running job {job_id}')
+            time.sleep(POLL_INTERVAL)
+    finally:
+        if log is not None:
+            log.close()
+    with open(status_path) as f:
+        status = json.load(f)
+    for path in (log_path, status_path):
+        os.remove(path)
+    if not status['ok']:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(cov)
+        raise RuntimeError(f'Coverage job {job_id} failed: {status["error"].strip().splitlines()[-1]}')
+    shutil.move(cov, output)
+    return status['elapsed']
+
+def stop_service(spool: str, timeout: float = 60.0):
+    """Ask the service on spool to exit and wait for it to go"""
+    if not is_alive(spool):
+        return
+    open(os.path.join(spool, 'stop'), 'w').close()
+    deadline = time.monotonic() + timeout
+    while is_alive(spool) and os.path.exists(os.path.join(spool, 'alive')):
+        if time.monotonic() > deadline:
+            print(f'Coverage service on {spool} did not stop within {timeout:.0f}s', file=sys.stderr)
+            return
+        time.sleep(POLL_INTERVAL)
+    print(f'Stopped coverage service on {spool}', file=sys.stderr)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Long-running coverage service')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help='Run the service')
+    serve_parser.add_argument('--spool', type=str, required=True)
+    serve_parser.add_argument('--script', type=str, default='/src/elm_getcov_inside_docker.py',
+                              help='Coverage script whose main is run for each job')
+    serve_parser.add_argument('--idle-timeout', type=float, default=7200,
+                              help='Exit after this many seconds without a job (0: never)')
+    stop_parser = subparsers.add_parser('stop', help='Stop a running service')
+    stop_parser.add_argument('--spool', type=str, required=True)
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve(args.spool, args.script, args.idle_timeout)
+    else:
+        stop_service(args.spool)
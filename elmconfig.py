@@ -327,6 +327,23 @@ class ELMFuzzConfig:
         group.add_argument("--run.genoutput_dir", type=str,
                             default='{ELMFUZZ_RUNDIR}/{GEN}/outputs/{MODEL}',
                             help="Directory (template) to store generated outputs")
+        group.add_argument("--run.store_nothing", action='store_true',
+                            help="Write generated outputs to run.scratch_dir and delete them once their "
+                            "coverage is measured, keeping only a manifest to regenerate them from")
+        group.add_argument("--run.scratch_dir", type=str,
+                            default='/dev/shm/elmfuzz/{ELMFUZZ_RUN_NAME}/{GEN}/outputs/{MODEL}',
+                            help="Directory (template) to store generated outputs with run.store_nothing; "
+                            "should be RAM-backed")
+        group.add_argument("--run.screen_outputs", action='store_true',
+                            help="Delete empty and duplicate outputs before measuring coverage, crediting "
+                            "each duplicate to the first variant to produce it (genoutputs --screen)")
+        group.add_argument("--run.adaptive_probe_fraction", type=float, default=0.1,
+                            help="Fraction of each variant's iterations to run as a probe before the rest "
+                            "of the generation's budget is shared out by unique outputs per second "
+                            "(genoutputs --adaptive-probe); 0 disables")
+        group.add_argument("--run.coverage_service", action='store_true',
+                            help="Measure coverage with one long-running service in the benchmark image "
+                            "for the whole run instead of one container per generation")
         group.add_argument("--run.logdir", type=str,
                             default='{ELMFUZZ_RUNDIR}/{GEN}/logs',
                             help="Directory (template) to store logs")
@@ -49,8 +49,9 @@ logger = logging.getLogger(__file__)
 
 g_size_limit = 1024
 
-def wrapper(module_names: list[str], function: str, outdir: str, num: int, callback: str | None) -> int:
-    rng = RNG(random.Random())
+def wrapper(module_names: list[str], function: str, outdir: str, num: int, callback: str | None, seed: str) -> int:
+    rand = random.Random(seed)
+    rng = RNG(rand)
     modules = []
     
     for module in module_names:
@@ -62,7 +63,7 @@ def wrapper(module_names: list[str], function: str, outdir: str, num: int, callb
     
     error_count = 0
     for i in range(num):
-        f_module = random.choice(modules)
+        f_module = rand.choice(modules)
         fuzzer = getattr(f_module, function)
         with open(os.path.join(outdir, f'{i}.seed'), 'wb') as f:
             if cb_module is not None:
@@ -115,9 +116,10 @@ def start_process_to_terminate_when_parent_process_dies(ppid):
 @clk.option('--stat-file', '-sf', type=clk.File('w'), required=False, default='-')
 @clk.option('--batch-timeout', '-q', type=int, required=False, default=-1)
 @clk.option('--check-point', '-c', type=int, required=False, default=-1)
+@clk.option('--seed', type=int, required=False, default=None, help='Seed for the generators\' RNG; None picks one at random')
 def main(function, working_dir, num, time_limit, force, batch_size, para_num, 
          afl_dir, callback, debug_level, size_limit, race_mode, stat_file, 
-         batch_timeout, check_point):
+         batch_timeout, check_point, seed):
     
     target_name = os.path.basename(working_dir).split('_')[0]
     out_dir = os.path.join(working_dir, 'out')
@@ -132,6 +134,9 @@ def main(function, working_dir, num, time_limit, force, batch_size, para_num,
             logging.basicConfig(level=logging.DEBUG)
         case _:
             raise ValueError('Invalid debug level')
+    if seed is None:
+        seed = random.randrange(2 ** 63)
+    logger.info(f'RNG seed: {seed}')
 
     global g_size_limit
     g_size_limit = size_limit
@@ -256,7 +261,7 @@ def main(function, working_dir, num, time_limit, force, batch_size, para_num,
             
             logger.info(f'Batch {batch} fuzzing {current} seeds')
             start_time = datetime.now()
-            future = executor.submit(wrapper, fuzzer_module_names, function, batch_dir, current, callback)
+            future = executor.submit(wrapper, fuzzer_module_names, function, batch_dir, current, callback, f'{seed}:{batch}')
             try:
                 batch_timeout = current * 0.5 if batch_timeout < 0 else batch_timeout
                 error_count = future.result(min(time_limit - time_sum, batch_timeout) if time_limit > 0 else batch_timeout)
@@ -87,13 +87,13 @@ def start_process_to_terminate_when_parent_process_dies(ppid):
     thread.start()
 
 # prepend, actually
-def append_metadata(callback: str, batch_dir: str):
+def append_metadata(callback: str, batch_dir: str, rng_seed: str):
     cb_module = importlib.import_module(callback)
     preprocess = getattr(cb_module, 'preprocess')
     if preprocess is None:
         return
-    seeds = os.listdir(batch_dir)
-    with RNG(random.Random()) as rng:
+    seeds = sorted(os.listdir(batch_dir))
+    with RNG(random.Random(rng_seed)) as rng:
         for seed in seeds:
             with open(os.path.join(batch_dir, seed), 'rb') as f:
                 bytes = f.read()
@@ -105,14 +105,15 @@ def append_metadata_conc(callback: str | None,
                     batches_start: int, 
                     batches_num: int, 
                     batches_root: str, 
-                    paranum: int):
+                    paranum: int,
+                    seed: int):
     if callback is None:
         return
     with concurrent.futures.ProcessPoolExecutor(max_workers=paranum) as executor:
         futures = []
         for i in range(batches_num):
             batch_dir = os.path.join(batches_root, f'{i+batches_start}')
-            future = executor.submit(append_metadata, callback, batch_dir)
+            future = executor.submit(append_metadata, callback, batch_dir, f'{seed}:{i+batches_start}')
             futures.append(future)
         for future in concurrent.futures.as_completed(futures):
             future.result()
@@ -132,8 +133,9 @@ def append_metadata_conc(callback: str | None,
 @clk.option('--race-mode', '-r', is_flag=True, required=False, default=False)
 @clk.option('--stat-file', '-sf', type=clk.File('w'), required=False, default='-')
 @clk.option('--check-point', '-c', type=int, required=False, default=-1)
+@clk.option('--seed', type=int, required=False, default=None, help='Seed for the generators\' RNG; None picks one at random')
 def main(generator, working_dir, num, time_limit, force, batch_size, para_num, 
-         afl_dir, callback, debug_level, race_mode, stat_file, check_point):
+         afl_dir, callback, debug_level, race_mode, stat_file, check_point, seed):
     target_name = os.path.basename(working_dir).split('_')[0]
     out_dir = os.path.join(working_dir, 'out')
     if race_mode:
@@ -146,6 +148,9 @@ def main(generator, working_dir, num, time_limit, force, batch_size, para_num,
             logging.basicConfig(level=logging.DEBUG)
         case _:
             raise ValueError('Invalid debug level')
+    if seed is None:
+        seed = random.randrange(2 ** 63)
+    logger.info(f'RNG seed: {seed}')
 
     overall_start_time = datetime.now()
     if not force and os.path.exists(os.path.join(working_dir, 'sum.cov')):
@@ -277,7 +282,7 @@ def main(generator, working_dir, num, time_limit, force, batch_size, para_num,
             if batch_acc >= para_num:
                 logger.info('Appending metadata')
                 if not race_mode:
-                    append_metadata_conc(callback, batch_record, batch_acc, td, para_num)
+                    append_metadata_conc(callback, batch_record, batch_acc, td, para_num, seed)
                 logger.info('Getting coverage')
                 if not race_mode:
                     cov_module.get_cov_conc(working_dir, td, td, para_num, batch_acc, batch_record, os.path.join(afl_dir, 'afl-showmap'))
@@ -300,7 +305,7 @@ def main(generator, working_dir, num, time_limit, force, batch_size, para_num,
         if batch_acc > 0:
             logger.info('Appending metadata')
             if not race_mode:
-                append_metadata_conc(callback, batch_record, batch_acc, td, para_num)
+                append_metadata_conc(callback, batch_record, batch_acc, td, para_num, seed)
             logger.info('Getting coverage')
             if not race_mode:
                 cov_module.get_cov_conc(working_dir, td, td, para_num, batch_acc, batch_record, os.path.join(afl_dir, 'afl-showmap'))
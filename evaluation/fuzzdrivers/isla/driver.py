@@ -59,11 +59,11 @@ def solve_single(pickled_solver: bytes) -> str:
     solver : ISLaSolver = pickle.loads(pickled_solver)
     return str(solver.solve())
 
-def wrapper(pickled_solver: bytes, outdir: str, num: int, callback: str | None) -> int:
+def wrapper(pickled_solver: bytes, outdir: str, num: int, callback: str | None, seed: str) -> int:
     if callback is not None:
         cb_module = importlib.import_module(callback)
         preprocess = cb_module.preprocess
-    with RNG(random.Random()) as rng:
+    with RNG(random.Random(seed)) as rng:
         for i in range(num):
             logger.info(f'Generating {i}.seed ({num}) in {os.path.basename(outdir)}')
             solution = solve_single(pickled_solver)
@@ -94,9 +94,10 @@ class MyTmpDir(TemporaryDirectory):
 @clk.option('--race-mode', '-r', is_flag=True, required=False, default=False)
 @clk.option('--stat-file', '-sf', type=clk.File('w'), required=False, default='-')
 @clk.option('--check-point', '-c', type=int, required=False, default=-1)
+@clk.option('--seed', type=int, required=False, default=None, help='Seed for the generators\' RNG; None picks one at random')
 def main(working_dir, num, time_limit, force, batch_size, para_num, 
          afl_dir, callback, debug_level, batch_timeout, use_semantics,
-         race_mode, stat_file, check_point):
+         race_mode, stat_file, check_point, seed):
     target_name = os.path.basename(working_dir).split('_')[0]
     out_dir = os.path.join(working_dir, 'out')
     if race_mode:
@@ -109,6 +110,9 @@ def main(working_dir, num, time_limit, force, batch_size, para_num,
             logging.basicConfig(level=logging.DEBUG)
         case _:
             raise ValueError('Invalid debug level')
+    if seed is None:
+        seed = random.randrange(2 ** 63)
+    logger.info(f'RNG seed: {seed}')
 
     overall_start_time = datetime.now()
     if not force and os.path.exists(os.path.join(working_dir, 'sum.cov')):
@@ -233,7 +237,7 @@ def main(working_dir, num, time_limit, force, batch_size, para_num,
             
             logger.info(f'Batch {batch} fuzzing {current} seeds')
             start_time = datetime.now()
-            future = executor.submit(wrapper, picked_solver, batch_dir, current, callback)
+            future = executor.submit(wrapper, picked_solver, batch_dir, current, callback, f'{seed}:{batch}')
             try:
                 batch_timeout1 = current * 0.5 if batch_timeout is None else batch_timeout
                 error_count = future.result(batch_timeout1)
@@ -48,9 +48,10 @@ logger = logging.getLogger(__file__)
 
 g_size_limit = 1024
 
-def wrapper(module_names: list[str], function: str, outdir: str, file_prefix: str, num: int) -> tuple[int, timedelta]:
+def wrapper(module_names: list[str], function: str, outdir: str, file_prefix: str, num: int, seed: int) -> tuple[int, timedelta]:
     start_time = datetime.now()
-    rng = RNG(random.Random())
+    rand = random.Random(f'{seed}:{file_prefix}')
+    rng = RNG(rand)
     modules = []
     
     for module in module_names:
@@ -61,7 +62,7 @@ def wrapper(module_names: list[str], function: str, outdir: str, file_prefix: st
     
     error_count = 0
     for i in range(num):
-        f_module = random.choice(modules)
+        f_module = rand.choice(modules)
         fuzzer = getattr(f_module, function)
         with open(os.path.join(outdir, f'{file_prefix}-{i}.seed'), 'wb') as f:
             try:
@@ -105,9 +106,13 @@ BATCH_SIZE = 1000
 @clk.option('--para-num', '-j', type=int, required=False, default=32)
 @clk.option('--output-dir', '-o', type=str, required=True)
 @clk.option('--time', '-t', type=int, required=False, default=-1)
-def main(function, output_dir, num, debug_level, size_limit, para_num, time):
+@clk.option('--seed', type=int, required=False, default=None, help='Seed for the generators\' RNG; None picks one at random')
+def main(function, output_dir, num, debug_level, size_limit, para_num, time, seed):
     assert not (num == -1 and time == -1)
     assert not (num != -1 and time != -1)
+    if seed is None:
+        seed = random.randrange(2 ** 63)
+    logger.info(f'RNG seed: {seed}')
     
     cwd = os.path.dirname(os.path.abspath(__file__))
     sys.path.insert(0, cwd)
@@ -128,11 +133,11 @@ def main(function, output_dir, num, debug_level, size_limit, para_num, time):
             futures = []
             index = {}
             for i in range(para_num - 1):
-                f = executor.submit(wrapper, fuzzer_module_names, function, output_dir, str(i), num_for_each_process)
+                f = executor.submit(wrapper, fuzzer_module_names, function, output_dir, str(i), num_for_each_process, seed)
                 f.add_done_callback(lambda _: progress.update(num_for_each_process))
                 futures.append(f)
                 index[f] = i
-            f = executor.submit(wrapper, fuzzer_module_names, function, output_dir, str(para_num - 1), residue + num_for_each_process)
+            f = executor.submit(wrapper, fuzzer_module_names, function, output_dir, str(para_num - 1), residue + num_for_each_process, seed)
             f.add_done_callback(lambda _: progress.update(residue))
             futures.append(f)
             index[f] = para_num - 1
@@ -158,7 +163,8 @@ def main(function, output_dir, num, debug_level, size_limit, para_num, time):
                                         function, 
                                         output_dir, 
                                         f'{batch}-{i}', 
-                                        BATCH_SIZE)
+                                        BATCH_SIZE,
+                                        seed)
                     futures.append(f)
                     index[f] = (batch, i)
                 for f in concurrent.futures.as_completed(futures):
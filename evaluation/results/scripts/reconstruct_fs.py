@@ -72,6 +72,17 @@ def to_cov_set(cov_item: Sequence[str]) -> CovSet:
         s.add(edge.strip())
     return CovSet(s)
 
+def load_coverage(logdir: str) -> dict:
+    """A generation's coverage.json, or the same dict from its coverage store
+    (coverage.bin) in runs that don't keep the JSON"""
+    path = os.path.join(logdir, 'coverage.json')
+    if os.path.exists(path):
+        with open(path) as cov_f:
+            return json.load(cov_f)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+    from covmap import CoverageStore
+    return CoverageStore(os.path.join(logdir, 'coverage.bin')).to_dict()
+
 # TODO: Count this for ELFuzz-noFS
 if __name__ == '__main__':
     target = sys.argv[1]
@@ -84,8 +95,7 @@ if __name__ == '__main__':
     cov_records = {}
     logtext = ''
     for i in range(START, END + 1):
-        with open(f'{dir}/gen{i}/logs/coverage.json') as cov_f:
-            json_cov = json.load(cov_f)['CodeLlama-13b-hf']
+        json_cov = load_coverage(f'{dir}/gen{i}/logs')['CodeLlama-13b-hf']
         
         max_cov = CovSet([])
         if len(cov_records) > 0:
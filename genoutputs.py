@@ -2,8 +2,7 @@
 
 import argparse
 from collections import OrderedDict, defaultdict
-from concurrent.futures import ProcessPoolExecutor, as_completed
-import glob
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import json
 import logging
 import os
@@ -11,26 +10,19 @@ import re
 import shutil
 import subprocess
 import sys
-from typing import BinaryIO
-try:
-    # Not until 3.11
-    from hashlib import file_digest
-except ImportError:
-    def file_digest(f: BinaryIO):
-        import hashlib
-        BLOCKSIZE = 65536
-        hasher = hashlib.sha256()
-        buf = f.read(BLOCKSIZE)
-        while len(buf) > 0:
-            hasher.update(buf)
-            buf = f.read(BLOCKSIZE)
-        return hasher
 
 from drive_log import setup_custom_logger
 logger = setup_custom_logger('root')
 
 from tqdm import tqdm
 from driver import ExceptionInfo, Result, ResultInfo, GenResult
+from genpool import GeneratorPool, run_subprocess
+from hashcache import FileHashCache, hash_file
+from resultlog import ResultLogWriter, iter_records
+from screen import OutputScreen
+from runstats import RunStats, StatusWriter, serve_status
+from outputmanifest import OutputManifest
+from seedindex import SeedIndex, SeedList, read_seed_list, write_seed_list
 
 # Global color cycle with ANSI colors
 COLOR_GREEN = '\033[92m'
@@ -116,7 +108,33 @@ def get_gentype(module_path):
     #  => complete
     return gentype_re.search(basename).group('gentype')
 
+def module_output_dir(output_dir, module_path):
+    """Directory for the outputs of one module. A {MODEL} placeholder in
+    output_dir is filled in from the directory holding the variant, which
+    genvariants_parallel names after the model."""
+    model = os.path.basename(os.path.dirname(os.path.abspath(module_path)))
+    module_base = os.path.splitext(os.path.basename(module_path))[0]
+    return os.path.join(output_dir.replace('{MODEL}', model), module_base)
+
 def generate_stats(logfile):
+    # Recompute the stats from a finished log
+    running_stats = defaultdict(lambda: defaultdict(int))
+    records = iter_records(logfile)
+    original_args = next(records)['data']['args']
+    for result in records:
+        try:
+            module_path = result['module_path']
+        except KeyError:
+            print(f"Error: {json.dumps(result)}", file=sys.stderr)
+        if result['result_type'] == 'ImportError':
+            # Mark the batch as an error
+            running_stats[get_gentype(module_path)]['ImportError'] += original_args['driver']['num_iterations']
+        else:
+            running_stats[get_gentype(module_path)][result['result_type']] += 1
+    print_stats({ k: dict(v) for k, v in running_stats.items() })
+
+def print_stats(running_stats):
+    """Print counts of result types per generation type ({gentype: {result_type: count}})"""
     color_preferences = {
         'Success': COLOR_GREEN,
         'Error': COLOR_RED,
@@ -125,22 +143,6 @@ def generate_stats(logfile):
     }
     def add_stats(d1, d2):
         return {k: d1.get(k, 0) + d2.get(k, 0) for k in set(d1) | set(d2)}
-    # Track stats as we go and print them at the end
-    running_stats = defaultdict(lambda: defaultdict(int))
-    with open(logfile) as f:
-        original_args = json.loads(f.readline())['data']['args']
-        for line in f:
-            result = json.loads(line)
-            try:
-                module_path = result['module_path']
-            except KeyError:
-                print(f"Error: {line}", file=sys.stderr)
-            if result['result_type'] == 'ImportError':
-                # Mark the batch as an error
-                running_stats[get_gentype(module_path)]['ImportError'] += original_args['driver']['num_iterations']
-            else:
-                running_stats[get_gentype(module_path)][result['result_type']] += 1
-    running_stats = { k: dict(v) for k, v in running_stats.items() }
     combined = {}
     for k in running_stats:
         combined = add_stats(combined, running_stats[k])
@@ -159,24 +161,13 @@ def generate_stats(logfile):
     if total != 0:
         print(f"  success%: {success/total*100:.2f}%", file=sys.stderr)
 
-def generate_filestats(logfile):
+def generate_filestats(logfile, jobs=None):
     from idontwannadoresearch.txdm import txdm
-    def count_unique_files(outdir, ext):
-        try:
-            files = glob.glob(os.path.join(outdir, f'*{ext}'))
-        except FileNotFoundError:
-            return 0
-        unique_files = set([
-            file_digest(open(os.path.join(outdir, f), 'rb')).hexdigest()
-            for f in files
-        ])
-        return len(unique_files)
-    def file_sizes(outdir, ext):
+    def list_outputs(outdir, ext):
+        """(path, stat) of each output in outdir, from one scan of the directory"""
         try:
-            return [
-                os.path.getsize(os.path.join(outdir, f))
-                for f in glob.glob(os.path.join(outdir, f'*{ext}'))
-            ]
+            with os.scandir(outdir) as it:
+                return [(e.path, e.stat()) for e in it if e.name.endswith(ext) and e.is_file()]
         except FileNotFoundError:
             return []
     def new_filestats():
@@ -186,31 +177,37 @@ def generate_filestats(logfile):
         }
     # Tracks file stats for each module, keyed by generation type
     file_stats = defaultdict(lambda: defaultdict(new_filestats))
-    with open(logfile) as f:
-        original_args = json.loads(f.readline())['data']['args']
-        ext = original_args['driver']['output_suffix']
-        output_dir = original_args['output_dir']
-        for line in f:
-            result = json.loads(line)
-            module_path = result['module_path']
-            generation_type = get_gentype(module_path)
-            file_stats[generation_type][module_path]['file_sizes'] = {}
-            file_stats[generation_type][module_path]['unique_hashes'] = {}
-
-    # Compute the file stats
-    total = sum([
-        len(file_stats[generation_type])
-        for generation_type in file_stats
-    ])
-    progress = (tqdm(total=total, desc="Computing file stats", unit="mod")
+    records = iter_records(logfile)
+    original_args = next(records)['data']['args']
+    ext = original_args['driver']['output_suffix']
+    output_dir = original_args['output_dir']
+    for result in records:
+        module_path = result['module_path']
+        generation_type = get_gentype(module_path)
+        file_stats[generation_type][module_path]['file_sizes'] = {}
+        file_stats[generation_type][module_path]['unique_hashes'] = {}
+
+    # List each module's outputs, then hash the ones that aren't in the
+    # hash cache yet in a process pool
+    outputs = {}
+    for generation_type in file_stats:
+        for module_path in file_stats[generation_type]:
+            outputs[module_path] = list_outputs(module_output_dir(output_dir, module_path), ext)
+    total = sum(len(files) for files in outputs.values())
+    progress = (tqdm(total=total, desc="Hashing outputs", unit="file")
                 if not ON_NSF_ACCESS
-                else txdm(total=total, desc="Computing file stats", unit="mod", file=sys.stdout))
+                else txdm(total=total, desc="Hashing outputs", unit="file", file=sys.stdout))
+    cache = FileHashCache(os.path.splitext(logfile)[0] + '.hashcache.tsv')
+    hashes = cache.hash_all(
+        (f for files in outputs.values() for f in files),
+        jobs=jobs, progress=progress,
+    )
     for generation_type in file_stats:
         for module_path in file_stats[generation_type]:
-            worker_dir = os.path.join(output_dir, os.path.splitext(os.path.basename(module_path))[0])
-            file_stats[generation_type][module_path]['file_sizes'] = file_sizes(worker_dir, ext)
-            file_stats[generation_type][module_path]['unique_hashes'] = count_unique_files(worker_dir, ext)
-            progress.update()
+            files = outputs[module_path]
+            file_stats[generation_type][module_path]['file_sizes'] = [st.st_size for _, st in files]
+            file_stats[generation_type][module_path]['unique_hashes'] = len(
+                set(hashes[path] for path, _ in files if path in hashes))
     progress.close()
     print(f"File stats:", file=sys.stderr)
     computed_file_stats = defaultdict(dict)
@@ -303,11 +300,16 @@ class filestats_action(argparse.Action):
         if namespace.logfile is None:
             parser.error('Must specify --logfile with --stats-only')
         generate_stats(namespace.logfile)
-        generate_filestats(namespace.logfile)
+        generate_filestats(namespace.logfile, getattr(namespace, 'jobs', None))
 
         parser.exit()
 
-def generate_corpus(module_path, input_seeds: str, worker_dir, args):
+def generate_corpus(module_path, seed_list: SeedList, worker_dir, args, pool=None,
+                    num_iterations=None, start_index=0):
+    """Run the driver on one module, for num_iterations outputs per seed input
+    (args.driver.num_iterations by default) numbered from start_index."""
+    if num_iterations is None:
+        num_iterations = args.driver.num_iterations
     module_name = os.path.basename(module_path)
     # Copy the module to the output directory
     copied_module_name = os.path.join(worker_dir, module_name)
@@ -319,27 +321,51 @@ def generate_corpus(module_path, input_seeds: str, worker_dir, args):
     # if not args.driver.real_feedback:
     cmd = [
         'python', 'driver.py',
-        '-n', str(args.driver.num_iterations),
+        '-n', str(num_iterations),
         '-o', outdir,
         '-L', actual_logfile_name,
+        '--log-format', args.log_format,
         '-t', str(args.driver.timeout),
         '-S', str(args.driver.size_limit),
         '-M', str(args.driver.max_mem),
         '-s', args.driver.output_suffix,
-        '-i', input_seeds,
+        '-I', seed_list.path,
         actual_module_name, args.driver.function_name,
     ]
+    if args.driver.fork_server:
+        cmd.insert(2, '--fork-server')
+    if args.driver.cpu_timeout is not None:
+        cmd[2:2] = ['-C', str(args.driver.cpu_timeout)]
+    if args.driver.seed is not None:
+        cmd[2:2] = ['-R', str(args.driver.seed)]
+    if start_index:
+        cmd[2:2] = ['--start-index', str(start_index)]
     logger.debug(f"Running: {' '.join(cmd)}")
-    input_seed_num = len(input_seeds.split(';'))
+    input_seed_num = seed_list.count
     result = None
+    timed_out = None
     try:
         # if not args.driver.real_feedback:
-        timeout = 0.5 * args.driver.timeout * input_seed_num * args.driver.num_iterations * 0.5 # Kill the process if 50% of the generation cannot finished in 0.5 timeout
-        subprocess.run(cmd, check=True, text=True, timeout=timeout, capture_output=True)
+        if args.variant_budget is not None:
+            timeout = args.variant_budget
+        else:
+            timeout = 0.5 * args.driver.timeout * input_seed_num * num_iterations * 0.5 # Kill the process if 50% of the generation cannot finished in 0.5 timeout
+        # Either way the driver runs in its own process group, which is killed
+        # as a whole once the budget runs out
+        if pool is None:
+            job = run_subprocess(cmd, timeout=timeout)
+        else:
+            job = pool.run(cmd[2:], timeout=timeout)
+        if job.timed_out:
+            timed_out = job
+            raise subprocess.TimeoutExpired(cmd, timeout, output=job.stdout, stderr=job.stderr)
+        if job.returncode != 0:
+            raise subprocess.CalledProcessError(job.returncode, cmd, output=job.stdout, stderr=job.stderr)
         # else:
         #     subprocess.run(cmd, check=True, text=True, capture_output=True, timeout=210)
     except subprocess.TimeoutExpired as e:
-        pass
+        cpu_time = 'unknown' if timed_out.cpu_time is None else f'{timed_out.cpu_time:.1f}s'
+        logger.warning(f"Killed {module_path} after its budget of {timeout:.1f}s (CPU time used: {cpu_time})")
     except subprocess.CalledProcessError as e:
         result = Result(
             error = ExceptionInfo.from_exception(e, module_path),
@@ -362,9 +388,7 @@ def generate_corpus(module_path, input_seeds: str, worker_dir, args):
     gen_results = []
     try:
         # Read the results from the logfile
-        with open(os.path.join(worker_dir, logfile_name)) as f:
-            for line in f:
-                gen_results.append(json.loads(line))
+        gen_results.extend(iter_records(os.path.join(worker_dir, logfile_name)))
         # remove the logfile
         os.remove(os.path.join(worker_dir, logfile_name))
     except FileNotFoundError:
@@ -380,7 +404,28 @@ def generate_corpus(module_path, input_seeds: str, worker_dir, args):
     if len(gen_results) == 1 and gen_results[0]['result_type'] == 'ImportError':
         return gen_results
 
-    if len(gen_results) != args.driver.num_iterations:
+    # The driver writes one result per iteration for each seed input
+    expected = num_iterations * input_seed_num
+
+    if timed_out is not None:
+        # The outputs the driver didn't get to ran out of time
+        killed = Result(
+            error = None,
+            data = ResultInfo(
+                time_taken=None,
+                memory_used=None,
+                stdout='',
+                stderr=f'Variant killed after its budget of {timeout:.1f}s (CPU time used: {cpu_time})',
+            ),
+            module_path = module_path,
+            result_type = GenResult.Timeout,
+            function_name = args.driver.function_name,
+            args = args,
+        )
+        for _ in range(expected - len(gen_results)):
+            gen_results.append(json.loads(killed.json()))
+
+    if len(gen_results) != expected:
         if result is None:
             result = Result(
                 error = None,
@@ -391,10 +436,57 @@ def generate_corpus(module_path, input_seeds: str, worker_dir, args):
                 args = args,
             )
         # Fill in the remaining entries with the error
-        for _ in range(args.driver.num_iterations - len(gen_results)):
+        for _ in range(expected - len(gen_results)):
             gen_results.append(json.loads(result.json()))
     return gen_results
 
+def variant_yield(gen_results, timeout) -> float:
+    """Unique successful outputs per second of generator run time in a batch
+    of driver results. Variants with at most one unique output score zero,
+    since running them more won't give anything new."""
+    hashes = set()
+    total_time = 0.0
+    for res in gen_results:
+        data = res.get('data') or {}
+        time_taken = data.get('time_taken')
+        total_time += time_taken if time_taken is not None else timeout
+        if res.get('result_type') == 'Success' and res.get('output_file'):
+            try:
+                hashes.add(hash_file(res['output_file']))
+            except FileNotFoundError:
+                pass
+    if len(hashes) <= 1 or total_time <= 0:
+        return 0.0
+    return len(hashes) / total_time
+
+def allocate_budget(scores, budget: int, cap: int):
+    """Split `budget` iterations among the keys of `scores` in proportion to
+    their scores, giving none more than `cap` and none to zero scores."""
+    allocation = dict.fromkeys(scores, 0)
+    active = {k for k, score in scores.items() if score > 0}
+    if cap <= 0:
+        return allocation
+    # Give capped variants their cap and share the rest among the others
+    while active:
+        total = sum(scores[k] for k in active)
+        capped = {k for k in active if budget * scores[k] / total >= cap}
+        if not capped:
+            break
+        for k in capped:
+            allocation[k] = cap
+            budget -= cap
+        active -= capped
+    if active and budget > 0:
+        total = sum(scores[k] for k in active)
+        shares = {k: budget * scores[k] / total for k in active}
+        for k in active:
+            allocation[k] = int(shares[k])
+        # Hand out what rounding down left over by largest remainder
+        leftover = budget - sum(allocation[k] for k in active)
+        for k in sorted(active, key=lambda k: shares[k] - allocation[k], reverse=True)[:leftover]:
+            allocation[k] += 1
+    return allocation
+
 import util
 from typing import Optional
 import random
@@ -423,15 +515,42 @@ def make_parser():
     # Global options
     parser.add_argument(
         '-O', '--output-dir', type=str, default='.',
-        help='Output directory')
+        help='Output directory; {MODEL} is replaced by the model each variant came from')
     parser.add_argument(
         '-j', '--jobs', type=int, default=None,
         help='Maximum number of jobs to run in parallel; None means ncpu',
     )
+    parser.add_argument('--no-pool', action='store_true',
+                        help='Start a new driver.py process for every module instead of ' + \
+                        'using a pool of pre-forked workers')
+    parser.add_argument('--variant-budget', type=float, default=None,
+                        help='Wall-clock time (in seconds) one module\'s driver run may take before its ' + \
+                        'whole process group is killed and its remaining outputs are logged as Timeout; ' + \
+                        'None means 0.25 * timeout * seed inputs * iterations')
     parser.add_argument('--raise-errors', action='store_true',
                         help="Don't catch exceptions in the main driver loop")
     parser.add_argument('-L', '--logfile', type=str, default=None,
                         help='Log file for JSON results')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='Append a record of each output (variant, rng seed, size) to this ' + \
+                        'manifest, so the outputs can be deleted and regenerated later')
+    parser.add_argument('--screen', type=str, default=None,
+                        help='Delete empty outputs and outputs identical to an earlier one (from any ' + \
+                        'module, crediting the first), and write a summary with per-variant counts to this JSON file')
+    parser.add_argument('--screen-bucket-cap', type=int, default=None,
+                        help='With --screen, also keep at most this many outputs per variant in each ' + \
+                        'power-of-two size bucket')
+    parser.add_argument('--log-format', choices=['jsonl', 'columnar'], default='jsonl',
+                        help='Format of the log file and of the driver logs: one JSON result per ' + \
+                        'line, or the compact columnar format of resultlog.py')
+    parser.add_argument('--status-file', type=str, default=None,
+                        help='Keep live stats for the run (results by type, recent success rate) in this JSON file')
+    parser.add_argument('--status-interval', type=float, default=5.0,
+                        help='Minimum time between updates of the status file (in seconds)')
+    parser.add_argument('--status-port', type=int, default=None,
+                        help='Serve live stats for the run at http://127.0.0.1:PORT/status')
+    parser.add_argument('--filestats', action='store_true',
+                        help='Also compute output file stats (sizes, unique hashes) at the end')
     parser.add_argument('--stats-only', action=filestats_action,
                         default=argparse.SUPPRESS,
                         help='Only compute stats for the given log file')
@@ -445,9 +564,13 @@ def make_parser():
     parser.add_argument("--seed_input_samples", type=int, default=-1, help="Number of samples to take from the whole corpus")
     parser.add_argument("--resample_iterations", type=int, default=-1, help="Number of samples to take from the whole corpus")
     parser.add_argument(
-        '-t', '--driver.timeout', type=int, default=2,
+        '-t', '--driver.timeout', type=float, default=2,
         help='Timeout for each function run (in seconds)',
     )
+    parser.add_argument(
+        '-C', '--driver.cpu-timeout', type=float, default=None,
+        help='Limit on the CPU time of each function run (in seconds); None means no limit',
+    )
     parser.add_argument(
         '-S', '--driver.size-limit', type=int, default=50*1024*1024,
         help='Maximum size of the output file (in bytes)')
@@ -466,6 +589,24 @@ def make_parser():
         '-n', '--driver.num_iterations', type=int, default=100,
         help='Number of times to run each function in each module (i.e., number of outputs to generate)',
     )
+    parser.add_argument(
+        '--adaptive-probe', type=int, default=0,
+        help='Probe each module with this many iterations first, then share out the rest of ' + \
+        'the budget (num_iterations per module) by unique outputs per second; 0 disables',
+    )
+    parser.add_argument(
+        '--adaptive-max-factor', type=int, default=4,
+        help='With --adaptive-probe, no module gets more than this many times num_iterations',
+    )
+    parser.add_argument(
+        '-R', '--driver.seed', type=int, default=None,
+        help='Seed for the RNG streams given to the generators; None picks a random seed per module',
+    )
+    parser.add_argument(
+        '--driver.fork-server', action='store_true',
+        help='Fork a child per output from a parent that imported the module once, ' + \
+        'instead of running outputs in a process pool',
+    )
     # parser.add_argument(
     #     '--driver.real_feedback', default=False, action='store_true',
     # )
@@ -483,19 +624,41 @@ def main():
     args = config.parse_args()
     logger.setLevel(logging.INFO)
 
-    if args.logfile is not None:
-        output_log = open(args.logfile, 'w')
-    else:
-        output_log = sys.stdout
-    
     # Record the arguments we're using in the log
-    print(json.dumps(
-        {'error': None, 'data': {'args': args.__dict__}},
-        default=lambda x: x.__dict__ if hasattr(x, '__dict__') else str(x),
-    ), file=output_log)
+    header = {'error': None, 'data': {'args': args.__dict__}}
+    if args.logfile is not None and args.log_format == 'columnar':
+        output_log = ResultLogWriter(args.logfile, header=header)
+    else:
+        if args.logfile is not None:
+            output_log = open(args.logfile, 'w')
+        else:
+            output_log = sys.stdout
+        print(json.dumps(
+            header,
+            default=lambda x: x.__dict__ if hasattr(x, '__dict__') else str(x),
+        ), file=output_log)
+    def log_record(record):
+        if isinstance(output_log, ResultLogWriter):
+            output_log.append(record)
+        else:
+            print(json.dumps(record), file=output_log)
+
+    manifest = None
+    if args.manifest is not None:
+        manifest = OutputManifest(args.manifest)
+        manifest.add_driver_args(args.driver)
+
+    # Drop empty and duplicate outputs before coverage is measured
+    screen = OutputScreen(args.screen_bucket_cap) if args.screen is not None else None
 
     # The first line sent by genvariants is the number of modules it will produce
     module_count = int(sys.stdin.readline())
+
+    # Keep the stats up to date as results come in, for watching the run
+    run_stats = RunStats(args.driver.num_iterations, module_count)
+    status = None
+    if args.status_file is not None:
+        status = StatusWriter(run_stats, args.status_file, args.status_interval)
     
     gen: str = args.generation
     resample = get_resample_iterations()
@@ -503,84 +666,138 @@ def main():
     ELMFUZZ_RUNDIR = os.environ.get('ELMFUZZ_RUNDIR', '.')
     
     assert gen.startswith('gen')
+    # The seed inputs go to the driver as a file listing them, rather than on
+    # the command line; the seed directory is only walked once per run, to
+    # build the index that samples are drawn from.
     if resample != -1:
         if int(gen.removeprefix('gen')) % resample == 0:
             print('INFO: Resample seed inputs')
             seed_input_dir = get_seed_input_dir()
             assert seed_input_dir is not None
-            seed_inputs_raw = []
-            for p, ds, fs in os.walk(seed_input_dir):
-                for f in fs:
-                    seed_inputs_raw.append(os.path.join(p, f))
-            
-            seed_input_samples = get_seed_input_samples()
-            if seed_input_samples is not None and seed_input_samples != -1:
-                input_seeds = random.sample(seed_inputs_raw, seed_input_samples)
-            else:
-                input_seeds = seed_inputs_raw
+            seed_index = SeedIndex.open(seed_input_dir, ELMFUZZ_RUNDIR)
+            input_seeds = [entry.path for entry in seed_index.sample(get_seed_input_samples())]
         else:
             print('INFO: Inherit seed inputs')
-            input_seeds = []
             previous_gen = f'gen{int(gen.removeprefix("gen")) - 1}' if gen.startswith('gen') else 'initial'
-            with open(f'{ELMFUZZ_RUNDIR}/{previous_gen}/seed_inputs', 'r') as f:
-                for line in f:
-                    input_seeds.append(line.strip())
-        
-        with open(f'{ELMFUZZ_RUNDIR}/{gen}/seed_inputs', 'w') as f:
-            for seed in input_seeds:
-                print(seed, file=f)
-        input_seeds_str = ';'.join(input_seeds)
+            input_seeds = read_seed_list(f'{ELMFUZZ_RUNDIR}/{previous_gen}/seed_inputs')
+
+        seed_list = write_seed_list(f'{ELMFUZZ_RUNDIR}/{gen}/seed_inputs', input_seeds)
     else:
         tmp = get_seed_input_samples()
         assert tmp is None or tmp == -1
-        seed_inputs_raw = []
         seed_input_dir = get_seed_input_dir()
         assert seed_input_dir is not None
-        for p, ds, fs in os.walk(seed_input_dir):
-            for f in fs:
-                seed_inputs_raw.append(os.path.join(p, f))
-        input_seeds_str = ';'.join(seed_inputs_raw)
+        # All of the seed inputs; the driver reads them from the index itself
+        seed_index = SeedIndex.open(seed_input_dir, ELMFUZZ_RUNDIR)
+        seed_list = SeedList(seed_index.path, len(seed_index))
 
     # if args.driver.real_feedback:
     #     print('INFO: Using real feedback', file=sys.stderr)
 
+    # Fork the worker pool before any threads exist
+    pool = None if args.no_pool else GeneratorPool(args.jobs)
+    status_server = None
+    if args.status_port is not None:
+        status_server = serve_status(run_stats, args.status_port)
+
     # Call generate_all on each module in args.module_paths in parallel
-    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+    with (ProcessPoolExecutor(max_workers=args.jobs) if pool is None
+          else ThreadPoolExecutor(max_workers=pool.jobs)) as executor:
         progress = (tqdm(total=module_count, desc="Generating", unit="mod")
                     if ON_NSF_ACCESS
                     else txdm(total=module_count, desc="Generating", unit="mod", file=sys.stdout))
         futures_to_paths = OrderedDict()
+        # With --adaptive-probe, every module first gets a small probe batch
+        probe = args.adaptive_probe if args.adaptive_probe > 0 else None
         for module_path in sys.stdin:
             module_path = module_path.strip()
+            if module_path.startswith('#'):
+                # genvariants ends with the number of variants it actually
+                # wrote, which can be fewer than the count it started with
+                module_count = int(module_path.rpartition(':')[2])
+                run_stats.total_modules = module_count
+                progress.total = module_count
+                continue
             # Make an output directory for this module's outputs
-            module_base = os.path.splitext(os.path.basename(module_path))[0]
-            worker_dir = os.path.join(args.output_dir, module_base)
+            worker_dir = module_output_dir(args.output_dir, module_path)
             os.makedirs(worker_dir, exist_ok=True)
             future = executor.submit(
                 generate_corpus,
-                module_path, input_seeds_str, worker_dir, args
+                module_path, seed_list, worker_dir, args, pool, probe
             )
             future.add_done_callback(lambda _: progress.update())
             futures_to_paths[future] = (module_path, worker_dir)
-        for future in as_completed(futures_to_paths):
-            module_path, worker_dir = futures_to_paths[future]
-            try:
-                result = future.result()
-                for res in result:
-                    print(json.dumps(res), file=output_log)
-            except Exception as e:
-                if args.raise_errors: raise
-                res = Result(
-                    error=ExceptionInfo.from_exception(e, module_path),
-                    data = None,
-                    module_path = module_path,
-                    result_type = GenResult.Error,
-                    function_name = args.driver.function_name,
+        scores = OrderedDict()
+        def collect(futures_to_paths, extension=False):
+            for future in as_completed(futures_to_paths):
+                module_path, worker_dir = futures_to_paths[future]
+                try:
+                    result = future.result()
+                    for res in result:
+                        log_record(res)
+                    if extension:
+                        for res in result:
+                            run_stats.add(get_gentype(module_path), res['result_type'])
+                    else:
+                        run_stats.add_module(get_gentype(module_path), result)
+                    # The yield is scored on the outputs as generated, before
+                    # screening deletes empty and repeated ones
+                    if probe is not None and (module_path, worker_dir) not in scores:
+                        scores[(module_path, worker_dir)] = variant_yield(result, args.driver.timeout)
+                    if screen is not None:
+                        screen.screen(
+                            f'{os.path.basename(os.path.dirname(worker_dir))}/{os.path.basename(worker_dir)}',
+                            result,
+                        )
+                    if manifest is not None:
+                        manifest.add_outputs(module_path, worker_dir, result)
+                except Exception as e:
+                    if args.raise_errors: raise
+                    log_record({
+                        'error': ExceptionInfo.from_exception(e, module_path),
+                    })
+                finally:
+                    # Extensions rerun modules that were already counted
+                    if not extension:
+                        run_stats.module_done()
+                if status is not None:
+                    status.update()
+        collect(futures_to_paths)
+        progress.close()
+
+        if probe is not None and scores:
+            # Spend the rest of the usual budget on the variants whose probes
+            # gave the most unique outputs per second
+            budget = len(futures_to_paths) * (args.driver.num_iterations - probe)
+            cap = args.adaptive_max_factor * args.driver.num_iterations - probe
+            allocation = allocate_budget(scores, budget, cap)
+            extended = [(k, n) for k, n in allocation.items() if n > 0]
+            print(f'Adaptive budget: {sum(n for _, n in extended)} more iterations for '
+                  f'{len(extended)} of {len(scores)} variants', file=sys.stderr)
+            progress = (tqdm(total=len(extended), desc="Extending", unit="mod")
+                        if ON_NSF_ACCESS
+                        else txdm(total=len(extended), desc="Extending", unit="mod", file=sys.stdout))
+            futures_to_paths = OrderedDict()
+            for (module_path, worker_dir), n in extended:
+                future = executor.submit(
+                    generate_corpus,
+                    module_path, seed_list, worker_dir, args, pool, n, probe
                 )
-                print(json.dumps({
-                    'error': ExceptionInfo.from_exception(e, module_path),
-                }), file=output_log)
+                future.add_done_callback(lambda _: progress.update())
+                futures_to_paths[future] = (module_path, worker_dir)
+            collect(futures_to_paths, extension=True)
         progress.close()
+    if pool is not None:
+        pool.close()
+    if manifest is not None:
+        manifest.close()
+    if screen is not None:
+        screen.write(args.screen)
+        print(screen.describe(), file=sys.stderr)
+    if status is not None:
+        status.update(force=True)
+    if status_server is not None:
+        status_server.shutdown()
 
     if output_log != sys.stdout:
         output_log.close()
@@ -589,9 +806,9 @@ def main():
     if args.logfile is None: return
 
     # Print the stats out to stderr now that we're done
-    generate_stats(args.logfile)
-    # Skip file stats for now, takes too long
-    # generate_filestats(args.logfile)
+    print_stats(run_stats.by_gentype())
+    if args.filestats:
+        generate_filestats(args.logfile, args.jobs)
 
 ON_NSF_ACCESS = False
 
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+# A pool of long-lived worker processes for running generator modules.
+#
+# Spawning `python driver.py` for every module pays for interpreter startup
+# and the driver's imports each time. The workers here are forked once per
+# genoutputs run with the driver already imported; for each module a worker
+# forks a short-lived child that runs driver.main() on the same command line
+# the subprocess would have gotten. Exiting the child keeps the module's
+# imports and any state it leaves behind from leaking into the next job.
+# The worker enforces the same overall timeout that subprocess.run did.
+#
+# The child always runs the driver in fork-server mode: it imports the module
+# once and forks a child per output, instead of starting a fresh process
+# pool (up to one process per CPU) for every module. A pool can't be kept
+# across modules, since each one is imported as generator_module.
+
+import multiprocessing
+import os
+import queue
+import select
+import signal
+import subprocess
+import sys
+import tempfile
+import traceback
+from typing import List, NamedTuple, Optional
+
+import driver
+
+class JobResult(NamedTuple):
+    returncode: int
+    timed_out: bool
+    stdout: str
+    stderr: str
+    # CPU time (user + system) of the job and everything it started, if known
+    cpu_time: Optional[float] = None
+
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+
+def group_cpu_time(pgid: int) -> Optional[float]:
+    """CPU time used so far by the processes in a process group, including
+    the children they have already reaped. Read from /proc, so it also works
+    for a group that is about to be killed."""
+    total = 0
+    try:
+        pids = [p for p in os.listdir('/proc') if p.isdigit()]
+    except OSError:
+        return None
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name can contain spaces; fields resume after its ')'
+        fields = stat[stat.rindex(b')') + 2:].split()
+        if int(fields[2]) != pgid:
+            continue
+        # utime, stime, cutime, cstime
+        total += sum(int(x) for x in fields[11:15])
+    return total / CLK_TCK
+
+def kill_group(pgid: int):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+def run_subprocess(cmd: List[str], timeout: Optional[float] = None) -> JobResult:
+    """Run cmd in a new process group, like subprocess.run with capture_output,
+    but on timeout kill the whole group so nothing it started keeps running."""
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, start_new_session=True)
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+        # Don't leave anything the driver started running
+        kill_group(proc.pid)
+        return JobResult(proc.returncode, False, stdout, stderr)
+    except subprocess.TimeoutExpired:
+        cpu_time = group_cpu_time(proc.pid)
+        kill_group(proc.pid)
+        stdout, stderr = proc.communicate()
+        return JobResult(proc.returncode, True, stdout, stderr, cpu_time)
+
+def _read_and_truncate(f) -> str:
+    f.seek(0)
+    data = f.read().decode('utf-8', errors='replace')
+    f.seek(0)
+    f.truncate()
+    return data
+
+def _run_job(argv: List[str], timeout: Optional[float], out, err) -> JobResult:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            # Own process group, so a timeout kills the driver's workers too
+            os.setpgid(0, 0)
+            os.dup2(out.fileno(), 1)
+            os.dup2(err.fileno(), 2)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            driver.main(argv if '--fork-server' in argv else ['--fork-server'] + argv)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+
+    try:
+        # Also set it here, in case we need to kill the group before the child has
+        os.setpgid(pid, pid)
+    except OSError:
+        pass
+    pidfd = os.pidfd_open(pid)
+    try:
+        ready, _, _ = select.select([pidfd], [], [], timeout)
+        timed_out = not ready
+        cpu_time = None
+        if timed_out:
+            cpu_time = group_cpu_time(pid)
+            kill_group(pid)
+        _, status, rusage = os.wait4(pid, 0)
+        if not timed_out:
+            cpu_time = rusage.ru_utime + rusage.ru_stime
+        # Don't leave anything the driver started running
+        kill_group(pid)
+    finally:
+        os.close(pidfd)
+    return JobResult(
+        returncode = os.waitstatus_to_exitcode(status),
+        timed_out = timed_out,
+        stdout = _read_and_truncate(out),
+        stderr = _read_and_truncate(err),
+        cpu_time = cpu_time,
+    )
+
+def _worker(conn):
+    # Ctrl-C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        while True:
+            try:
+                job = conn.recv()
+            except EOFError:
+                break
+            if job is None:
+                break
+            argv, timeout = job
+            conn.send(_run_job(argv, timeout, out, err))
+
+class GeneratorPool:
+    """Runs driver.py command lines in pre-forked worker processes.
+
+    `run` is thread-safe and blocks until a worker is free and has finished
+    the job, so the pool is meant to be driven from a thread pool of the
+    same size.
+    """
+    def __init__(self, jobs: Optional[int] = None):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.ctx = multiprocessing.get_context('fork')
+        self.idle = queue.Queue()
+        self.workers = []
+        for _ in range(self.jobs):
+            self.idle.put(self._spawn())
+
+    def _spawn(self):
+        parent_conn, child_conn = self.ctx.Pipe()
+        # Not a daemon: the driver needs to start its own process pool.
+        # Workers exit on their own once the parent end of the pipe closes.
+        proc = self.ctx.Process(target=_worker, args=(child_conn,))
+        proc.start()
+        child_conn.close()
+        self.workers.append((proc, parent_conn))
+        return proc, parent_conn
+
+    def run(self, argv: List[str], timeout: Optional[float] = None) -> JobResult:
+        """Run `driver.py *argv` and return its exit status and output."""
+        proc, conn = self.idle.get()
+        try:
+            conn.send((argv, timeout))
+            res = conn.recv()
+        except (EOFError, OSError):
+            # The worker itself died; replace it and report the job as failed
+            proc.join()
+            conn.close()
+            self.workers.remove((proc, conn))
+            self.idle.put(self._spawn())
+            return JobResult(
+                returncode = proc.exitcode if proc.exitcode else -1,
+                timed_out = False,
+                stdout = '',
+                stderr = f'Generator pool worker {proc.pid} died',
+            )
+        self.idle.put((proc, conn))
+        return res
+
+    def close(self):
+        for proc, conn in self.workers:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for proc, conn in self.workers:
+            proc.join()
+            conn.close()
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,12 +1,25 @@
 #!/usr/bin/env python3
 
+import ast
+import bisect
+import hashlib
 import json
 import random
 import os
-from typing import List, Optional, Dict
+from collections import Counter
+from typing import List, NamedTuple, Optional, Dict
 from argparse import ArgumentParser
+import asyncio
+import sys
+import time
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from tgi_client import TGIClient
+from completion_cache import CompletionCache, DEFAULT_CACHE_DIR
+from metalog import MetaLog, variant_key
+from rngstream import new_seed
+
+# Last line of the output, after the variant paths: how many were written
+WRITTEN_PREFIX = '# written: '
 
 def get_endpoints() -> Dict[str, str]:
     result = dict()
@@ -16,12 +29,51 @@ def get_endpoints() -> Dict[str, str]:
         result[model] = endpoint
     return result
 
+def parse_replicas(endpoint: str) -> List[str]:
+    """An endpoint entry may list several replicas of the same model
+    server, separated by commas."""
+    return [e.strip() for e in endpoint.split(',') if e.strip()]
 
-def model_info():
+def model_info(endpoint):
     """Get information about the model."""
-    return requests.get(f'{ENDPOINT}/info').json()
+    return requests.get(f'{endpoint}/info').json()
+
+class EndpointRouter:
+    """Spread the requests for each model over all replicas serving it.
 
-def generate_completion(
+    Each request goes to the replica of its model with the fewest outstanding
+    requests (including those still waiting for a connection); ties are
+    broken round-robin so that an idle start does not pile onto the first
+    replica.
+    """
+    def __init__(self, client: TGIClient, replicas: Dict[str, List[str]]):
+        self.client = client
+        self.replicas = replicas
+        self.outstanding = {
+            endpoint: 0
+            for endpoints in replicas.values()
+            for endpoint in endpoints
+        }
+        self.next_replica = {model: 0 for model in replicas}
+
+    def pick(self, model: str) -> str:
+        endpoints = self.replicas[model]
+        start = self.next_replica[model]
+        self.next_replica[model] = (start + 1) % len(endpoints)
+        rotated = endpoints[start:] + endpoints[:start]
+        return min(rotated, key=lambda endpoint: self.outstanding[endpoint])
+
+    async def generate(self, model: str, data: dict) -> dict:
+        endpoint = self.pick(model)
+        self.outstanding[endpoint] += 1
+        try:
+            return await self.client.generate(endpoint, data)
+        finally:
+            self.outstanding[endpoint] -= 1
+
+async def generate_completion(
+        router: EndpointRouter,
+        model,
         prompt,
         temperature=0.2,
         max_new_tokens=1200,
@@ -41,7 +93,7 @@ def generate_completion(
     }
     if stop is not None:
         data['parameters']['stop'] = stop
-    return requests.post(f'{ENDPOINT}/generate', json=data).json()
+    return await router.generate(model, data)
 
 def infilling_prompt_llama(
     pre: str,
@@ -63,50 +115,118 @@ def infilling_prompt_starcoder(
     """
     return f'<fim_prefix>{pre}<fim_suffix>{suf}<fim_middle>'
 
-infilling_prompt = None
+def get_infilling_prompt(model: str):
+    """Get the infilling prompt formatter for `model`, or None if the
+    model doesn't support FIM."""
+    if model == 'bigcode/starcoder':
+        return infilling_prompt_starcoder
+    elif model in ('codellama/CodeLlama-13b-hf',
+                   'codellama/CodeLlama-7b-hf'):
+        return infilling_prompt_llama
+    else:
+        return None
 
-def continue_completion(text: str) -> tuple[str, str]:
-    text_lines = text.split('\n')
+def model_dir(template: str, model: str) -> str:
+    """Fill in the {MODEL} placeholder of an output directory template"""
+    return template.replace('{MODEL}', os.path.basename(model))
+
+class SeedText:
+    """A seed file's text, read once, with its lines and their offsets."""
+    def __init__(self, text: str):
+        self.text = text
+        self.lines = text.split('\n')
+        # offsets[k] is the length of the first k lines, including newlines
+        self.offsets = [0]
+        for line in self.lines:
+            self.offsets.append(self.offsets[-1] + len(line) + 1)
+
+    def span(self, start: int, end: int) -> int:
+        """Number of characters in lines[start:end]"""
+        return self.offsets[end] - self.offsets[start]
+
+class SeedCorpus:
+    """All seed files of a run, read once and kept in memory."""
+    def __init__(self, files: List[str]):
+        self.files = list(files)
+        self.seeds = {}
+        for filename in self.files:
+            if filename not in self.seeds:
+                with open(filename) as f:
+                    self.seeds[filename] = SeedText(f.read())
+        self._others = {}
+        self._common_prefix = {}
+
+    def __getitem__(self, filename: str) -> SeedText:
+        return self.seeds[filename]
+
+    def others(self, filename: str) -> List[str]:
+        """The seeds other than filename, to splice with"""
+        if filename not in self._others:
+            self._others[filename] = [f for f in self.files if f != filename]
+        return self._others[filename]
+
+    def common_prefix(self, filename1: str, filename2: str) -> int:
+        key = (filename1, filename2)
+        if key not in self._common_prefix:
+            text_lines1 = self.seeds[filename1].lines
+            text_lines2 = self.seeds[filename2].lines
+            common_prefix = 0
+            for i in range(min(len(text_lines1), len(text_lines2))):
+                if text_lines1[i] != text_lines2[i]:
+                    common_prefix = i - 1
+                    break
+            self._common_prefix[key] = common_prefix
+        return self._common_prefix[key]
+
+def continue_completion(seed: SeedText) -> tuple[str, str]:
+    text_lines = seed.lines
     # Pick a random line number to cut at
     cut_line = len(text_lines)
     prompt_text = '\n'.join(text_lines[:cut_line])
     real_completion = ''
     return prompt_text, real_completion
 
-def random_completion(text: str, start_line: int = 1) -> tuple[str,str]:
+def random_completion(seed: SeedText, start_line: int = 1, max_chars: Optional[float] = None) -> tuple[str,str]:
     """Generate a completion of the text starting from a random line.
-    Always include at least 1 line to avoid an empty prompt."""
-    text_lines = text.split('\n')
+    Always include at least 1 line to avoid an empty prompt.
+    If max_chars is given, cut late enough that the rest of the file fits in it."""
+    text_lines = seed.lines
+    first = start_line + 1
+    if max_chars is not None:
+        # First line from which the rest of the file fits in max_chars
+        first = max(first, bisect.bisect_left(seed.offsets, seed.offsets[-1] - max_chars))
     # Pick a random line number to cut at
-    cut_line = len(text_lines) - 2 if start_line + 1 >= len(text_lines) - 1 else random.randint(start_line + 1, len(text_lines) - 1)
+    cut_line = len(text_lines) - 2 if first >= len(text_lines) - 1 else random.randint(first, len(text_lines) - 1)
     prompt_text = '\n'.join(text_lines[:cut_line])
     real_completion = '\n'.join(text_lines[cut_line:])
     return prompt_text, real_completion
 
-def random_fim(text: str, start_line: int = 1) -> tuple[str,str,str]:
-    """Fill in the middle of the text with a random completion."""
-    text_lines = text.split('\n')
+def random_fim(seed: SeedText, start_line: int = 1, max_chars: Optional[float] = None) -> tuple[str,str,str]:
+    """Fill in the middle of the text with a random completion.
+    If max_chars is given, the middle is at most that long (but at least one line)."""
+    text_lines = seed.lines
     # Random start and end lines. Make sure we always have at least
     # one line in each section.
     fim_start_line = len(text_lines) - 3 if start_line + 1 >= len(text_lines) - 2 else random.randint(start_line + 1, len(text_lines) - 2)
-    fim_end_line = random.randint(fim_start_line + 1, len(text_lines) - 1)
+    last = len(text_lines) - 1
+    if max_chars is not None:
+        # Last end line such that the middle fits in max_chars
+        fits = bisect.bisect_right(seed.offsets, seed.offsets[fim_start_line] + max_chars) - 1
+        last = max(fim_start_line + 1, min(last, fits))
+    fim_end_line = random.randint(fim_start_line + 1, last)
     prefix_text = '\n'.join(text_lines[:fim_start_line]) + '\n'
     suffix_text = '\n'.join(text_lines[fim_end_line:])
     real_middle = '\n'.join(text_lines[fim_start_line:fim_end_line])
     return prefix_text, suffix_text, real_middle
 
-def random_crossover(text1: str, text2: str, start_line: int = 1) -> tuple[str,str]:
+def random_crossover(seeds: SeedCorpus, filename1: str, filename2: str, start_line: int = 1) -> tuple[str,str]:
     """Generate a splice of two texts."""
 
-    text_lines1 = text1.split('\n')
-    text_lines2 = text2.split('\n')
+    text_lines1 = seeds[filename1].lines
+    text_lines2 = seeds[filename2].lines
+
+    common_prefix = seeds.common_prefix(filename1, filename2)
 
-    common_prefix = 0
-    for i in range(min(len(text_lines1), len(text_lines2))):
-        if text_lines1[i] != text_lines2[i]:
-            common_prefix = i - 1
-            break
-    
     cut_line1 = len(text_lines1) - 2 if start_line + 1 >= len(text_lines1) -1 else random.randint(start_line + 1, len(text_lines1) - 1)
 
     may_overlap = min(cut_line1 - 1, common_prefix)
@@ -139,57 +259,207 @@ def new_base(filename: str) -> tuple[str, str]:
         base = base[:first]
         return base, ext
 
-def generate_variant(i, generators, model, filename, args):
+class VariantRequest(NamedTuple):
+    i: int
+    model: str
+    generator: str
+    filename: str
+    prefix: str
+    suffix: str
+    orig: str
+    prompt: str
+    stop: List[str]
+    base: List[str]
+
+def make_request(i, generators, model, filename, seeds: SeedCorpus, args) -> VariantRequest:
+    """Pick a mutator and build the prompt for one variant of `filename`."""
+    infilling_prompt = get_infilling_prompt(model)
+    # Keep the span the model has to regenerate within its token budget
+    max_chars = None
+    if args.chars_per_token > 0:
+        max_chars = args.gen.max_new_tokens * args.chars_per_token
     # Pick a random generator
     generator = random.choice(generators)
     if generator == 'infilled':
-        prefix, suffix, orig = random_fim(open(filename).read(), args.start_line)
+        prefix, suffix, orig = random_fim(seeds[filename], args.start_line, max_chars)
         prompt = infilling_prompt(prefix, suffix) # type: ignore
         stop = []
     elif generator == 'lmsplice':
-        other_files = [f for f in args.files if f != filename]
+        other_files = seeds.others(filename)
         if other_files:
             filename2 = random.choice(other_files)
         else:
             filename2 = filename
-        prefix, suffix = random_crossover(open(filename).read(), open(filename2).read(), args.start_line)
+        prefix, suffix = random_crossover(seeds, filename, filename2, args.start_line)
         orig = ''
         prompt = infilling_prompt(prefix, suffix) # type: ignore
         stop = []
     elif generator == 'continue':
         assert False, 'Continue not supported'
-        prefix, orig = continue_completion(open(filename).read())
+        prefix, orig = continue_completion(seeds[filename])
         suffix = ''
         prompt = prefix
         stop = ['\nif', '\nclass', '\nfor', '\nwhile']
     else:
         assert generator == 'complete'
-        prefix, orig = random_completion(open(filename).read(), args.start_line)
+        prefix, orig = random_completion(seeds[filename], args.start_line, max_chars)
         suffix = ''
         prompt = prefix
         stop = ['\nif', '\nclass', '\nfor', '\nwhile']
 
-    # Prepare metadata up front in case we fail to generate
-    # filename and extension
-    base, ext = new_base(filename)
+    base, _ = new_base(filename)
     if generator == 'lmsplice':
         base2, _ = new_base(filename2)
+        bases = [base, base2]
     else:
-        base2 = base
+        bases = [base]
+    return VariantRequest(
+        i = i,
+        model = model,
+        generator = generator,
+        filename = filename,
+        prefix = prefix,
+        suffix = suffix,
+        orig = orig,
+        prompt = prompt,
+        stop = stop,
+        base = bases,
+    )
+
+def persistent_seed(path: str) -> int:
+    """The seed saved in `path`, or a new one, saved there for next time"""
+    try:
+        with open(path) as f:
+            return int(f.read())
+    except FileNotFoundError:
+        pass
+    seed = new_seed()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        print(seed, file=f)
+    os.replace(path + '.tmp', path)
+    return seed
+
+def build_worklist(models, generators, seeds: SeedCorpus, args) -> List[VariantRequest]:
+    """Requests for every variant; with args.seed set, the same seed files
+    always give the same requests"""
+    if args.seed is not None:
+        random.seed(args.seed)
+    worklist = []
+    for model in models:
+        i = 0
+        for _ in range(args.num_variants):
+            for filename in args.files:
+                worklist.append(make_request(i, generators, model, filename, seeds, args))
+                i += 1
+    if not args.no_prefix_grouping:
+        worklist = order_for_prefix_reuse(worklist)
+    return worklist
+
+def order_for_prefix_reuse(requests: List[VariantRequest]) -> List[VariantRequest]:
+    """Order requests so that those sharing a prompt prefix go out back to back.
+
+    TGI's /generate takes a single prompt, so rather than batching on the
+    client we hand the server all requests for one seed together, sorted by
+    prompt so that the longest shared prefixes are adjacent. The server then
+    batches them itself and can reuse the prefill of the shared prefix.
+    """
+    return sorted(requests, key=lambda r: (r.model, r.filename, r.prompt))
+
+class VariantFilter:
+    """Reject variants that would only waste genoutputs' execution budget.
+
+    A variant is rejected if it doesn't compile, or if it is the same program
+    as one already produced in this run. Two variants are the same program if
+    their ASTs match, so differences in comments and formatting don't count.
+    """
+    def __init__(self):
+        self.seen: Dict[str, str] = {}
+        self.rejected = Counter()
+
+    def check(self, path: str, text: str) -> Optional[dict]:
+        """Return the reason to reject the variant, or None to keep it."""
+        try:
+            tree = ast.parse(text, path)
+            compile(tree, path, 'exec')
+        except (SyntaxError, ValueError, RecursionError, MemoryError) as e:
+            self.rejected['compile'] += 1
+            return {
+                'reason': 'compile',
+                'error': f'{e.__class__.__name__}: {e}',
+            }
+        digest = hashlib.sha256(ast.dump(tree).encode('utf-8', errors='surrogatepass')).hexdigest()
+        if digest in self.seen:
+            self.rejected['duplicate'] += 1
+            return {
+                'reason': 'duplicate',
+                'duplicate_of': self.seen[digest],
+            }
+        self.seen[digest] = path
+        return None
+
+    def summary(self) -> str:
+        total = sum(self.rejected.values())
+        return (f'Pre-filter rejected {total} variants '
+                f'({self.rejected["compile"]} did not compile, {self.rejected["duplicate"]} duplicates)')
+
+class MetaWriter:
+    """Writes each variant's metadata to the log directory.
+
+    By default all variants in a log directory share one append-only
+    metadata log (see metalog.py); with format 'files' each variant gets
+    its own <variant>.json instead.
+    """
+    def __init__(self, fmt: str = 'jsonl'):
+        self.fmt = fmt
+        self.logs: Dict[str, MetaLog] = {}
+
+    def write(self, log_dir: str, model: str, out_file: str, meta: dict):
+        if self.fmt == 'files':
+            with open(os.path.join(log_dir, out_file + '.json'), 'w') as f:
+                f.write(json.dumps(meta))
+            return
+        if log_dir not in self.logs:
+            self.logs[log_dir] = MetaLog(log_dir, compress=self.fmt == 'zstd')
+        self.logs[log_dir].append(variant_key(model, out_file), meta)
+
+    def close(self):
+        for log in self.logs.values():
+            log.close()
+
+async def generate_variant(router, request: VariantRequest, args, meta_writer: MetaWriter,
+                           cache: Optional[CompletionCache] = None,
+                           variant_filter: Optional[VariantFilter] = None):
+    i, model, generator = request.i, request.model, request.generator
+    prefix, suffix, orig = request.prefix, request.suffix, request.orig
+    prompt, stop = request.prompt, request.stop
+
+    # Prepare metadata up front in case we fail to generate
+    # filename and extension
+    _, ext = new_base(request.filename)
     # Count lines
     plines = prefix.count('\n')
     slines = suffix.count('\n')
     olines = orig.count('\n')
     # Output filenames
     out_file = f'var_{i:04}.{generator}{ext}'
-    out_path = os.path.join(args.output_dir,out_file)
-    meta_file = os.path.join(args.log_dir, out_file + '.json')
-
-    res = generate_completion(
-        prompt,
-        stop=stop,
-        **vars(args.gen),
-    )
+    out_path = os.path.join(model_dir(args.output_dir, model), out_file)
+    log_dir = model_dir(args.log_dir, model)
+
+    res = None
+    if cache is not None:
+        cache_key = CompletionCache.key(model, prompt, stop=stop, sample=i, **vars(args.gen))
+        res = cache.get(cache_key)
+    if res is None:
+        res = await generate_completion(
+            router,
+            model,
+            prompt,
+            stop=stop,
+            **vars(args.gen),
+        )
+        if cache is not None and 'generated_text' in res:
+            cache.put(cache_key, res)
     if 'generated_text' not in res:
         meta = {
             'model': model,
@@ -200,15 +470,14 @@ def generate_variant(i, generators, model, filename, args):
             'gen_lines': 0,
             'suffix_lines': slines,
             'finish_reason': 'err',
-            'base': [base] + ([base2] if generator == 'lmsplice' else []),
+            'base': request.base,
             'response': res,
         }
 
         # Write (error) metadata to logdir
-        with open(meta_file, 'w') as f:
-            f.write(json.dumps(meta))
+        meta_writer.write(log_dir, model, out_file, meta)
 
-        return None
+        return None, res
 
     # Fix up the generated text
     text = res['generated_text']
@@ -238,9 +507,18 @@ def generate_variant(i, generators, model, filename, args):
         'gen_lines': gen_lines,
         'suffix_lines': slines,
         'finish_reason': finish_reason,
-        'base': [base] + ([base2] if generator == 'lmsplice' else []),
+        'base': request.base,
         'response': res,
     }
+    if variant_filter is not None:
+        rejected = variant_filter.check(out_path, prefix + text + suffix)
+        if rejected is not None:
+            # Keep the metadata so the reject shows up in the logs, but
+            # don't write the variant where genoutputs would run it
+            meta['rejected'] = rejected
+            meta_writer.write(log_dir, model, out_file, meta)
+            return None, res
+
     # Write output to file
     with open(out_path, 'w') as f:
         f.write(prefix)
@@ -248,10 +526,9 @@ def generate_variant(i, generators, model, filename, args):
         f.write(suffix)
 
     # Write metadata to logdir
-    with open(meta_file, 'w') as f:
-        f.write(json.dumps(meta))
+    meta_writer.write(log_dir, model, out_file, meta)
 
-    return out_path
+    return out_path, res
 
 def make_parser():
     parser = ArgumentParser(
@@ -260,6 +537,10 @@ def make_parser():
     parser.add_argument('files', type=str, nargs='+')
     parser.add_argument('-M', '--model_name', type=str, default='codellama/CodeLlama-13b-hf',
                         help='Model to use for generation')
+    parser.add_argument('--all-models', action='store_true',
+                        help='Generate variants with every model in model.names concurrently ' + \
+                        'instead of just --model_name; the output and log directories ' + \
+                        'then need a {MODEL} placeholder')
     parser.add_argument('--no-completion', action='store_true',
                         help='Disable the completion mutator')
     parser.add_argument('--no-fim', action='store_true',
@@ -269,14 +550,48 @@ def make_parser():
     parser.add_argument('-n', '--num_variants', type=int, default=1,
                         help='Number of variants to generate for each seed')
     parser.add_argument('-O', '--output_dir', type=str, default='.',
-                        help='Directory to write variants to')
+                        help='Directory to write variants to; {MODEL} is replaced by the model name')
     parser.add_argument('-L', '--log_dir', type=str, default='logs',
-                        help='Directory to write generation metadata to')
+                        help='Directory to write generation metadata to; {MODEL} is replaced by the model name')
     parser.add_argument('-s', '--start_line', type=int, default=0,
                         help='When making random cuts, always start at this line. ' + \
                         'Allows specifying an immutable region not subject to mutation.')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for choosing mutators and cut points, so that a re-run ' + \
+                        'sends the same prompts (and can be answered from the completion cache)')
+    parser.add_argument('--seed-file', type=str, default=None,
+                        help='Without --seed, use the seed saved in this file, or pick one and save ' + \
+                        'it there, so that re-running the same generation hits the completion cache')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always ask the model instead of reusing cached completions')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR,
+                        help='Directory for the completion cache')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='Maximum size of the completion cache (in MiB)')
+    parser.add_argument('--meta-format', choices=['jsonl', 'zstd', 'files'], default='jsonl',
+                        help='How to store variant metadata in the log directory: one ' + \
+                        'meta.jsonl log, the same log zstd-compressed, or one JSON file per variant')
+    parser.add_argument('--no-prefilter', action='store_true',
+                        help='Pass on every variant, even duplicates and ones that do not compile')
+    parser.add_argument('--chars-per-token', type=float, default=3.0,
+                        help='Estimated characters per token, used to keep the code the model ' + \
+                        'has to regenerate within --gen.max-new-tokens; 0 disables the limit')
+    parser.add_argument('--no-prefix-grouping', action='store_true',
+                        help="Send requests in generation order instead of grouping the " + \
+                        "ones for the same seed so the server can reuse their shared prefix")
     parser.add_argument('-j', '--jobs', type=int, default=16,
-                        help='Number of inference jobs to run in parallel')
+                        help='Maximum number of inference requests in flight per endpoint')
+    parser.add_argument('--no-adaptive-jobs', action='store_true',
+                        help='Always keep --jobs requests in flight instead of adapting ' + \
+                        'the number to the load of the inference server')
+    parser.add_argument('--initial-jobs', type=int, default=4,
+                        help='Number of requests in flight per endpoint to start with when adapting')
+    parser.add_argument('--target-queue-time', type=float, default=1.0,
+                        help='Back off when a request waits longer than this in the server queue (in seconds)')
+    parser.add_argument('--max-connections', type=int, default=256,
+                        help='Maximum number of open connections to the inference servers')
+    parser.add_argument('--request-timeout', type=float, default=None,
+                        help='Timeout for a single inference request (in seconds); None means no timeout')
     # Generation params
     parser.add_argument('-t', '--gen.temperature', type=float, default=0.2, help='Generation temperature')
     parser.add_argument('-m', '--gen.max-new-tokens', type=int, default=2048, help='Maximum number of tokens to generate')
@@ -288,40 +603,46 @@ def init_parser(elm):
     elm.subgroup_help['gen'] = 'Generation parameters'
 
 def main():
-    global ENDPOINT
-    global infilling_prompt
-    import sys
     from elmconfig import ELMFuzzConfig
     config = ELMFuzzConfig(parents={'genvariants_parallel': make_parser()})
     init_parser(config)
     args = config.parse_args()
 
-    try:
-        access_info = on_nsf_access()
-        ENDPOINT = args.model.endpoints[args.model_name] if access_info is None else access_info['endpoint']
-    except KeyError:
-        print(f'WARNING: no endpoint for model {args.model_name}, using default: {ENDPOINT}', file=sys.stderr)
-
-    info = model_info()
-    model = info['model_id']
-    if model != args.model_name:
-        config.parser.error(f'Expected model {args.model_name}, but {ENDPOINT} is actually {model}')
-
-    if model == 'bigcode/starcoder':
-        infilling_prompt = infilling_prompt_starcoder
-    elif model in ('codellama/CodeLlama-13b-hf',
-                   'codellama/CodeLlama-7b-hf'):
-        infilling_prompt = infilling_prompt_llama
+    if args.all_models:
+        if not args.model.names:
+            config.parser.error('--all-models needs model.names to be set')
+        models = list(args.model.names)
+        if len(models) > 1 and '{MODEL}' not in args.output_dir:
+            config.parser.error('With several models, --output_dir needs a {MODEL} placeholder')
     else:
-        infilling_prompt = None
+        models = [args.model_name]
 
-    if infilling_prompt is None and not args.no_fim:
-        config.parser.error(f'Model {model} does not support FIM')
+    access_info = on_nsf_access()
+    replicas = {}
+    for model_name in models:
+        try:
+            endpoint = args.model.endpoints[model_name] if access_info is None else access_info['endpoint']
+        except (KeyError, TypeError):
+            print(f'WARNING: no endpoint for model {model_name}, using default: {ENDPOINT}', file=sys.stderr)
+            endpoint = ENDPOINT
+        replicas[model_name] = parse_replicas(endpoint)
+        for replica in replicas[model_name]:
+            model = model_info(replica)['model_id']
+            if model != model_name:
+                config.parser.error(f'Expected model {model_name}, but {replica} is actually {model}')
+
+    if args.meta_format == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            config.parser.error('--meta-format zstd needs the zstandard package')
     if args.no_completion and args.no_fim and args.no_splice:
         config.parser.error(f'Nothing to do')
-
-    os.makedirs(args.output_dir, exist_ok=True)
-    os.makedirs(args.log_dir, exist_ok=True)
+    for model in models:
+        if get_infilling_prompt(model) is None and not args.no_fim:
+            config.parser.error(f'Model {model} does not support FIM')
+        os.makedirs(model_dir(args.output_dir, model), exist_ok=True)
+        os.makedirs(model_dir(args.log_dir, model), exist_ok=True)
 
     generators = []
     if not args.no_completion:
@@ -333,27 +654,56 @@ def main():
     # generators += ['continue']
 
     # Print the number of variants we'll generate so that the next
-    # stage (genoutputs) knows how many to expect.
-    print(len(args.files) * args.num_variants, flush=True)
-
-    worklist = []
-    i = 0
-    for _ in range(args.num_variants):
-        for filename in args.files:
-            worklist.append((i, filename))
-            i += 1
-    # pbar = tqdm(total=len(worklist), desc='Generating', unit='variant')
-    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
-        futures = []
-        for i, filename in worklist:
-            future = executor.submit(generate_variant, i, generators, model, filename, args)
-            # future.add_done_callback(lambda _: pbar.update())
-            futures.append(future)
-        for future in as_completed(futures):
-            res = future.result()
-            if res is not None:
-                print(res, flush=True)
-    # pbar.close()
+    # stage (genoutputs) knows how many to expect. This is an upper bound:
+    # the pre-filter and failed requests can drop some, so the number
+    # actually written follows the variant paths at the end.
+    print(len(models) * len(args.files) * args.num_variants, flush=True)
+
+    if args.seed is None and args.seed_file is not None:
+        args.seed = persistent_seed(args.seed_file)
+    worklist = build_worklist(models, generators, SeedCorpus(args.files), args)
+    asyncio.run(generate_all(worklist, replicas, args))
+
+async def generate_all(worklist, replicas, args):
+    cache = None
+    if not args.no_cache:
+        cache = CompletionCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    async with TGIClient(
+        max_connections=args.max_connections,
+        max_per_endpoint=args.jobs,
+        timeout=args.request_timeout,
+        adaptive=not args.no_adaptive_jobs,
+        initial=args.initial_jobs,
+        target_queue_time=args.target_queue_time,
+    ) as client:
+        variant_filter = None if args.no_prefilter else VariantFilter()
+        meta_writer = MetaWriter(args.meta_format)
+        router = EndpointRouter(client, replicas)
+        start = time.monotonic()
+        tasks = [
+            asyncio.create_task(generate_variant(router, request, args, meta_writer, cache, variant_filter))
+            for request in worklist
+        ]
+        succeeded = 0
+        generated_tokens = 0
+        for task in asyncio.as_completed(tasks):
+            out_path, res = await task
+            if out_path is not None:
+                print(out_path, flush=True)
+                succeeded += 1
+                generated_tokens += res.get('details', {}).get('generated_tokens', 0)
+        elapsed = time.monotonic() - start
+        meta_writer.close()
+    print(f'{WRITTEN_PREFIX}{succeeded}', flush=True)
+    if elapsed > 0:
+        print(f'Generated {succeeded}/{len(worklist)} variants in {elapsed:.1f}s: '
+              f'{succeeded / elapsed:.2f} variants/s, {generated_tokens / elapsed:.1f} tokens/s',
+              file=sys.stderr, flush=True)
+    if variant_filter is not None:
+        print(variant_filter.summary(), file=sys.stderr, flush=True)
+    if cache is not None:
+        print(cache.summary(), file=sys.stderr, flush=True)
+        cache.evict()
 
 def on_nsf_access() -> dict[str, str] | None:
     if not 'ACCESS_INFO' in os.environ:
@@ -4,33 +4,20 @@ import argparse
 from collections import defaultdict
 import json
 from pathlib import Path
-import subprocess
-import tempfile
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import glob
 import os
 
+import covcache
+
 AFL_DIR = '/usr/bin'
-# ./afl-showmap -q -i {} -o {/}.cov -C -- ./gifread @@
-def afl_cov(showmap_path, prog, input_dir):
-    with tempfile.NamedTemporaryFile() as f:
-        cov_file = f.name
-        cmd = [showmap_path, '-q', '-i', input_dir, '-o', cov_file, '-m', 'none', '-C', '--', prog, '@@']
-        subprocess.run(
-            cmd,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            env={'AFL_QUIET': '1'},
-        )
-        with open(cov_file, 'r') as f:
-            return set(l.strip() for l in f)
 
 def make_parser():
     parser = argparse.ArgumentParser(description="Get coverage for generated inputs")
     parser.add_argument('gendir', help='Base directory for generated inputs, structure: gendir/[model]/[generator]/[files]')
-    parser.add_argument('-O', '--output', type=str, default='output.json',
-                        help='Output file where coverage will be written')
+    parser.add_argument('-O', '--output', type=str, default=None,
+                        help='Output file where coverage will be written as JSON; output.json if '
+                        'neither this nor --bitmap is given')
     parser.add_argument('-j', '--jobs', type=int, default=64,
                         help='Number of parallel jobs')
     parser.add_argument("--afl_dir", type=Path,
@@ -38,6 +25,13 @@ def make_parser():
                         default=Path(AFL_DIR))
     parser.add_argument('--real_feedback', default=False, action="store_true")
     parser.add_argument('--afl_timeout', type=int)
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='Append a digest of each generator\'s coverage to this output manifest')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='Directory of the per-input coverage cache (see covcache.py); only inputs '
+                        'that aren\'t in it are run')
+    parser.add_argument('--bitmap', type=str, default=None,
+                        help='Also write the coverage to this coverage store (see covmap.py)')
     return parser
 
 def init_parser(elm):
@@ -57,28 +51,28 @@ def main():
     covbin = args.target.covbin.expanduser()
     if not covbin:
         config.parser.error(f'Coverage binary not found at {args.target.covbin}')
-    combined_cov = {}
-    with ThreadPoolExecutor(max_workers=64) as executor:
-        worklist = []
-        for model in glob.glob(os.path.join(args.gendir, '*')):
-            for generator in glob.glob(os.path.join(model, '*')):
-                    worklist.append((
-                        os.path.basename(model),
-                        os.path.basename(generator),
-                        generator,
-                    ))
-        futures = {}
-        progress = (tqdm(total=len(worklist), desc='Coverage')
-                    if not ON_NSF_ACCESS else txdm(len(worklist), desc='Coverage'))
-        for model, generator, gendir in worklist:
-            future = executor.submit(afl_cov, showmap, covbin, gendir)
-            futures[future] = (model, generator, gendir)
-            future.add_done_callback(lambda _: progress.update())
-        for future in as_completed(futures):
-            model, generator, gendir = futures[future]
-            cov = future.result()
-            combined_cov[(model, generator)] = cov
-        progress.close()
+    worklist = []
+    for model in glob.glob(os.path.join(args.gendir, '*')):
+        for generator in glob.glob(os.path.join(model, '*')):
+                worklist.append((
+                    os.path.basename(model),
+                    os.path.basename(generator),
+                    generator,
+                ))
+    # Counts the inputs run; covcache.collect sets the total once it knows it
+    progress = (tqdm(total=0, desc='Coverage', unit='input')
+                if not ON_NSF_ACCESS else txdm(0, desc='Coverage', unit='input'))
+    # Inputs are run through a pool of afl-showmap work units balanced by size
+    # and demultiplexed back to their generators (see covcache.py)
+    gendirs = {(model, generator): gendir for model, generator, gendir in worklist}
+    if args.cache is not None:
+        with covcache.CoverageCache.for_target(args.cache, str(covbin)) as cache:
+            combined_cov = covcache.collect(str(showmap), str(covbin), gendirs, cache,
+                                            jobs=args.jobs, progress=progress)
+    else:
+        combined_cov = covcache.collect(str(showmap), str(covbin), gendirs,
+                                        jobs=args.jobs, progress=progress)
+    progress.close()
     # for (model, generator), cov in combined_cov.items():
     #     print(f'{model:>20} {generator} {len(cov)}')
     cov_dict = {}
@@ -86,8 +80,16 @@ def main():
         if model not in cov_dict:
             cov_dict[model] = {}
         cov_dict[model][generator] = list(cov)
-    with open(args.output, 'w') as f:
-        json.dump(cov_dict, f)
+    if args.output is not None or args.bitmap is None:
+        with open(args.output or 'output.json', 'w') as f:
+            json.dump(cov_dict, f)
+    if args.bitmap is not None:
+        from covmap import CoverageTable
+        CoverageTable.from_dict(cov_dict, with_hits=True).save(args.bitmap)
+    if args.manifest is not None:
+        from outputmanifest import OutputManifest
+        with OutputManifest(args.manifest) as manifest:
+            manifest.add_coverage(cov_dict)
         
 ON_NSF_ACCESS = False
 
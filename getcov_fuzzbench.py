@@ -20,14 +20,41 @@ def on_nsf_access() -> dict[str, str] | None:
         'sif_root': sif_root,
     }
 
+def record_coverage(covfile: str, manifest: str | None, bitmap: str | None):
+    if bitmap is not None:
+        from covmap import CoverageTable
+        CoverageTable.from_json(covfile, with_hits=True).save(bitmap)
+    if manifest is not None:
+        import json
+        from outputmanifest import OutputManifest
+        with open(covfile) as f, OutputManifest(manifest) as m:
+            m.add_coverage(json.load(f))
+
 @click.command()
 @click.option('--image', type=str, required=True)
 @click.option('--input', type=str, required=True)
 @click.option('--persist/--no-persist', type=bool, default=False)
 @click.option('--covfile', type=str, default='./cov.json')
 @click.option('-j', 'parallel_num', type=int, default=64, required=False)
+@click.option('--manifest', type=str, default=None,
+              help="Append a digest of each generator's coverage to this output manifest")
+@click.option('--tmp-prefix', type=str, default=None,
+              help='Prefix for the temporary directory the input is moved to; putting it on the ' + \
+              'same filesystem as the input makes the move a rename')
+@click.option('--bitmap', type=str, default=None,
+              help='Also write the coverage to this coverage store (see covmap.py)')
+@click.option('--service', 'service_spool', type=str, default=None,
+              help='Measure coverage with a long-running service (see elm_covservice.py) fed through ' + \
+              'this spool directory, starting it if it is not running, instead of one container per call')
+@click.option('--service-root', type=str, default=None,
+              help='Directory to bind-mount into the service container, under which every input will be; ' + \
+              'defaults to the parent of the input')
+@click.option('--service-local', 'service_script', type=str, default=None,
+              help='Run the service on the host with this coverage script rather than in the image')
 @watch(mailogger)
-def main(image: str, input: str, persist: bool, covfile: str, parallel_num: int):
+def main(image: str, input: str, persist: bool, covfile: str, parallel_num: int,
+         manifest: str | None, tmp_prefix: str | None, bitmap: str | None, service_spool: str | None,
+         service_root: str | None, service_script: str | None):
     covbin = get_config('target.covbin')
     if isinstance(covbin, list):
         covbin_str = ' '.join(covbin)
@@ -37,13 +64,33 @@ def main(image: str, input: str, persist: bool, covfile: str, parallel_num: int)
     real_feedback = get_config('cli.getcov.real_feedback') == 'true'
     afl_timeout = int(get_config('cli.getcov.afl_timeout'))
     
+    if service_spool is not None:
+        # Inputs are read in place through the bind mount, so nothing is moved
+        import elm_covservice
+        root = os.path.abspath(service_root if service_root is not None else os.path.dirname(os.path.abspath(input)))
+        if service_script is not None:
+            elm_covservice.start_service(service_spool, [root], script=os.path.abspath(service_script))
+        else:
+            elm_covservice.start_service(service_spool, [root], image=image,
+                                         sif_root=access_info['sif_root'] if access_info is not None else None)
+        args = ['--input', os.path.abspath(input), '-j', str(parallel_num), f'--prog={covbin_str}',
+                '--real-feedback', str(real_feedback), f'--afl-timeout={afl_timeout}']
+        elapsed = elm_covservice.run_job(os.path.abspath(service_spool), args, covfile)
+        print(f'Coverage measured by the service in {elapsed:.1f}s', file=sys.stderr)
+        # Same as the per-call container, which consumes the input
+        shutil.rmtree(input, ignore_errors=True)
+        record_coverage(covfile, manifest, bitmap)
+        return
+
     cwd = os.path.dirname(os.path.abspath(__file__))
-    if access_info is not None:
+    if tmp_prefix is not None:
+        prefix = tmp_prefix
+    elif access_info is not None:
         prefix = os.path.join(cwd, 'tmp', 'fuzzdata') + '/'
     else:
         prefix = '/tmp/fuzzdata/'
-    if not os.path.exists(prefix):
-        os.makedirs(prefix)
+    if not os.path.exists(os.path.dirname(prefix)):
+        os.makedirs(os.path.dirname(prefix))
     
     with tempfile.TemporaryDirectory(prefix=prefix) as tmpdir:
         target_dir = os.path.join(tmpdir, 'input')
@@ -71,6 +118,7 @@ def main(image: str, input: str, persist: bool, covfile: str, parallel_num: int)
         print(' '.join(cmd))
         subprocess.run(cmd, check=True, stdout=sys.stdout, stderr=sys.stderr)
         shutil.copy(f'{tmpdir}/cov', covfile)
+    record_coverage(covfile, manifest, bitmap)
     if os.path.exists(tmpdir):
         shutil.rmtree(tmpdir, ignore_errors=True)
 
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Persistent cache of file hashes, keyed by (path, size, mtime), so that
+# repeated passes over the same output tree only hash files that are new or
+# have changed. Entries are appended to a TSV file as
+# "<sha256>\t<size>\t<mtime_ns>\t<path>"; later entries for a path win.
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import mmap
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+def hash_file(path: str) -> str:
+    """sha256 of a file, read through mmap"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return hashlib.sha256(m).hexdigest()
+
+def _hash_files(paths: List[str]) -> List[Optional[str]]:
+    res = []
+    for path in paths:
+        try:
+            res.append(hash_file(path))
+        except FileNotFoundError:
+            res.append(None)
+    return res
+
+class FileHashCache:
+    """Hashes of files, cached in the TSV file at `path`."""
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Tuple[int, int, str]] = {}
+        self.lines = 0
+        try:
+            with open(path, errors='surrogateescape') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t', 3)
+                    if len(parts) != 4:
+                        # Torn last line from an interrupted write
+                        continue
+                    digest, size, mtime, fpath = parts
+                    self.entries[fpath] = (int(size), int(mtime), digest)
+                    self.lines += 1
+        except FileNotFoundError:
+            pass
+
+    def get(self, path: str, st: os.stat_result) -> Optional[str]:
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+            return None
+        return entry[2]
+
+    def hash_all(self, files: Iterable[Tuple[str, os.stat_result]],
+                 jobs: Optional[int] = None, chunk_size: int = 256, progress=None) -> Dict[str, str]:
+        """Hashes of `files` (path, stat) pairs, from the cache where it is
+        up to date and otherwise computed in a process pool and cached."""
+        hashes = {}
+        todo = []
+        for path, st in files:
+            digest = self.get(path, st)
+            if digest is None:
+                todo.append((path, st))
+            else:
+                hashes[path] = digest
+        if progress is not None:
+            progress.update(len(hashes))
+        if not todo:
+            return hashes
+        chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=jobs) as executor, \
+             open(self.path, 'a', errors='surrogateescape') as f:
+            for chunk, digests in zip(chunks, executor.map(_hash_files, [[p for p, _ in c] for c in chunks])):
+                for (path, st), digest in zip(chunk, digests):
+                    if digest is None:
+                        continue
+                    hashes[path] = digest
+                    self.entries[path] = (st.st_size, st.st_mtime_ns, digest)
+                    print(f'{digest}\t{st.st_size}\t{st.st_mtime_ns}\t{path}', file=f)
+                    self.lines += 1
+                if progress is not None:
+                    progress.update(len(chunk))
+        self.compact()
+        return hashes
+
+    def compact(self):
+        """Rewrite the cache without superseded entries once they make up most of it"""
+        if self.lines <= 2 * len(self.entries):
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', errors='surrogateescape') as f:
+            for path, (size, mtime, digest) in self.entries.items():
+                print(f'{digest}\t{size}\t{mtime}\t{path}', file=f)
+        os.replace(tmp, self.path)
+        self.lines = len(self.entries)
+        print(f'Compacted file hash cache {self.path} to {self.lines} entries', file=sys.stderr)
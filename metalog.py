@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# Append-only log of variant metadata: one JSON record per line in
+# meta.jsonl (or one zstd frame per record in meta.jsonl.zst), plus an
+# index meta.jsonl.idx with one "<key>\t<offset>\t<length>" line per record
+# so that a single variant's metadata can be read without scanning the log.
+
+import json
+import os
+import sys
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOG_NAME = 'meta.jsonl'
+INDEX_SUFFIX = '.idx'
+
+def variant_key(model: str, filename: str) -> str:
+    """Key of a variant's record: the model's short name and the variant's file name"""
+    return f'{os.path.basename(model)}/{os.path.basename(filename)}'
+
+class MetaLog:
+    """Writer for a metadata log in `log_dir`."""
+    def __init__(self, log_dir: str, compress: bool = False, level: int = 3):
+        if compress and zstandard is None:
+            raise RuntimeError('zstandard is not installed; cannot write a compressed metadata log')
+        os.makedirs(log_dir, exist_ok=True)
+        self.path = os.path.join(log_dir, LOG_NAME + ('.zst' if compress else ''))
+        self.log = open(self.path, 'ab')
+        self.index = open(self.path + INDEX_SUFFIX, 'a')
+        self.compressor = zstandard.ZstdCompressor(level=level) if compress else None
+
+    def append(self, key: str, record: dict):
+        data = (json.dumps({'id': key, **record}) + '\n').encode('utf-8', errors='surrogatepass')
+        if self.compressor is not None:
+            # One frame per record, so each one can be decompressed on its own
+            data = self.compressor.compress(data)
+        offset = self.log.seek(0, os.SEEK_END)
+        self.log.write(data)
+        self.log.flush()
+        self.index.write(f'{key}\t{offset}\t{len(data)}\n')
+        self.index.flush()
+
+    def close(self):
+        self.log.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class MetaLogReader:
+    """Random access to the records of a metadata log in `log_dir`.
+
+    If the directory has no log but has the older one-JSON-file-per-variant
+    layout, `get` falls back to reading `<variant file name>.json`.
+    """
+    def __init__(self, log_dir: str):
+        self.log_dir = log_dir
+        self.path = None
+        self.compressed = False
+        for name, compressed in ((LOG_NAME, False), (LOG_NAME + '.zst', True)):
+            if os.path.exists(os.path.join(log_dir, name)):
+                self.path = os.path.join(log_dir, name)
+                self.compressed = compressed
+                break
+        if self.compressed and zstandard is None:
+            raise RuntimeError(f'zstandard is not installed; cannot read {self.path}')
+        self.index: Dict[str, Tuple[int, int]] = {}
+        if self.path is not None:
+            self._load_index()
+
+    def _load_index(self):
+        index_path = self.path + INDEX_SUFFIX
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t')
+                    if len(parts) != 3:
+                        # Torn last line from an interrupted write
+                        continue
+                    key, offset, length = parts
+                    # Later records for the same key win
+                    self.index[key] = (int(offset), int(length))
+        elif not self.compressed:
+            # Rebuild the index by scanning the log
+            with open(self.path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        key = json.loads(line)['id']
+                    except (ValueError, KeyError):
+                        key = None
+                    if key is not None:
+                        self.index[key] = (offset, len(line))
+                    offset += len(line)
+        else:
+            print(f'WARNING: no index for {self.path}', file=sys.stderr)
+
+    def _decode(self, data: bytes) -> dict:
+        if self.compressed:
+            data = zstandard.ZstdDecompressor().decompress(data)
+        return json.loads(data)
+
+    def keys(self):
+        return self.index.keys()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key: str):
+        return key in self.index
+
+    def get(self, key: str) -> Optional[dict]:
+        if key not in self.index:
+            legacy = os.path.join(self.log_dir, os.path.basename(key) + '.json')
+            if os.path.exists(legacy):
+                with open(legacy) as f:
+                    return json.load(f)
+            return None
+        offset, length = self.index[key]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return self._decode(f.read(length))
+
+    def __getitem__(self, key: str) -> dict:
+        res = self.get(key)
+        if res is None:
+            raise KeyError(key)
+        return res
+
+    def __iter__(self) -> Iterator[dict]:
+        """Iterate over all records in the order they were written"""
+        if self.path is None:
+            return
+        with open(self.path, 'rb') as f:
+            if not self.compressed:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+                return
+            reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            buf = b''
+            while True:
+                chunk = reader.read(1 << 16)
+                if not chunk:
+                    break
+                buf += chunk
+                *lines, buf = buf.split(b'\n')
+                for line in lines:
+                    yield json.loads(line)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Look up or dump variant metadata')
+    parser.add_argument('log_dir', type=str)
+    parser.add_argument('keys', type=str, nargs='*',
+                        help='Variants to look up (<model>/<variant file>); dump all records if none')
+    args = parser.parse_args()
+    reader = MetaLogReader(args.log_dir)
+    if args.keys:
+        for key in args.keys:
+            print(json.dumps(reader[key]))
+    else:
+        for record in reader:
+            print(json.dumps(record))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+# Manifest of generated outputs, for runs that don't keep the outputs.
+#
+# The driver feeds each generator a seeded RNG stream, so an output is fully
+# determined by its variant and its rng seed. Instead of keeping the files,
+# genoutputs appends one JSON line per output to the manifest (variant path
+# and hash, function, rng seed, size), and getcov appends one line per
+# generator with a digest of its coverage. `regenerate` rebuilds outputs
+# from their records, e.g. to look at an interesting input again.
+#
+# Record types:
+#   {"type": "driver", "args": {...}}     driver options for the outputs that follow
+#   {"type": "output", "model", "generator", "name", "variant",
+#    "variant_sha256", "function", "rng_seed", "size"}
+#   {"type": "coverage", "model", "generator", "edges", "coverage_sha256"}
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from hashcache import hash_file
+
+# Driver options needed to run a generator the same way again
+DRIVER_ARGS = ('function_name', 'timeout', 'cpu_timeout', 'size_limit', 'max_mem', 'output_suffix')
+
+def coverage_digest(edges) -> str:
+    """Digest of a coverage set that doesn't depend on the order of the edges"""
+    h = hashlib.sha256()
+    for edge in sorted(edges):
+        h.update(str(edge).encode())
+        h.update(b'\n')
+    return h.hexdigest()
+
+def output_key(model: str, generator: str, name: str) -> str:
+    return f'{model}/{generator}/{name}'
+
+class OutputManifest:
+    """Appends records to the manifest at `path`."""
+    def __init__(self, path: str):
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.path = path
+        self.f = open(path, 'a')
+        self.variant_hashes: Dict[str, str] = {}
+
+    def _write(self, record: dict):
+        print(json.dumps(record), file=self.f, flush=True)
+
+    def add_driver_args(self, driver_args):
+        self._write({
+            'type': 'driver',
+            'args': {k: getattr(driver_args, k, None) for k in DRIVER_ARGS},
+        })
+
+    def add_outputs(self, module_path: str, worker_dir: str, gen_results: List[dict]):
+        """Record the successful outputs in a module's driver results. Must be
+        called while the outputs still exist, since their sizes are recorded."""
+        variant = os.path.abspath(module_path)
+        if variant not in self.variant_hashes:
+            self.variant_hashes[variant] = hash_file(variant)
+        model = os.path.basename(os.path.dirname(worker_dir))
+        generator = os.path.basename(worker_dir)
+        for res in gen_results:
+            if res.get('result_type') != 'Success' or not res.get('output_file'):
+                continue
+            try:
+                size = os.path.getsize(res['output_file'])
+            except FileNotFoundError:
+                continue
+            self._write({
+                'type': 'output',
+                'model': model,
+                'generator': generator,
+                'name': os.path.basename(res['output_file']),
+                'variant': variant,
+                'variant_sha256': self.variant_hashes[variant],
+                'function': res.get('function_name'),
+                'rng_seed': res.get('rng_seed'),
+                'size': size,
+            })
+
+    def add_coverage(self, cov_dict: Dict[str, Dict[str, list]]):
+        """Record a digest of each generator's coverage ({model: {generator: edges}})"""
+        for model, generators in cov_dict.items():
+            for generator, edges in generators.items():
+                self._write({
+                    'type': 'coverage',
+                    'model': model,
+                    'generator': generator,
+                    'edges': len(edges),
+                    'coverage_sha256': coverage_digest(edges),
+                })
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def read_manifest(path: str) -> Iterator[Tuple[dict, dict]]:
+    """Yield (record, driver args in effect for it) for every record"""
+    driver_args = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn last line from an interrupted run
+                continue
+            if record.get('type') == 'driver':
+                driver_args = record['args']
+            yield record, driver_args
+
+def _regenerate_variant(variant: str, sha256: str, jobs: List[Tuple[dict, dict, str]]):
+    """Run one variant's generator for each (record, driver args, output file).
+    Runs in its own process, since the driver imports the module globally."""
+    import driver
+    results = []
+    if hash_file(variant) != sha256:
+        return [(rec, f'{variant} has changed since the output was generated') for rec, _, _ in jobs]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        function = None
+        for rec, driver_args, output_file in jobs:
+            # The driver names the module in the errors it reports
+            args = argparse.Namespace(**driver_args, module_path=variant)
+            if function is None:
+                function = driver.get_function(variant, rec['function'], args)
+                if isinstance(function, driver.Result):
+                    return [(rec, f'could not import {variant}') for rec, _, _ in jobs]
+            res = driver.generate_one(output_file, function, args, rng_seed=rec['rng_seed'])
+            if res.result_type != driver.GenResult.Success:
+                results.append((rec, f'generator failed: {res.result_type.value}'))
+            elif os.path.getsize(output_file) != rec['size']:
+                results.append((rec, f'size is {os.path.getsize(output_file)}, expected {rec["size"]}'))
+            else:
+                results.append((rec, None))
+    return results
+
+def regenerate(manifest: str, names: List[str], output_dir: str, jobs: Optional[int] = None) -> int:
+    """Rebuild the outputs matching `names` (model/generator/name, or a suffix
+    of it; all outputs if empty) under output_dir/model/generator/. Returns the
+    number of outputs that could not be reproduced."""
+    def matches(key):
+        return not names or any(key == n or key.endswith('/' + n) for n in names)
+    by_variant: Dict[Tuple[str, str], list] = {}
+    for rec, driver_args in read_manifest(manifest):
+        if rec.get('type') != 'output':
+            continue
+        key = output_key(rec['model'], rec['generator'], rec['name'])
+        if not matches(key):
+            continue
+        output_file = os.path.abspath(os.path.join(output_dir, key))
+        by_variant.setdefault((rec['variant'], rec['variant_sha256']), []).append(
+            (rec, driver_args, output_file))
+    if not by_variant:
+        print(f'No outputs in {manifest} match {" ".join(names)}', file=sys.stderr)
+        return 1
+    failed = 0
+    # A fresh process per variant, since the driver imports each one as generator_module
+    with multiprocessing.Pool(jobs, maxtasksperchild=1) as pool:
+        pending = [pool.apply_async(_regenerate_variant, (variant, sha256, work))
+                   for (variant, sha256), work in by_variant.items()]
+        for result in pending:
+            for rec, error in result.get():
+                key = output_key(rec['model'], rec['generator'], rec['name'])
+                if error is None:
+                    print(os.path.join(output_dir, key))
+                else:
+                    failed += 1
+                    print(f'WARNING: {key}: {error}', file=sys.stderr)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description='Work with a manifest of generated outputs')
+    subparsers = parser.add_subparsers(dest='cmd', required=True)
+    p = subparsers.add_parser('regenerate', help='Rebuild outputs from their variant and rng seed')
+    p.add_argument('manifest', type=str)
+    p.add_argument('names', type=str, nargs='*',
+                   help='Outputs to rebuild, as model/generator/name or a suffix of it')
+    p.add_argument('--all', action='store_true', help='Rebuild every output in the manifest')
+    p.add_argument('-o', '--output-dir', type=str, default='.',
+                   help='Outputs are written to OUTPUT_DIR/model/generator/name')
+    p.add_argument('-j', '--jobs', type=int, default=None,
+                   help='Number of variants to run in parallel; None means ncpu')
+    p = subparsers.add_parser('list', help='List the outputs and coverage digests in a manifest')
+    p.add_argument('manifest', type=str)
+    args = parser.parse_args()
+
+    if args.cmd == 'regenerate':
+        if not args.names and not args.all:
+            parser.error('Give the outputs to rebuild, or --all')
+        failed = regenerate(args.manifest, [] if args.all else args.names, args.output_dir, args.jobs)
+        sys.exit(1 if failed else 0)
+    elif args.cmd == 'list':
+        for rec, _ in read_manifest(args.manifest):
+            if rec.get('type') == 'output':
+                key = output_key(rec['model'], rec['generator'], rec['name'])
+                print(f'{key}\t{rec["size"]}\t{rec["rng_seed"]}\t{rec["variant_sha256"][:12]}')
+            elif rec.get('type') == 'coverage':
+                print(f'{rec["model"]}/{rec["generator"]}\tcoverage\t{rec["edges"]}\t{rec["coverage_sha256"][:12]}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+# Compact, columnar result log for the driver and genoutputs.
+#
+# A JSONL result log repeats every key, the run's args and mostly-empty
+# stdout/stderr on each line. This format writes an optional header (the
+# first line of a genoutputs log) once, then the results in chunks of up to
+# CHUNK_SIZE rows. Each chunk stores every field as a typed column (array
+# module type codes, native byte order) and all strings in a per-chunk string
+# table, so repeated values like the args, module path and empty output are
+# stored once per chunk. Records that don't have the usual Result shape are
+# kept whole as JSON in the `raw` column.
+#
+# Layout:
+#   MAGIC, uint32 header length, header JSON
+#   per chunk: b'CHNK', uint32 rows, uint32 strings, uint32 string bytes,
+#              uint32 string offsets[strings + 1], string bytes, columns
+#
+# iter_records() reads either this format or JSONL and yields the same
+# dicts json.loads would give for each line of the equivalent JSONL log;
+# `python resultlog.py LOG` converts a log back to JSONL.
+
+from array import array
+import json
+import math
+import struct
+import sys
+import time
+from typing import Iterator, Optional
+
+MAGIC = b'ELMRLOG\x01'
+CHUNK_MAGIC = b'CHNK'
+CHUNK_SIZE = 1024
+NULL_STR = 0xFFFFFFFF
+NULL_INT = -(1 << 63)
+
+RECORD_KEYS = ('result_type', 'error', 'data', 'module_path', 'function_name',
+               'output_file', 'args', 'rng_seed')
+DATA_KEYS = ('time_taken', 'memory_used', 'stdout', 'stderr', 'cpu_time')
+
+# (column, array type code); 'I' columns are string table indices
+COLUMNS = (
+    ('raw', 'I'),
+    ('result_type', 'I'),
+    ('error', 'I'),
+    ('has_data', 'B'),
+    ('time_taken', 'd'),
+    ('memory_used', 'q'),
+    ('stdout', 'I'),
+    ('stderr', 'I'),
+    ('cpu_time', 'd'),
+    ('module_path', 'I'),
+    ('function_name', 'I'),
+    ('output_file', 'I'),
+    ('args', 'I'),
+    ('has_rng_seed', 'B'),
+    ('rng_seed', 'Q'),
+)
+
+def _json_default(o):
+    return o.__dict__ if hasattr(o, '__dict__') else str(o)
+
+def _is_float(v):
+    return v is None or (isinstance(v, float) and not math.isnan(v))
+
+def _is_int(v, lo, hi):
+    return v is None or (type(v) is int and lo <= v < hi)
+
+def _is_str(v):
+    return v is None or isinstance(v, str)
+
+def _has_columns(record: dict) -> bool:
+    """Whether record can be stored in columns and read back unchanged"""
+    if tuple(record.keys()) != RECORD_KEYS:
+        return False
+    data = record['data']
+    if data is not None:
+        if not isinstance(data, dict) or tuple(data.keys()) != DATA_KEYS:
+            return False
+        if not (_is_float(data['time_taken']) and _is_float(data['cpu_time'])
+                and _is_int(data['memory_used'], NULL_INT + 1, 1 << 63)
+                and _is_str(data['stdout']) and _is_str(data['stderr'])):
+            return False
+    return (_is_str(record['result_type']) and _is_str(record['module_path'])
+            and _is_str(record['function_name']) and _is_str(record['output_file'])
+            and _is_int(record['rng_seed'], 0, 1 << 64))
+
+class ResultLogWriter:
+    """Writes result records (dicts, as json.loads would give them for a JSONL
+    log; Namespace args are fine) to a columnar log at `path`. A chunk is
+    written once it is full or `flush_interval` seconds after the last one,
+    so a killed driver loses at most that much."""
+    def __init__(self, path: str, header: Optional[dict] = None,
+                 chunk_size: int = CHUNK_SIZE, flush_interval: float = 1.0):
+        self.f = open(path, 'wb')
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        header_data = json.dumps({
+            'byteorder': sys.byteorder,
+            'header': header,
+        }, default=_json_default).encode()
+        self.f.write(MAGIC + struct.pack('<I', len(header_data)) + header_data)
+        self.f.flush()
+        # The args object is usually the same for every record; only dump it once
+        self._last_args = (None, None)
+        self._reset()
+
+    def _reset(self):
+        self.columns = {name: array(code) for name, code in COLUMNS}
+        self.strings = {}
+        self.rows = 0
+        self.last_flush = time.monotonic()
+
+    def _str(self, s: Optional[str]) -> int:
+        if s is None:
+            return NULL_STR
+        idx = self.strings.get(s)
+        if idx is None:
+            idx = self.strings[s] = len(self.strings)
+        return idx
+
+    def _json(self, obj) -> int:
+        if obj is None:
+            return NULL_STR
+        return self._str(json.dumps(obj, default=_json_default))
+
+    def _args(self, args) -> int:
+        if args is None or self._last_args[0] is not args:
+            self._last_args = (args, None if args is None else json.dumps(args, default=_json_default))
+        return self._str(self._last_args[1])
+
+    def append(self, record: dict):
+        c = self.columns
+        data = record.get('data')
+        if not _has_columns(record):
+            c['raw'].append(self._str(json.dumps(record, default=_json_default)))
+            c['result_type'].append(NULL_STR)
+            c['error'].append(NULL_STR)
+            c['has_data'].append(0)
+            data = None
+        else:
+            c['raw'].append(NULL_STR)
+            c['result_type'].append(self._str(record['result_type']))
+            c['error'].append(self._json(record['error']))
+            c['has_data'].append(data is not None)
+        if data is not None:
+            c['time_taken'].append(math.nan if data['time_taken'] is None else data['time_taken'])
+            c['memory_used'].append(NULL_INT if data['memory_used'] is None else data['memory_used'])
+            c['stdout'].append(self._str(data['stdout']))
+            c['stderr'].append(self._str(data['stderr']))
+            c['cpu_time'].append(math.nan if data['cpu_time'] is None else data['cpu_time'])
+        else:
+            c['time_taken'].append(math.nan)
+            c['memory_used'].append(NULL_INT)
+            c['stdout'].append(NULL_STR)
+            c['stderr'].append(NULL_STR)
+            c['cpu_time'].append(math.nan)
+        if c['raw'][-1] == NULL_STR:
+            c['module_path'].append(self._str(record['module_path']))
+            c['function_name'].append(self._str(record['function_name']))
+            c['output_file'].append(self._str(record['output_file']))
+            c['args'].append(self._args(record['args']))
+            c['has_rng_seed'].append(record['rng_seed'] is not None)
+            c['rng_seed'].append(record['rng_seed'] or 0)
+        else:
+            for name in ('module_path', 'function_name', 'output_file', 'args'):
+                c[name].append(NULL_STR)
+            c['has_rng_seed'].append(0)
+            c['rng_seed'].append(0)
+        self.rows += 1
+        if self.rows >= self.chunk_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.rows == 0:
+            return
+        blobs = [s.encode('utf-8', errors='surrogatepass') for s in self.strings]
+        offsets = array('I', [0])
+        for b in blobs:
+            offsets.append(offsets[-1] + len(b))
+        parts = [
+            CHUNK_MAGIC,
+            struct.pack('<III', self.rows, len(blobs), offsets[-1]),
+            offsets.tobytes(),
+            b''.join(blobs),
+        ]
+        parts.extend(self.columns[name].tobytes() for name, _ in COLUMNS)
+        self.f.write(b''.join(parts))
+        self.f.flush()
+        self._reset()
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def is_columnar(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def _read_chunks(f, swap: bool) -> Iterator[dict]:
+    while True:
+        head = f.read(16)
+        if len(head) < 16 or head[:4] != CHUNK_MAGIC:
+            # End of the log, or a chunk cut off by a kill
+            return
+        rows, nstrings, nbytes = struct.unpack('<III', head[4:])
+        offsets = array('I')
+        raw = f.read(4 * (nstrings + 1))
+        blob = f.read(nbytes)
+        if len(raw) < 4 * (nstrings + 1) or len(blob) < nbytes:
+            return
+        offsets.frombytes(raw)
+        if swap:
+            offsets.byteswap()
+        strings = [blob[offsets[i]:offsets[i + 1]].decode('utf-8', errors='surrogatepass')
+                   for i in range(nstrings)]
+        cols = {}
+        for name, code in COLUMNS:
+            col = array(code)
+            data = f.read(rows * col.itemsize)
+            if len(data) < rows * col.itemsize:
+                return
+            col.frombytes(data)
+            if swap:
+                col.byteswap()
+            cols[name] = col
+
+        def s(i):
+            return None if i == NULL_STR else strings[i]
+        def j(i):
+            return None if i == NULL_STR else json.loads(strings[i])
+        for r in range(rows):
+            if cols['raw'][r] != NULL_STR:
+                yield json.loads(strings[cols['raw'][r]])
+                continue
+            data = None
+            if cols['has_data'][r]:
+                time_taken = cols['time_taken'][r]
+                memory_used = cols['memory_used'][r]
+                cpu_time = cols['cpu_time'][r]
+                data = {
+                    'time_taken': None if math.isnan(time_taken) else time_taken,
+                    'memory_used': None if memory_used == NULL_INT else memory_used,
+                    'stdout': s(cols['stdout'][r]),
+                    'stderr': s(cols['stderr'][r]),
+                    'cpu_time': None if math.isnan(cpu_time) else cpu_time,
+                }
+            yield {
+                'result_type': s(cols['result_type'][r]),
+                'error': j(cols['error'][r]),
+                'data': data,
+                'module_path': s(cols['module_path'][r]),
+                'function_name': s(cols['function_name'][r]),
+                'output_file': s(cols['output_file'][r]),
+                'args': j(cols['args'][r]),
+                'rng_seed': cols['rng_seed'][r] if cols['has_rng_seed'][r] else None,
+            }
+
+def iter_records(path: str) -> Iterator[dict]:
+    """Records of a columnar or JSONL log, in order, the header (if any) first"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line from a killed writer
+                    continue
+                yield record
+            return
+        (length,) = struct.unpack('<I', f.read(4))
+        meta = json.loads(f.read(length))
+        if meta['header'] is not None:
+            yield meta['header']
+        yield from _read_chunks(f, meta['byteorder'] != sys.byteorder)
+
+def to_jsonl(path: str, out):
+    for record in iter_records(path):
+        print(json.dumps(record), file=out)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert a columnar result log to JSONL')
+    parser.add_argument('log', type=str)
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Output file; stdout if not given')
+    args = parser.parse_args()
+    if args.output is None:
+        to_jsonl(args.log, sys.stdout)
+    else:
+        with open(args.output, 'w') as out:
+            to_jsonl(args.log, out)
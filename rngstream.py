@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Seeded, replayable stand-in for /dev/urandom.
+#
+# The stream is SHAKE-256 in counter mode: block k is the first BLOCK_SIZE
+# bytes of SHAKE-256(seed || k). hashlib computes a whole block at a time
+# and io.BufferedReader serves small reads from it, so reading costs about
+# the same as a buffered /dev/urandom without ever making a syscall. The
+# same seed always gives the same bytes, so any output can be regenerated
+# from its seed.
+
+import hashlib
+import io
+import os
+
+BLOCK_SIZE = 1 << 16
+
+def new_seed() -> int:
+    """A fresh random 64-bit seed"""
+    return int.from_bytes(os.urandom(8), 'little')
+
+def derive_seed(seed: int, *keys) -> int:
+    """Derive an independent 64-bit seed for `keys` (e.g. an input name and
+    an iteration number) from a run's seed."""
+    h = hashlib.sha256(str(seed).encode())
+    for key in keys:
+        h.update(b'\0' + str(key).encode())
+    return int.from_bytes(h.digest()[:8], 'little')
+
+class RNGStream(io.RawIOBase):
+    """Raw stream of the bytes for `seed`; use open_stream() to get a
+    buffered one, whose small reads don't go through Python code."""
+    def __init__(self, seed: int):
+        super().__init__()
+        self.seed = seed
+        self._key = seed.to_bytes(8, 'little')
+        self._counter = 0
+        self._buf = b''
+        self._pos = 0
+
+    def _refill(self):
+        h = hashlib.shake_256(self._key)
+        h.update(self._counter.to_bytes(8, 'little'))
+        self._buf = h.digest(BLOCK_SIZE)
+        self._pos = 0
+        self._counter += 1
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._pos == len(self._buf):
+            self._refill()
+        n = min(len(b), len(self._buf) - self._pos)
+        b[:n] = self._buf[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def readall(self) -> bytes:
+        raise ValueError('RNGStream is endless; read() needs a size')
+
+def open_stream(seed: int) -> io.BufferedReader:
+    """A buffered, file-like RNG for `seed`, usable in place of
+    open('/dev/urandom', 'rb')."""
+    return io.BufferedReader(RNGStream(seed), buffer_size=BLOCK_SIZE)
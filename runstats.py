@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Live statistics for a genoutputs or driver run.
+#
+# RunStats keeps the same counts generate_stats computes from the log
+# (result types per generation type) but updates them as results arrive, so
+# they can be watched while the run is going: written as JSON to a status
+# file every few seconds, and/or served at http://HOST:PORT/status. Besides
+# the totals, the status has the success rate of the most recent results,
+# which is where a collapsing generation shows up first.
+#
+# `python runstats.py STATUS_FILE_OR_URL` prints a one-line summary.
+
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+class RunStats:
+    """Counts of result types per generation type, updated as results come in.
+    Thread-safe."""
+    def __init__(self, num_iterations: int = 1, total_modules: Optional[int] = None,
+                 window: int = 1000):
+        self.num_iterations = num_iterations
+        self.total_modules = total_modules
+        self.modules_done = 0
+        self.counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.recent = deque(maxlen=window)
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, gentype: str, result_type: str, n: int = 1):
+        with self.lock:
+            self.counts[gentype][result_type] += n
+            self.recent.extend([result_type == 'Success'] * min(n, self.recent.maxlen))
+
+    def add_module(self, gentype: str, results):
+        """Count one module's driver results; an ImportError counts for the
+        whole batch, as in generate_stats"""
+        for res in results:
+            if res.get('result_type') == 'ImportError':
+                self.add(gentype, 'ImportError', self.num_iterations)
+            else:
+                self.add(gentype, res.get('result_type', 'Error'))
+
+    def module_done(self):
+        """Count a module as finished, whether or not it produced results"""
+        with self.lock:
+            self.modules_done += 1
+
+    def by_gentype(self) -> Dict[str, Dict[str, int]]:
+        with self.lock:
+            return {k: dict(v) for k, v in self.counts.items()}
+
+    def combined(self) -> Dict[str, int]:
+        combined = defaultdict(int)
+        for stats in self.by_gentype().values():
+            for k, v in stats.items():
+                combined[k] += v
+        return dict(combined)
+
+    def snapshot(self) -> dict:
+        combined = self.combined()
+        total = sum(combined.values())
+        with self.lock:
+            recent = list(self.recent)
+            modules_done = self.modules_done
+        return {
+            'time': time.time(),
+            'elapsed': time.time() - self.started,
+            'modules_done': modules_done,
+            'modules_total': self.total_modules,
+            'stats': self.by_gentype(),
+            'combined': combined,
+            'total': total,
+            'success_rate': combined.get('Success', 0) / total if total else None,
+            'recent_success_rate': sum(recent) / len(recent) if recent else None,
+        }
+
+class StatusWriter:
+    """Writes a RunStats snapshot to `path` at most every `interval` seconds"""
+    def __init__(self, stats: RunStats, path: str, interval: float = 5.0):
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+        self.last = 0.0
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+    def update(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last < self.interval:
+            return
+        self.last = now
+        # Write atomically so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.stats.snapshot(), f)
+        os.replace(tmp, self.path)
+
+class StatusHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path not in ('/', '/status'):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.stats.snapshot()).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve_status(stats: RunStats, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serve snapshots of stats at http://host:port/status from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), StatusHandler)
+    server.daemon_threads = True
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f'Serving run status on http://{host}:{server.server_address[1]}/status', file=sys.stderr)
+    return server
+
+def format_status(status: dict) -> str:
+    def pct(x):
+        return '-' if x is None else f'{x*100:.1f}%'
+    modules = f'{status["modules_done"]}/{status["modules_total"] or "?"} modules'
+    return (f'{status["elapsed"]:.0f}s {modules} {status["total"]} results '
+            f'success {pct(status["success_rate"])} (recent {pct(status["recent_success_rate"])}) '
+            f'{status["combined"]}')
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Print the status of a running genoutputs or driver')
+    parser.add_argument('source', type=str, help='Status file or http://HOST:PORT/status URL')
+    args = parser.parse_args()
+    if args.source.startswith('http://'):
+        from urllib.request import urlopen
+        with urlopen(args.source) as r:
+            status = json.load(r)
+    else:
+        with open(args.source) as f:
+            status = json.load(f)
+    print(format_status(status))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Screening of generated outputs before coverage measurement.
+#
+# Coverage is measured by replaying every file under the output directory,
+# but empty files and byte-for-byte copies of an earlier output can't add
+# anything. OutputScreen is fed each module's driver results as they come
+# in and deletes those files. Outputs can also be grouped into power-of-two
+# size buckets, keeping at most bucket_cap per bucket for each variant.
+#
+# An output identical to one another variant already produced is credited to
+# that first variant, whose copy is kept, and the later copy is deleted. The
+# summary records, for each variant, how many of its outputs were dropped as
+# copies of each other variant's ("shared"). genoutputs scores the adaptive
+# budget on the outputs as generated, before screening, so a variant's
+# probe yield doesn't depend on which variant finished first.
+
+from collections import Counter, defaultdict
+import json
+import os
+from typing import Dict, List, Optional
+
+from hashcache import hash_file
+
+def size_bucket(size: int) -> int:
+    """Power-of-two size bucket: 0 for empty files, otherwise bit length"""
+    return size.bit_length()
+
+class OutputScreen:
+    def __init__(self, bucket_cap: Optional[int] = None):
+        self.bucket_cap = bucket_cap
+        # Content hash -> first variant to produce it, whose copy was kept
+        self.owners: Dict[bytes, str] = {}
+        self.variants: Dict[str, dict] = {}
+        self.totals = Counter()
+        self.buckets = Counter()
+
+    def screen(self, variant: str, gen_results: List[dict]) -> dict:
+        """Screen one variant's outputs (its driver results), deleting the
+        ones that are dropped. Returns the variant's counts."""
+        stats = self.variants.setdefault(variant, {
+            'kept': 0, 'empty': 0, 'dup_self': 0, 'dup_other': 0,
+            'over_bucket_cap': 0, 'shared': defaultdict(int),
+        })
+        per_bucket = Counter()
+        for res in gen_results:
+            path = res.get('output_file')
+            if res.get('result_type') != 'Success' or not path:
+                continue
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            if size == 0:
+                self._drop(path, stats, 'empty')
+                continue
+            digest = bytes.fromhex(hash_file(path))
+            owner = self.owners.get(digest)
+            if owner is not None:
+                if owner == variant:
+                    self._drop(path, stats, 'dup_self')
+                else:
+                    stats['shared'][owner] += 1
+                    self._drop(path, stats, 'dup_other')
+                continue
+            bucket = size_bucket(size)
+            if self.bucket_cap is not None and per_bucket[bucket] >= self.bucket_cap:
+                self._drop(path, stats, 'over_bucket_cap')
+                continue
+            per_bucket[bucket] += 1
+            self.buckets[bucket] += 1
+            self.owners[digest] = variant
+            stats['kept'] += 1
+            self.totals['kept'] += 1
+        return stats
+
+    def _drop(self, path: str, stats: dict, reason: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        stats[reason] += 1
+        self.totals[reason] += 1
+
+    def summary(self) -> dict:
+        return {
+            'totals': dict(self.totals),
+            'size_buckets': {f'<{1 << b}B' if b else 'empty': n for b, n in sorted(self.buckets.items())},
+            'variants': {
+                k: {**v, 'shared': dict(v['shared'])} for k, v in self.variants.items()
+            },
+        }
+
+    def write(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def describe(self) -> str:
+        t = self.totals
+        return (f"Screening: kept {t['kept']}, dropped {t['empty']} empty, "
+                f"{t['dup_self'] + t['dup_other']} duplicate ({t['dup_other']} across variants), "
+                f"{t['over_bucket_cap']} over the size bucket cap")
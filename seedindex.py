@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# Index of the seed inputs in a directory, built once per run.
+#
+# seed_index.tsv has a header line naming the directory it was built from,
+# then one "<sha256>\t<size>\t<path>" line per file, sorted by path;
+# seed_index.tsv.off holds the byte offset of each line as native uint64s.
+# Both are memory-mapped, so picking a sample of seeds reads only the lines
+# that were picked, however large the directory is. The driver reads its seed
+# list from a file in the same format (or one path per line) instead of a
+# ';'-joined command line argument.
+
+from array import array
+import mmap
+import os
+import random
+import sys
+import tempfile
+from typing import Iterator, List, NamedTuple, Optional
+
+from hashcache import hash_file
+
+INDEX_NAME = 'seed_index.tsv'
+OFFSETS_SUFFIX = '.off'
+HEADER_PREFIX = '# seed index of '
+
+class SeedEntry(NamedTuple):
+    sha256: str
+    size: int
+    path: str
+
+class SeedList(NamedTuple):
+    """A file listing seed inputs, and how many it lists"""
+    path: str
+    count: int
+
+def _atomic_write(path: str, data: bytes):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def build_index(seed_dir: str, index_path: str):
+    """Walk seed_dir, hash every file and write the index and its offsets"""
+    paths = []
+    for p, ds, fs in os.walk(seed_dir):
+        for f in fs:
+            paths.append(os.path.join(p, f))
+    paths.sort()
+    lines = [f'{HEADER_PREFIX}{os.path.abspath(seed_dir)}\n'.encode()]
+    for path in paths:
+        digest = hash_file(path)
+        size = os.path.getsize(path)
+        lines.append(f'{digest}\t{size}\t{path}\n'.encode('utf-8', errors='surrogateescape'))
+    offsets = array('Q')
+    offset = len(lines[0])
+    for line in lines[1:]:
+        offsets.append(offset)
+        offset += len(line)
+    # Offsets first, so a complete index always has complete offsets
+    _atomic_write(index_path + OFFSETS_SUFFIX, offsets.tobytes())
+    _atomic_write(index_path, b''.join(lines))
+    print(f'Indexed {len(paths)} seed inputs in {seed_dir}', file=sys.stderr)
+
+class SeedIndex:
+    """Memory-mapped seed index; entries are read only when accessed."""
+    def __init__(self, index_path: str):
+        self.path = index_path
+        with open(index_path, 'rb') as f:
+            self.header = f.readline().decode().rstrip('\n')
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+        with open(index_path + OFFSETS_SUFFIX, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self.offsets = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast('Q')
+            else:
+                self.offsets = memoryview(array('Q'))
+
+    @classmethod
+    def open(cls, seed_dir: str, index_dir: str) -> 'SeedIndex':
+        """Open the index of seed_dir kept in index_dir, building it if it is
+        missing or was built from another directory."""
+        index_path = os.path.join(index_dir, INDEX_NAME)
+        if not cls.is_current(index_path, seed_dir):
+            os.makedirs(index_dir, exist_ok=True)
+            build_index(seed_dir, index_path)
+        return cls(index_path)
+
+    @staticmethod
+    def is_current(index_path: str, seed_dir: str) -> bool:
+        try:
+            with open(index_path, 'rb') as f:
+                header = f.readline().decode().rstrip('\n')
+        except FileNotFoundError:
+            return False
+        return (header == f'{HEADER_PREFIX}{os.path.abspath(seed_dir)}'
+                and os.path.exists(index_path + OFFSETS_SUFFIX))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> SeedEntry:
+        start = self.offsets[i]
+        end = self.data.find(b'\n', start)
+        sha256, size, path = self.data[start:end].decode('utf-8', errors='surrogateescape').split('\t', 2)
+        return SeedEntry(sha256, int(size), path)
+
+    def __iter__(self) -> Iterator[SeedEntry]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def sample(self, k: Optional[int] = None, rng=random) -> List[SeedEntry]:
+        """k entries picked at random (all of them, in order, if k is None or -1)"""
+        if k is None or k == -1:
+            return list(self)
+        return [self[i] for i in rng.sample(range(len(self)), k)]
+
+def write_seed_list(path: str, seeds: List[str]) -> SeedList:
+    """Write one seed input path per line to path"""
+    with open(path, 'w', errors='surrogateescape') as f:
+        for seed in seeds:
+            print(seed, file=f)
+    return SeedList(path, len(seeds))
+
+def read_seed_list(path: str) -> List[str]:
+    """Seed input paths from a seed list or a seed index"""
+    seeds = []
+    with open(path, errors='surrogateescape') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith(HEADER_PREFIX):
+                continue
+            # Index lines are "<sha256>\t<size>\t<path>"
+            seeds.append(line.split('\t', 2)[-1])
+    return seeds
@@ -5,18 +5,46 @@ import os
 from typing import Union, Literal, Optional
 import random
 from tqdm import tqdm
+import numpy as np
+
+from covmap import CoverageMap, load_table, popcount_rows, stack, subset_matrix
 
 MODEL = 'CodeLlama-13b-hf'
 
-def superior_than(edge_coverage1: set[str], edge_coverage2: set[str]) -> bool:
+def superior_than(edge_coverage1: CoverageMap, edge_coverage2: CoverageMap) -> bool:
     return len(edge_coverage1) > len(edge_coverage2) and ((not edge_coverage2) or edge_coverage2.issubset(edge_coverage1))
 
-def inferior_than(edge_coverage1: set[str], edge_coverage2: set[str]) -> bool:
+def inferior_than(edge_coverage1: CoverageMap, edge_coverage2: CoverageMap) -> bool:
     return len(edge_coverage1) < len(edge_coverage2) and ((not edge_coverage1) or edge_coverage1.issubset(edge_coverage2))
 
-def equal_to(edge_coverage1: set[str], edge_coverage2: set[str]) -> bool:
+def equal_to(edge_coverage1: CoverageMap, edge_coverage2: CoverageMap) -> bool:
     return edge_coverage1 == edge_coverage2
 
+def compare_all(candidates: dict[str, tuple[CoverageMap, int]], baseline: Optional[CoverageMap] = None) \
+        -> dict[tuple[str, str], Union[Literal['l'], Literal['r'], Literal['b']]]:
+    """Compare every pair of candidates by their edges (with baseline's added),
+    as equal_to/superior_than/inferior_than would, on all the bitmaps at once:
+    'l' if the first one wins, 'r' if the second one does, 'b' to keep both"""
+    keys = list(candidates)
+    edges = [candidates[k][0] if baseline is None else candidates[k][0] | baseline for k in keys]
+    bits = stack(edges)
+    counts = popcount_rows(bits)
+    subset = subset_matrix(bits)
+    comparison_raw = dict()
+    for i, key1 in enumerate(keys):
+        size1 = candidates[key1][1]
+        for j in range(i + 1, len(keys)):
+            key2 = keys[j]
+            if subset[i, j] and subset[j, i]:
+                comparison_raw[(key1, key2)] = 'l' if candidates[key2][1] < size1 else 'r'
+            elif counts[i] > counts[j] and subset[j, i]:
+                comparison_raw[(key1, key2)] = 'l'
+            elif counts[i] < counts[j] and subset[i, j]:
+                comparison_raw[(key1, key2)] = 'r'
+            else:
+                comparison_raw[(key1, key2)] = 'b'
+    return comparison_raw
+
 @click.command()
 @click.option('--generation', '-g', type=str)
 @click.option('--current-covfile', '-c', 'current_covfile', type=click.Path(exists=False), help='Current coverage file')
@@ -26,21 +54,13 @@ def equal_to(edge_coverage1: set[str], edge_coverage2: set[str]) -> bool:
 @click.option('--baseline', '-b', type=click.Path(exists=False), default=None)
 def main(generation: str, current_covfile, max_elites: int, input_elite_file, output_elite_file, baseline):
     if generation == 'initial':
-        coverage_raw: dict[str, dict[str, list[str]]] = dict()
+        coverage: dict[str, dict[str, CoverageMap]] = dict()
     else:
-        with open(click.format_filename(current_covfile), 'r') as f:
-            coverage_raw: dict[str, dict[str, list[str]]] = json.loads(f.read())
+        coverage: dict[str, dict[str, CoverageMap]] = load_table(click.format_filename(current_covfile)).maps(MODEL)
     ELMFUZZ_RUNDIR = os.environ.get('ELMFUZZ_RUNDIR')
     
     if baseline is not None:
-        with open(click.format_filename(baseline)) as base_edges_f:
-            base_edges: set[str] = set()
-            for l in base_edges_f:
-                if not l.strip():
-                    continue
-                base_edges.add(l.strip())
-    
-    coverage = {model: {key: set(map(lambda x: x.split(':')[0], val)) for key, val in coverage.items()} for model, coverage in coverage_raw.items()}
+        base_edges = CoverageMap.from_showmap(click.format_filename(baseline))
     
     if generation == 'initial' or generation == 'gen0':
         elites = dict()
@@ -48,12 +68,11 @@ def main(generation: str, current_covfile, max_elites: int, input_elite_file, ou
         with open(click.format_filename(input_elite_file), 'r') as f:
             elites_raw: dict[str, tuple[list[str], int]] = json.loads(f.read())
             # The edge sets of the elites cannot be a subset of each other
-            elites = {key: (set(edges), size) for key, (edges, size) in elites_raw.items()}
+            elites = {key: (CoverageMap.from_edges(edges), size) for key, (edges, size) in elites_raw.items()}
     coverage_modulo_model = coverage.get(MODEL, {})
 
-    elite_filtering_record: dict[frozenset[str], tuple[str, int]] = dict()
-    for descendant_key, descendant_edges_raw in coverage_modulo_model.items():
-        descendant_edges = frozenset(descendant_edges_raw)
+    elite_filtering_record: dict[CoverageMap, tuple[str, int]] = dict()
+    for descendant_key, descendant_edges in coverage_modulo_model.items():
         with open(f'{ELMFUZZ_RUNDIR}/{generation}/variants/{MODEL}/{descendant_key}.py', 'r') as f:
             descendant_size = len(f.read())
         if descendant_edges in elite_filtering_record:
@@ -62,29 +81,13 @@ def main(generation: str, current_covfile, max_elites: int, input_elite_file, ou
                 elite_filtering_record[descendant_edges] = (descendant_key, descendant_size)
         else:
             elite_filtering_record[descendant_edges] = (descendant_key, descendant_size)
-    filtered_descendants0: dict[str, tuple[set[str], int]] = dict()
+    filtered_descendants0: dict[str, tuple[CoverageMap, int]] = dict()
     for descendant_edges, (descendant_key, descendant_size) in elite_filtering_record.items():
-        filtered_descendants0[descendant_key] = (set(descendant_edges), descendant_size)
+        filtered_descendants0[descendant_key] = (descendant_edges, descendant_size)
 
-    filtered_descendants: dict[str, tuple[set[str], int]] = dict()
+    filtered_descendants: dict[str, tuple[CoverageMap, int]] = dict()
     
-    comparison_raw: dict[tuple[str, str], Union[Literal['l'], Literal['r'], Literal['b']]] = dict()
-    for elite_key1, (elite_edges1, elite_size1) in filtered_descendants0.items():
-        for elite_key2, (elite_edges2, elite_size2) in filtered_descendants0.items():
-            if elite_key1 == elite_key2 or (elite_key2, elite_key1) in comparison_raw:
-                continue
-            else:
-                if equal_to(elite_edges1, elite_edges2):
-                    if elite_size2 < elite_size1:
-                        comparison_raw[(elite_key1, elite_key2)] = 'l'
-                    else:
-                        comparison_raw[(elite_key1, elite_key2)] = 'r'
-                elif superior_than(elite_edges1, elite_edges2):
-                    comparison_raw[(elite_key1, elite_key2)] = 'l'
-                elif inferior_than(elite_edges1, elite_edges2):
-                    comparison_raw[(elite_key1, elite_key2)] = 'r'
-                else:
-                    comparison_raw[(elite_key1, elite_key2)] = 'b'
+    comparison_raw = compare_all(filtered_descendants0)
                     
     comparison: dict[str, dict[str, Union[Literal['l'], Literal['r'], Literal['b']]]] = dict()
     for (key1, key2), comp in comparison_raw.items():
@@ -122,28 +125,25 @@ def main(generation: str, current_covfile, max_elites: int, input_elite_file, ou
                 else:
                     newly_added.add(descendant_key)
     
-    new_elites: dict[str, tuple[list[str], int]] = dict()
+    new_elites: dict[str, tuple[CoverageMap, int]] = dict()
     
     for elite_key, (elite_edges, elite_size) in elites.items():
         if elite_key in replace:
             replaced_by = replace[elite_key]
-            s, sz = filtered_descendants[replaced_by]
-            new_elites[f'{generation}-{replaced_by}'] = (list(s), sz)
+            new_elites[f'{generation}-{replaced_by}'] = filtered_descendants[replaced_by]
         else:
-            new_elites[elite_key] = (list(elite_edges), elite_size)
+            new_elites[elite_key] = (elite_edges, elite_size)
     
     for n in newly_added:
-        s, sz = filtered_descendants[n]
-        new_elites[f'{generation}-{n}'] = (list(s), sz)
+        new_elites[f'{generation}-{n}'] = filtered_descendants[n]
 
     if baseline is not None:
         max_interesting_edges = 0
         interesting = set()
         for elite_key, (elite_edges, _) in new_elites.items():
-            edge_set = set(elite_edges)
-            if not inferior_than(edge_set, base_edges):
+            if not inferior_than(elite_edges, base_edges):
                 interesting.add(elite_key)
-                interesting_edges = len(edge_set.difference(base_edges))
+                interesting_edges = len(elite_edges - base_edges)
                 max_interesting_edges = max(max_interesting_edges, interesting_edges)
         if interesting:
             print(f'Found {len(interesting)} interesting elites with max interesting edges {max_interesting_edges}', file=sys.stderr)
@@ -152,10 +152,10 @@ def main(generation: str, current_covfile, max_elites: int, input_elite_file, ou
     if baseline is not None and len(interesting) > THRESHOLD_FACTOR * max_elites:
         print(f'WARNING: The number of interesting elites {len(interesting)} exceeds the limit {max_elites} x {THRESHOLD_FACTOR}', file=sys.stderr)
         
-        new_elites_filtering: dict[frozenset[str], tuple[str, int]] = dict()
+        new_elites_filtering: dict[CoverageMap, tuple[str, int]] = dict()
 
         for elite_key, (elite_edges_raw, elite_size) in new_elites.items():
-            elite_edges = frozenset(set(elite_edges_raw).union(base_edges))
+            elite_edges = elite_edges_raw | base_edges
             if elite_edges in new_elites_filtering:
                 record_key, record_size = new_elites_filtering[elite_edges]
                 if elite_size < record_size:
@@ -163,30 +163,12 @@ def main(generation: str, current_covfile, max_elites: int, input_elite_file, ou
             else:
                 new_elites_filtering[elite_edges] = (elite_key, elite_size)
         
-        filtered_new_elites0: dict[str, tuple[set[str], int]] = dict()
+        filtered_new_elites0: dict[str, tuple[CoverageMap, int]] = dict()
         for elite_edges, (elite_key, elite_size) in new_elites_filtering.items():
-            filtered_new_elites0[elite_key] = (set(elite_edges), elite_size)
+            filtered_new_elites0[elite_key] = (elite_edges, elite_size)
         
         
-        comparison_raw: dict[tuple[str, str], Union[Literal['l'], Literal['r'], Literal['b']]] = dict()
-        for elite_key1, (elite_edges1_raw, elite_size1) in filtered_new_elites0.items():
-            elite_edges1 = elite_edges1_raw.union(base_edges)
-            for elite_key2, (elite_edges2_raw, elite_size2) in filtered_new_elites0.items():
-                elite_edges2 = elite_edges2_raw.union(base_edges)
-                if elite_key1 == elite_key2 or (elite_key2, elite_key1) in comparison_raw:
-                    continue
-                else:
-                    if equal_to(elite_edges1, elite_edges2):
-                        if elite_size2 < elite_size1:
-                            comparison_raw[(elite_key1, elite_key2)] = 'l'
-                        else:
-                            comparison_raw[(elite_key1, elite_key2)] = 'r'
-                    elif superior_than(elite_edges1, elite_edges2):
-                        comparison_raw[(elite_key1, elite_key2)] = 'l'
-                    elif inferior_than(elite_edges1, elite_edges2):
-                        comparison_raw[(elite_key1, elite_key2)] = 'r'
-                    else:
-                        comparison_raw[(elite_key1, elite_key2)] = 'b'
+        comparison_raw = compare_all(filtered_new_elites0, base_edges)
                         
         comparison: dict[str, dict[str, Union[Literal['l'], Literal['r'], Literal['b']]]] = dict()
         for (key1, key2), comp in comparison_raw.items():
@@ -208,23 +190,22 @@ def main(generation: str, current_covfile, max_elites: int, input_elite_file, ou
     if len(new_elites.items()) > max_elites:
         if len(new_elites) > THRESHOLD_FACTOR * max_elites:
             print(f'WARNING: The number of elites {len(new_elites)} exceeds the limit {max_elites} x {THRESHOLD_FACTOR}', file=sys.stderr)
-            def random_search(set_family: list[tuple[str, set[str], int]], num: int = max_elites, baseline: set[str] = set()) -> list[tuple[str, set[str], int]]:
-                def union_all(set_family: list[tuple[str, set[str], int]], baseline: set[str] = set()) -> tuple[set[str], int, set[str]]:
-                    edges = baseline.copy()
-                    keys = set()
-                    max_size = 0
-                    for k, e, s in set_family:
-                        edges.update(e)
-                        keys.add(k)
-                        max_size = max(max_size, s)
-                    return edges, max_size, keys
+            def random_search(set_family: list[tuple[str, CoverageMap, int]], num: int = max_elites, baseline: Optional[CoverageMap] = None) -> list[tuple[str, CoverageMap, int]]:
+                # Candidates are lists of indices into set_family, whose bitmaps are the rows of family_bits
+                family_bits = stack([e for _, e, _ in set_family] + ([baseline] if baseline is not None else []))
+                base_bits = family_bits[-1] if baseline is not None else np.zeros(family_bits.shape[1], dtype=np.uint8)
+                def union_all(candidate: list[int]) -> tuple[int, int, set[str]]:
+                    edges = np.bitwise_or.reduce(family_bits[candidate], axis=0) | base_bits
+                    max_size = max([set_family[i][2] for i in candidate], default=0)
+                    keys = {set_family[i][0] for i in candidate}
+                    return int(popcount_rows(edges)), max_size, keys
                 
                 TRY_TIMES = 10
                 
-                candidates: list[list[tuple[str, set[str], int]]] = []
+                candidates: list[list[int]] = []
                 
                 for _ in tqdm(range(TRY_TIMES), desc='Selecting'):
-                    candidate = random.sample(set_family, num)
+                    candidate = random.sample(range(len(set_family)), num)
                     
                     changed = True
                     while changed:
@@ -233,72 +214,72 @@ def main(generation: str, current_covfile, max_elites: int, input_elite_file, ou
                         random.shuffle(indices)
                         for idx in indices:
                             key, edges, size = set_family[idx]
-                            original_set, original_size, keys = union_all(candidate, baseline)
+                            original_count, original_size, keys = union_all(candidate)
                             if key in keys:
                                 continue
                             for i in range(num):
                                 new_candidate = candidate.copy()
-                                new_candidate[i] = (key, edges, size)
-                                new_set, new_size, keys = union_all(new_candidate, baseline)
-                                if len(new_set) > len(original_set):
+                                new_candidate[i] = idx
+                                new_count, new_size, keys = union_all(new_candidate)
+                                if new_count > original_count:
                                     candidate = new_candidate
-                                    original_set = new_set
+                                    original_count = new_count
                                     original_size = new_size
                                     changed = True
                                     break
-                                elif len(new_set) == len(original_set) and new_size < original_size:
+                                elif new_count == original_count and new_size < original_size:
                                     candidate = new_candidate
-                                    original_set = new_set
+                                    original_count = new_count
                                     original_size = new_size
                                     changed = True
                                     break
                     candidates.append(candidate)
-                with_stat = list(map(lambda item: (item, union_all(item, baseline)), candidates))
-                sorted_ = list(sorted(with_stat, key=lambda item: (-len(item[1][0]), item[1][1])))
+                with_stat = list(map(lambda item: (item, union_all(item)), candidates))
+                sorted_ = list(sorted(with_stat, key=lambda item: (-item[1][0], item[1][1])))
                 stat = list(map(lambda item: item[1], sorted_))
-                print(f'Get almost bests: {" ".join(map(lambda item: f"({len(item[0])}, {item[1]})", stat))}', file=sys.stderr)
-                return list(map(lambda item: item[0], sorted_))[0]
+                print(f'Get almost bests: {" ".join(map(lambda item: f"({item[0]}, {item[1]})", stat))}', file=sys.stderr)
+                return [set_family[i] for i in sorted_[0][0]]
             if baseline is None:
                 almost_best = random_search(
-                    list(map(lambda item: (item[0], set(item[1][0]), item[1][1]), new_elites.items())),
+                    list(map(lambda item: (item[0], item[1][0], item[1][1]), new_elites.items())),
                 )
                 tmp = dict()
                 for key, edges, size in almost_best:
-                    tmp[key] = (list(edges), size)
+                    tmp[key] = (edges, size)
                 new_elites = tmp
             else:
                 if len(interesting) < max_elites:
-                    interesting_items: list[tuple[str, tuple[list[str], int]]] = list()
-                    trivial_items: list[tuple[str, tuple[list[str], int]]] = list()
+                    interesting_items: list[tuple[str, tuple[CoverageMap, int]]] = list()
+                    trivial_items: list[tuple[str, tuple[CoverageMap, int]]] = list()
                     for k, item in new_elites.items():
                         if k in interesting:
                             interesting_items.append((k, item))
                         elif len(interesting) < max_elites:
                             trivial_items.append((k, item))
-                    almost_best = random_search(list(map(lambda item: (item[0], set(item[1][0]), item[1][1]), trivial_items)), max_elites - len(interesting))
-                    tmp: dict[str, tuple[list[str], int]] = dict()
+                    almost_best = random_search(list(map(lambda item: (item[0], item[1][0], item[1][1]), trivial_items)), max_elites - len(interesting))
+                    tmp: dict[str, tuple[CoverageMap, int]] = dict()
                     for key, edges, size in almost_best:
-                        tmp[key] = (list(edges), size)
+                        tmp[key] = (edges, size)
                     for item in interesting_items:
                         tmp[item[0]] = item[1]
                     new_elites = tmp
                 else:
-                    almost_best = random_search(list(map(lambda item: (item[0], set(item[1][0]), item[1][1]), new_elites.items())), max_elites, base_edges)
+                    almost_best = random_search(list(map(lambda item: (item[0], item[1][0], item[1][1]), new_elites.items())), max_elites, base_edges)
                     tmp = dict()
                     for key, edges, size in almost_best:
-                        tmp[key] = (list(edges), size)
+                        tmp[key] = (edges, size)
                     new_elites = tmp
         else:
             print(f'WARNING: The number of elites {len(new_elites)} exceeds the limit {max_elites}', file=sys.stderr)
             if baseline is not None:
-                interesting_items: list[tuple[str, tuple[list[str], int]]] = list()
-                trivial_items: list[tuple[str, tuple[list[str], int]]] = list()
+                interesting_items: list[tuple[str, tuple[CoverageMap, int]]] = list()
+                trivial_items: list[tuple[str, tuple[CoverageMap, int]]] = list()
                 for k, item in new_elites.items():
                     if k in interesting:
                         interesting_items.append((k, item))
                     elif len(interesting) < max_elites:
                         trivial_items.append((k, item))
-                sorted_intrested = sorted(interesting_items, key=lambda item: (-len(set(item[1][0]).union(base_edges)), item[1][1]))
+                sorted_intrested = sorted(interesting_items, key=lambda item: (-len(item[1][0] | base_edges), item[1][1]))
                 if len(interesting) >= max_elites:
                     new_elites = dict(sorted_intrested[:max_elites])
                 else:
@@ -308,7 +289,7 @@ def main(generation: str, current_covfile, max_elites: int, input_elite_file, ou
                 new_elites = dict(sorted(new_elites.items(), key=lambda item: (-len(item[1][0]), item[1][1]))[:max_elites])
     if set(new_elites.keys()) != set(elites.keys()):
         print('Elites updated', file=sys.stderr)
-    output_elite_file.write(json.dumps(new_elites))
+    output_elite_file.write(json.dumps({key: (edges.to_list(), size) for key, (edges, size) in new_elites.items()}))
     
     for elite_key, (elite_edges, _) in sorted(new_elites.items(), key=lambda item: (len(item[1][0]), -item[1][1])):
         try:
@@ -0,0 +1,42 @@
+import os
+
+from completion_cache import CompletionCache
+
+def key(prompt='p', sample=0, **kw):
+    params = dict(temperature=0.2, max_new_tokens=16, repetition_penalty=1.1, stop=['\nif'])
+    params.update(kw)
+    return CompletionCache.key('m', prompt, sample=sample, **params)
+
+def test_key_covers_every_request_field():
+    base = key()
+    assert key() == base
+    assert key(prompt='q') != base
+    assert key(sample=1) != base
+    assert key(temperature=0.3) != base
+    assert key(stop=[]) != base
+    assert key(stop=None) == key(stop=[])
+
+def test_put_get_counts_hits(tmp_path):
+    cache = CompletionCache(str(tmp_path))
+    res = {'generated_text': 'x = 1', 'details': {'finish_reason': 'eos_token'}}
+    assert cache.get(key()) is None
+    cache.put(key(), res)
+    assert cache.get(key()) == res
+    assert (cache.hits, cache.misses) == (1, 1)
+    # Reopening finds the entry on disk
+    assert CompletionCache(str(tmp_path)).get(key()) == res
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = CompletionCache(str(tmp_path), max_bytes=0)
+    keys = [key(sample=i) for i in range(3)]
+    for i, k in enumerate(keys):
+        cache.put(k, {'generated_text': 'x' * 100})
+        os.utime(cache._path(k), (1000 + i, 1000 + i))
+    # Touched by a hit, so it is the most recently used
+    cache.get(keys[0])
+    size = os.path.getsize(cache._path(keys[0]))
+    cache.max_bytes = size
+    cache.evict()
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is None
@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+from genvariants_parallel import SeedCorpus, build_worklist, generate_all, make_parser, persistent_seed
+from tgi_standin import PrefixCache, StandinHandler
+
+MODEL = 'bigcode/starcoder'
+
+SEED = '''import random
+
+def generate(rng, out):
+    n = rng.read(1)[0]
+    for i in range(n):
+        out.write(bytes([i]))
+    out.write(b'end')
+'''
+
+class CountingHandler(StandinHandler):
+    def do_POST(self):
+        with self.server.lock:
+            self.server.requests += 1
+        super().do_POST()
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+    server.daemon_threads = True
+    server.args = argparse.Namespace(model_id=MODEL, slots=4, prefill_ms_per_char=0,
+                                     ms_per_token=0, prefix_cache_size=4)
+    server.slots = threading.BoundedSemaphore(4)
+    server.cache = PrefixCache(4)
+    server.lock = threading.Lock()
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_generation(tmp_path, server, seed, name):
+    seed_file = tmp_path / 'seed.py'
+    seed_file.write_text(SEED)
+    args = make_parser().parse_args([
+        str(seed_file), '-n', '6', '--seed', str(seed),
+        '-O', str(tmp_path / name / 'variants'), '-L', str(tmp_path / name / 'logs'),
+        '--cache-dir', str(tmp_path / 'cache'), '--no-prefilter',
+    ])
+    args.gen = argparse.Namespace(temperature=0.2, max_new_tokens=16, repetition_penalty=1.1)
+    (tmp_path / name / 'variants').mkdir(parents=True)
+    (tmp_path / name / 'logs').mkdir(parents=True)
+    endpoint = f'http://127.0.0.1:{server.server_address[1]}'
+    worklist = build_worklist([MODEL], ['complete', 'infilled'], SeedCorpus(args.files), args)
+    before = server.requests
+    asyncio.run(generate_all(worklist, {MODEL: [endpoint]}, args))
+    return server.requests - before
+
+def test_rerun_with_same_seed_is_served_from_cache(tmp_path):
+    server = start_server()
+    try:
+        assert run_generation(tmp_path, server, 1234, 'first') == 6
+        assert run_generation(tmp_path, server, 1234, 'again') == 0
+        # Other cut points are other prompts
+        assert run_generation(tmp_path, server, 4321, 'other') > 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_persistent_seed_is_kept(tmp_path):
+    path = str(tmp_path / 'logs' / 'variant_seed')
+    seed = persistent_seed(path)
+    assert persistent_seed(path) == seed
+    assert open(path).read().strip() == str(seed)
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import stat
+import sys
+
+from covcache import INPUT_COST, RECORD_HEADER, CoverageCache, collect, plan_units
+
+# Stands in for afl-showmap: every byte of an input is an edge it covers, and
+# inputs starting with '!' crash. Each run appends its input names to a log.
+FAKE_SHOWMAP = f'''#!{sys.executable}
+import os, sys
+indir = sys.argv[sys.argv.index('-i') + 1]
+outdir = sys.argv[sys.argv.index('-o') + 1]
+os.makedirs(outdir)
+names = sorted(os.listdir(indir))
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runs.log'), 'a') as log:
+    print(' '.join(names), file=log)
+for name in names:
+    with open(os.path.join(indir, name), 'rb') as f:
+        data = f.read()
+    if data.startswith(b'!'):
+        continue
+    with open(os.path.join(outdir, name), 'w') as f:
+        for edge in sorted(set(data)):
+            print(f'{{edge:06d}}:1', file=f)
+'''
+
+def digest(data):
+    return hashlib.sha256(data).digest()
+
+def make_showmap(tmp_path):
+    path = tmp_path / 'bin' / 'afl-showmap'
+    path.parent.mkdir()
+    path.write_text(FAKE_SHOWMAP)
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return str(path)
+
+def runs(showmap):
+    try:
+        with open(os.path.join(os.path.dirname(showmap), 'runs.log')) as f:
+            return [line.split() for line in f]
+    except FileNotFoundError:
+        return []
+
+def make_gendirs(tmp_path, outputs):
+    gendirs = {}
+    for (model, generator), contents in outputs.items():
+        gendir = tmp_path / 'out' / model / generator
+        gendir.mkdir(parents=True)
+        for i, data in enumerate(contents):
+            (gendir / f'{i:08d}.bin').write_bytes(data)
+        gendirs[(model, generator)] = str(gendir)
+    return gendirs
+
+def test_cache_round_trip(tmp_path):
+    with CoverageCache(str(tmp_path), 'target') as cache:
+        cache.put_many([(digest(b'a'), [1, 2, 3]), (digest(b'b'), [])])
+        assert list(cache.get(digest(b'a'))) == [1, 2, 3]
+    cache = CoverageCache(str(tmp_path), 'target')
+    assert len(cache) == 2
+    assert list(cache.get(digest(b'a'))) == [1, 2, 3]
+    assert list(cache.get(digest(b'b'))) == []
+    assert cache.get(digest(b'c')) is None
+    cache.close()
+
+def test_torn_record_is_truncated(tmp_path):
+    with CoverageCache(str(tmp_path), 'target') as cache:
+        cache.put_many([(digest(b'a'), [1, 2, 3])])
+        path = cache.path
+    whole = os.path.getsize(path)
+    # A record cut off inside its edges by a kill
+    with open(path, 'ab') as f:
+        f.write(RECORD_HEADER.pack(digest(b'b'), 10) + b'\0' * 12)
+    with CoverageCache(str(tmp_path), 'target') as cache:
+        assert len(cache) == 1
+        assert os.path.getsize(path) == whole
+        cache.put_many([(digest(b'c'), [7])])
+    with CoverageCache(str(tmp_path), 'target') as cache:
+        assert list(cache.get(digest(b'a'))) == [1, 2, 3]
+        assert list(cache.get(digest(b'c'))) == [7]
+        assert cache.get(digest(b'b')) is None
+
+def test_plan_units_one_per_worker():
+    sizes = [(i * 7919) % 100000 for i in range(10000)]
+    inputs = [(digest(str(i).encode()), f'in/{i}', size) for i, size in enumerate(sizes)]
+    units = plan_units(inputs, 4)
+    # However many inputs there are, each worker gets a single unit
+    assert len(units) == 4
+    assert sorted(p for unit in units for _, p in unit) == sorted(p for _, p, _ in inputs)
+    size_of = {p: size for _, p, size in inputs}
+    costs = [sum(INPUT_COST + size_of[p] for _, p in unit) for unit in units]
+    assert costs == sorted(costs, reverse=True)
+    assert costs[0] - costs[-1] <= INPUT_COST + max(sizes)
+    assert len(plan_units(inputs[:3], 4)) == 3
+    assert plan_units([], 4) == []
+
+def test_collect_runs_each_distinct_input_once(tmp_path):
+    showmap = make_showmap(tmp_path)
+    gendirs = make_gendirs(tmp_path, {
+        ('model', 'gen_a'): [b'\x01\x02', b'\x02\x03', b'!\x05'],
+        ('model', 'gen_b'): [b'\x02\x03', b'\x09'],
+    })
+    coverage = collect(showmap, 'prog', gendirs, jobs=2)
+    # Counts are the number of the generator's inputs that hit each edge
+    assert coverage == {
+        ('model', 'gen_a'): ['000001:1', '000002:2', '000003:1'],
+        ('model', 'gen_b'): ['000002:1', '000003:1', '000009:1'],
+    }
+    run_inputs = [name for names in runs(showmap) for name in names]
+    assert len(run_inputs) == len(set(run_inputs)) == 4
+
+def test_collect_uses_the_cache(tmp_path):
+    showmap = make_showmap(tmp_path)
+    gendirs = make_gendirs(tmp_path, {
+        ('model', 'gen_a'): [b'\x01\x02', b'!\x05'],
+        ('model', 'gen_b'): [b'\x01\x02', b'\x04'],
+    })
+    with CoverageCache(str(tmp_path / 'cache'), 'target') as cache:
+        first = collect(showmap, 'prog', gendirs, cache, jobs=2)
+    assert len(runs(showmap)) > 0
+    os.unlink(os.path.join(os.path.dirname(showmap), 'runs.log'))
+    with CoverageCache(str(tmp_path / 'cache'), 'target') as cache:
+        assert len(cache) == 3
+        assert list(cache.get(digest(b'!\x05'))) == []
+        assert collect(showmap, 'prog', gendirs, cache, jobs=2) == first
+    assert runs(showmap) == []
+
+def test_no_maps_at_all_is_not_cached(tmp_path):
+    showmap = tmp_path / 'afl-showmap'
+    showmap.write_text('#!/bin/sh\nexit 1\n')
+    showmap.chmod(0o755)
+    gendirs = make_gendirs(tmp_path, {('model', 'gen_a'): [b'\x01']})
+    with CoverageCache(str(tmp_path / 'cache'), 'target') as cache:
+        assert collect(str(showmap), 'prog', gendirs, cache) == {('model', 'gen_a'): []}
+        assert len(cache) == 0
@@ -0,0 +1,111 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from covmap import (CoverageMap, CoverageStore, CoverageTable, load_table, popcount_rows,
+                    stack, subset_matrix)
+
+SIZE = 1024
+
+def cov(*edges, size=SIZE):
+    return CoverageMap.from_edges(edges, size)
+
+def test_from_edges():
+    m = CoverageMap.from_edges(['000003:1', '000010:7', '1023'], SIZE)
+    assert list(m.edges()) == [3, 10, 1023]
+    assert m.to_list() == ['3', '10', '1023']
+    assert len(m) == 3 and m.size == SIZE
+    # The map grows to fit an edge past its size
+    assert list(cov(5000).edges()) == [5000]
+    assert not CoverageMap.empty(SIZE)
+
+def test_set_operations_match_frozensets():
+    rng = np.random.default_rng(0)
+    a_edges = set(rng.integers(0, SIZE, 200).tolist())
+    b_edges = set(rng.integers(0, SIZE, 200).tolist())
+    a, b = cov(*a_edges), cov(*b_edges)
+    assert set((a | b).edges()) == a_edges | b_edges
+    assert set((a & b).edges()) == a_edges & b_edges
+    assert set((a - b).edges()) == a_edges - b_edges
+    assert len(a | b) == len(a_edges | b_edges)
+    assert set(a.union(b, cov(2000)).edges()) == a_edges | b_edges | {2000}
+    assert (a & b).issubset(a) and not (a | cov(2000)).issubset(a)
+
+def test_equality_across_sizes():
+    assert cov(1, 2) == cov(1, 2, size=4096)
+    assert hash(cov(1, 2)) == hash(cov(1, 2, size=4096))
+    assert cov(1, 2) != cov(1, 3)
+    # In-place union grows to fit the larger map
+    m = cov(1)
+    m |= cov(3000)
+    assert list(m.edges()) == [1, 3000]
+
+def test_popcount_rows():
+    rng = np.random.default_rng(1)
+    bits = rng.integers(0, 256, (5, 128), dtype=np.uint8)
+    expected = np.unpackbits(bits, axis=1).sum(axis=1)
+    assert list(popcount_rows(bits)) == list(expected)
+    # Rows that aren't whole words take the table path
+    assert list(popcount_rows(bits[:, :13])) == list(np.unpackbits(bits[:, :13], axis=1).sum(axis=1))
+    assert popcount_rows(bits[0]) == expected[0]
+
+def test_stack_and_subset_matrix():
+    maps = [cov(1, 2), cov(1, 2, 3, size=4096), cov(7), CoverageMap.empty(SIZE)]
+    bits = stack(maps)
+    assert bits.shape == (4, 512)
+    assert list(popcount_rows(bits)) == [2, 3, 1, 0]
+    subset = subset_matrix(bits)
+    assert subset[0, 1] and not subset[1, 0]
+    assert not subset[2, 0] and not subset[0, 2]
+    assert subset[3].all() and subset.diagonal().all()
+
+def test_table_from_dict():
+    table = CoverageTable.from_dict({
+        'model1': {'gen_a': ['000001:1', '000002:3'], 'gen_b': ['000002:1']},
+        'model2': {'gen_a': []},
+    }, SIZE)
+    assert table.keys == [('model1', 'gen_a'), ('model1', 'gen_b'), ('model2', 'gen_a')]
+    assert list(table.counts()) == [2, 1, 0]
+    assert list(table.union().edges()) == [1, 2]
+    assert table.maps('model1')['model1']['gen_b'] == cov(2)
+    assert table.to_dict() == {'model1': {'gen_a': ['1', '2'], 'gen_b': ['2']}, 'model2': {'gen_a': []}}
+
+def coverage_json():
+    """A coverage.json as getcov writes it: one "%06d:%d" string per edge"""
+    rng = np.random.default_rng(2)
+    dense = sorted(set(rng.integers(0, SIZE, 600).tolist()))
+    return {
+        'model1': {
+            'gen_a': [f'{e:06d}:{1 + e % 3}' for e in dense],
+            'gen_b': ['000002:70000', '000900:300', '001023:1'],
+        },
+        'model2': {'gen_a': []},
+    }
+
+def test_store_round_trip(tmp_path):
+    cov = coverage_json()
+    path = str(tmp_path / 'coverage.bin')
+    CoverageTable.from_dict(cov, SIZE, with_hits=True).save(path)
+    store = CoverageStore(path)
+    assert store.to_dict() == cov
+    assert store.keys == [('model1', 'gen_a'), ('model1', 'gen_b'), ('model2', 'gen_a')]
+    assert list(store.counts()) == [len(cov['model1']['gen_a']), 3, 0]
+    assert store.union() == CoverageMap.from_edges(cov['model1']['gen_a'] + cov['model1']['gen_b'], SIZE)
+    # Stores without hit counts keep the edges
+    CoverageTable.from_dict(cov, SIZE).save(path)
+    assert CoverageStore(path).to_dict()['model1']['gen_b'] == ['2', '900', '1023']
+
+def test_import_export_gives_back_coverage_json(tmp_path):
+    cov = coverage_json()
+    covfile = tmp_path / 'coverage.json'
+    covfile.write_text(json.dumps(cov))
+    covmap_py = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'covmap.py')
+    env = dict(os.environ, AFL_MAP_SIZE=str(SIZE))
+    subprocess.run([sys.executable, covmap_py, 'import', str(covfile)], check=True, env=env)
+    assert isinstance(load_table(str(covfile)), CoverageStore)
+    exported = subprocess.run([sys.executable, covmap_py, 'export', str(tmp_path / 'coverage.bin')],
+                              check=True, env=env, stdout=subprocess.PIPE).stdout
+    assert json.loads(exported) == cov
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+DRIVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'driver.py')
+
+GENERATOR = '''def generate(rng, out):
+    out.write(rng.read(16))
+'''
+
+def run_driver(tmp_path, *extra):
+    (tmp_path / 'gen.py').write_text(GENERATOR)
+    (tmp_path / 'seed1').write_bytes(b'seed')
+    (tmp_path / 'out').mkdir()
+    cmd = [sys.executable, DRIVER, '-n', '3', '-R', '7', '-o', './out/output', '-s', '.bin',
+           '-i', str(tmp_path / 'seed1'), '-L', 'log.jsonl', *extra, 'gen.py', 'generate']
+    subprocess.run(cmd, cwd=tmp_path, check=True, capture_output=True)
+    return sorted(os.listdir(tmp_path / 'out'))
+
+@pytest.mark.parametrize('mode', [[], ['--fork-server']], ids=['pool', 'fork-server'])
+def test_relative_output_prefix(tmp_path, mode):
+    assert run_driver(tmp_path, *mode) == [f'output_seed1_{i:08}.bin' for i in range(3)]
+
+def test_fork_server_matches_pool(tmp_path):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    names = run_driver(tmp_path / 'a')
+    assert run_driver(tmp_path / 'b', '--fork-server') == names
+    for name in names:
+        assert (tmp_path / 'a' / 'out' / name).read_bytes() == (tmp_path / 'b' / 'out' / name).read_bytes()
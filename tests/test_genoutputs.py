@@ -0,0 +1,22 @@
+from genoutputs import allocate_budget
+
+def test_zero_yield_variant_gets_nothing():
+    allocation = allocate_budget({'a': 3.0, 'b': 1.0, 'c': 0.0}, 100, 1000)
+    assert allocation == {'a': 75, 'b': 25, 'c': 0}
+
+def test_all_zero_yields():
+    allocation = allocate_budget({'a': 0.0, 'b': 0.0}, 100, 1000)
+    assert allocation == {'a': 0, 'b': 0}
+
+def test_rounding_hands_out_exact_total():
+    scores = {'a': 1.0, 'b': 1.0, 'c': 1.0}
+    allocation = allocate_budget(scores, 100, 1000)
+    assert sum(allocation.values()) == 100
+    assert sorted(allocation.values()) == [33, 33, 34]
+
+def test_cap_respected_and_rest_shared():
+    allocation = allocate_budget({'a': 10.0, 'b': 1.0, 'c': 1.0}, 100, 40)
+    assert allocation == {'a': 40, 'b': 30, 'c': 30}
+
+def test_nonpositive_cap():
+    assert allocate_budget({'a': 1.0}, 100, 0) == {'a': 0}
@@ -0,0 +1,63 @@
+import asyncio
+
+from genvariants_parallel import EndpointRouter, VariantRequest, order_for_prefix_reuse
+
+class FakeClient:
+    """Records which endpoint each request went to; requests finish when released"""
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def generate(self, endpoint, data):
+        self.calls.append(endpoint)
+        await self.release.wait()
+        return {'generated_text': endpoint}
+
+def test_router_round_robins_when_idle():
+    router = EndpointRouter(FakeClient(), {'m': ['a', 'b', 'c']})
+    assert [router.pick('m') for _ in range(6)] == ['a', 'b', 'c', 'a', 'b', 'c']
+
+def test_router_prefers_least_outstanding():
+    client = FakeClient()
+    router = EndpointRouter(client, {'m': ['a', 'b'], 'n': ['c']})
+
+    async def run():
+        slow = [asyncio.create_task(router.generate('m', {})) for _ in range(3)]
+        await asyncio.sleep(0)
+        outstanding = dict(router.outstanding)
+        client.release.set()
+        results = await asyncio.gather(*slow)
+        return outstanding, results
+    outstanding, results = asyncio.run(run())
+    assert outstanding == {'a': 2, 'b': 1, 'c': 0}
+    assert sorted(r['generated_text'] for r in results) == ['a', 'a', 'b']
+    # Requests that finished no longer count
+    assert router.outstanding == {'a': 0, 'b': 0, 'c': 0}
+
+def test_router_releases_endpoint_on_error():
+    class FailingClient:
+        async def generate(self, endpoint, data):
+            raise RuntimeError('down')
+    router = EndpointRouter(FailingClient(), {'m': ['a']})
+    try:
+        asyncio.run(router.generate('m', {}))
+    except RuntimeError:
+        pass
+    assert router.outstanding == {'a': 0}
+
+def request(i, model, filename, prompt):
+    return VariantRequest(i=i, model=model, generator='complete', filename=filename,
+                          prefix=prompt, suffix='', orig='', prompt=prompt, stop=[], base=[])
+
+def test_prefix_reuse_groups_by_model_and_seed():
+    reqs = [
+        request(0, 'm2', 'a.py', 'def f(): pass'),
+        request(1, 'm1', 'b.py', 'import os\nx = 1'),
+        request(2, 'm1', 'a.py', 'def f(): return 2'),
+        request(3, 'm1', 'b.py', 'import os\n'),
+        request(4, 'm1', 'a.py', 'def f(): return'),
+    ]
+    ordered = order_for_prefix_reuse(reqs)
+    assert [r.i for r in ordered] == [4, 2, 3, 1, 0]
+    # Nothing is lost or duplicated
+    assert sorted(ordered) == sorted(reqs)
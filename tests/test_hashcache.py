@@ -0,0 +1,68 @@
+import hashlib
+import os
+
+from hashcache import FileHashCache, hash_file
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def stat_all(paths):
+    return [(p, os.stat(p)) for p in paths]
+
+def test_hash_file(tmp_path):
+    (tmp_path / 'a').write_bytes(b'hello')
+    (tmp_path / 'empty').write_bytes(b'')
+    assert hash_file(str(tmp_path / 'a')) == sha256(b'hello')
+    assert hash_file(str(tmp_path / 'empty')) == sha256(b'')
+
+def test_hashes_are_cached(tmp_path):
+    path = str(tmp_path / 'a')
+    with open(path, 'wb') as f:
+        f.write(b'hello')
+    cache_path = str(tmp_path / 'cache' / 'hashes.tsv')
+    assert FileHashCache(cache_path).hash_all(stat_all([path]), jobs=1) == {path: sha256(b'hello')}
+    # A new cache reads the entry back and does not hash the file again
+    st = os.stat(path)
+    with open(cache_path, 'a') as f:
+        print(f'{"0" * 64}\t{st.st_size}\t{st.st_mtime_ns}\t{path}', file=f)
+    cache = FileHashCache(cache_path)
+    assert cache.get(path, st) == '0' * 64
+    assert cache.hash_all(stat_all([path]), jobs=1) == {path: '0' * 64}
+
+def test_changed_file_is_rehashed(tmp_path):
+    path = str(tmp_path / 'a')
+    with open(path, 'wb') as f:
+        f.write(b'hello')
+    cache_path = str(tmp_path / 'hashes.tsv')
+    FileHashCache(cache_path).hash_all(stat_all([path]), jobs=1)
+    with open(path, 'wb') as f:
+        f.write(b'goodbye')
+    os.utime(path, ns=(1, 1))
+    cache = FileHashCache(cache_path)
+    assert cache.get(path, os.stat(path)) is None
+    assert cache.hash_all(stat_all([path]), jobs=1) == {path: sha256(b'goodbye')}
+    assert FileHashCache(cache_path).get(path, os.stat(path)) == sha256(b'goodbye')
+
+def test_missing_file_is_skipped(tmp_path):
+    path = str(tmp_path / 'a')
+    with open(path, 'wb') as f:
+        f.write(b'hello')
+    files = stat_all([path])
+    os.unlink(path)
+    assert FileHashCache(str(tmp_path / 'hashes.tsv')).hash_all(files, jobs=1) == {}
+
+def test_torn_line_is_ignored(tmp_path):
+    cache_path = tmp_path / 'hashes.tsv'
+    cache_path.write_text(f'{"1" * 64}\t5\t10\t/x\n{"2" * 64}\t5')
+    cache = FileHashCache(str(cache_path))
+    assert cache.entries == {'/x': (5, 10, '1' * 64)}
+    assert cache.lines == 1
+
+def test_compaction_drops_superseded_entries(tmp_path):
+    cache_path = tmp_path / 'hashes.tsv'
+    cache_path.write_text(''.join(f'{str(i) * 64}\t{i}\t{i}\t/x\n' for i in range(1, 4)))
+    cache = FileHashCache(str(cache_path))
+    assert cache.lines == 3
+    cache.compact()
+    assert cache_path.read_text() == f'{"3" * 64}\t3\t3\t/x\n'
+    assert FileHashCache(str(cache_path)).entries == {'/x': (3, 3, '3' * 64)}
@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+import metalog
+from metalog import MetaLog, MetaLogReader, variant_key
+
+RECORDS = {
+    variant_key('codellama/CodeLlama-13b-hf', f'/x/var_{i:04}.complete.py'): {
+        'model': 'codellama/CodeLlama-13b-hf',
+        'prompt': f'def f{i}():\n    "é"',
+        'gen_lines': i,
+    }
+    for i in range(5)
+}
+
+def write(log_dir, compress=False):
+    with MetaLog(str(log_dir), compress=compress) as log:
+        for key, record in RECORDS.items():
+            log.append(key, record)
+
+@pytest.mark.parametrize('compress', [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(metalog.zstandard is None, reason='needs zstandard')),
+])
+def test_round_trip(tmp_path, compress):
+    write(tmp_path, compress)
+    reader = MetaLogReader(str(tmp_path))
+    assert len(reader) == len(RECORDS)
+    for key, record in RECORDS.items():
+        assert reader[key] == {'id': key, **record}
+    assert [r['id'] for r in reader] == list(RECORDS)
+
+def test_later_record_wins(tmp_path):
+    write(tmp_path)
+    key = next(iter(RECORDS))
+    with MetaLog(str(tmp_path)) as log:
+        log.append(key, {'gen_lines': 99})
+    assert MetaLogReader(str(tmp_path))[key]['gen_lines'] == 99
+
+def test_rebuilds_missing_index_and_skips_torn_line(tmp_path):
+    write(tmp_path)
+    os.remove(tmp_path / 'meta.jsonl.idx')
+    with open(tmp_path / 'meta.jsonl', 'a') as f:
+        f.write('{"id": "torn')
+    reader = MetaLogReader(str(tmp_path))
+    assert set(reader.keys()) == set(RECORDS)
+    assert len(list(reader)) == len(RECORDS)
+
+def test_legacy_json_files(tmp_path):
+    with open(tmp_path / 'var_0000.complete.py.json', 'w') as f:
+        json.dump({'gen_lines': 3}, f)
+    reader = MetaLogReader(str(tmp_path))
+    assert reader['CodeLlama-13b-hf/var_0000.complete.py'] == {'gen_lines': 3}
+    assert reader.get('CodeLlama-13b-hf/missing.py') is None
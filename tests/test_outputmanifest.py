@@ -0,0 +1,44 @@
+import argparse
+import os
+
+from outputmanifest import OutputManifest, regenerate
+
+GOOD = '''def generate(rng, out):
+    out.write(rng.read(8))
+'''
+
+BAD = '''def generate(rng, out):
+    raise RuntimeError('boom')
+'''
+
+def write_manifest(tmp_path, variants):
+    driver_args = argparse.Namespace(
+        function_name='generate', timeout=5, cpu_timeout=None,
+        size_limit=1 << 20, max_mem=1 << 30, output_suffix='.bin',
+    )
+    path = str(tmp_path / 'outputs.manifest.jsonl')
+    with OutputManifest(path) as manifest:
+        manifest.add_driver_args(driver_args)
+        for name, source in variants.items():
+            variant = tmp_path / f'{name}.py'
+            variant.write_text(source)
+            outdir = tmp_path / 'gen' / 'model' / name
+            outdir.mkdir(parents=True)
+            output = outdir / 'output_0.bin'
+            output.write_bytes(b'x' * 8)
+            manifest.add_outputs(str(variant), str(outdir), [{
+                'result_type': 'Success',
+                'output_file': str(output),
+                'function_name': 'generate',
+                'rng_seed': 1,
+            }])
+    return path
+
+def test_regenerate_reports_failing_generator(tmp_path, capsys):
+    manifest = write_manifest(tmp_path, {'good': GOOD, 'bad': BAD})
+    outdir = tmp_path / 'regen'
+    failed = regenerate(manifest, [], str(outdir), jobs=1)
+    assert failed == 1
+    assert os.path.getsize(outdir / 'model' / 'good' / 'output_0.bin') == 8
+    assert not (outdir / 'model' / 'bad' / 'output_0.bin').exists()
+    assert 'model/bad/output_0.bin: generator failed' in capsys.readouterr().err
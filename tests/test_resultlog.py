@@ -0,0 +1,84 @@
+import argparse
+import io
+import json
+
+from resultlog import ResultLogWriter, is_columnar, iter_records, to_jsonl
+
+ARGS = argparse.Namespace(function_name='generate', timeout=5)
+
+def record(i, **kw):
+    res = {
+        'result_type': 'Success',
+        'error': None,
+        'data': {
+            'time_taken': 0.25 * i,
+            'memory_used': 1024 * i,
+            'stdout': '',
+            'stderr': f'warning {i}' if i % 2 else None,
+            'cpu_time': None,
+        },
+        'module_path': 'variants/gen1/var_0001.py',
+        'function_name': 'generate',
+        'output_file': f'outputs/gen1/var_0001/{i:08d}.bin',
+        'args': ARGS,
+        'rng_seed': (1 << 64) - 1 - i,
+    }
+    res.update(kw)
+    return res
+
+def records():
+    return [
+        record(0),
+        record(1, data=None, result_type='Error',
+               error={'exception': 'ValueError', 'message': 'bad', 'traceback': []}),
+        record(2, rng_seed=None),
+        # Shapes that don't fit the columns are kept whole
+        {'error': {'exception': 'RuntimeError'}},
+        record(3, extra=True),
+        record(4, data=dict(record(4)['data'], memory_used='lots')),
+        record(5),
+    ]
+
+def as_json(recs):
+    """What each record reads back as from a JSONL log"""
+    return [json.loads(json.dumps(r, default=lambda o: o.__dict__)) for r in recs]
+
+def write(path, recs, header=None, chunk_size=2):
+    with ResultLogWriter(str(path), header=header, chunk_size=chunk_size) as log:
+        for r in recs:
+            log.append(r)
+
+def test_round_trip_matches_jsonl(tmp_path):
+    header = {'args': {'output_dir': 'outputs'}}
+    columnar = tmp_path / 'log.bin'
+    write(columnar, records(), header=header)
+    jsonl = tmp_path / 'log.jsonl'
+    jsonl.write_text(''.join(line + '\n' for line in map(json.dumps, as_json([header] + records()))))
+    assert is_columnar(str(columnar)) and not is_columnar(str(jsonl))
+    assert list(iter_records(str(columnar))) == list(iter_records(str(jsonl))) == as_json([header] + records())
+
+def test_round_trip_in_one_chunk(tmp_path):
+    path = tmp_path / 'log.bin'
+    write(path, records(), chunk_size=1024)
+    assert list(iter_records(str(path))) == as_json(records())
+
+def test_torn_chunk_is_dropped(tmp_path):
+    path = tmp_path / 'log.bin'
+    write(path, records())
+    data = path.read_bytes()
+    # Cutting the last chunk anywhere loses only that chunk
+    for cut in (1, 10, 50):
+        path.write_bytes(data[:-cut])
+        assert list(iter_records(str(path))) == as_json(records()[:6])
+
+def test_torn_jsonl_line_is_skipped(tmp_path):
+    path = tmp_path / 'log.jsonl'
+    path.write_text('{"a": 1}\n{"b": 2}\n{"c"')
+    assert list(iter_records(str(path))) == [{'a': 1}, {'b': 2}]
+
+def test_to_jsonl(tmp_path):
+    path = tmp_path / 'log.bin'
+    write(path, records())
+    out = io.StringIO()
+    to_jsonl(str(path), out)
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == as_json(records())
@@ -0,0 +1,33 @@
+import json
+
+from runstats import RunStats, StatusWriter, format_status
+
+def test_add_module_counts_results():
+    stats = RunStats(num_iterations=10, total_modules=3)
+    stats.add_module('gen1', [{'result_type': 'Success'}, {'result_type': 'Error'}, {}])
+    stats.add_module('gen1', [{'result_type': 'ImportError'}])
+    assert stats.by_gentype() == {'gen1': {'Success': 1, 'Error': 2, 'ImportError': 10}}
+    # Finishing a module is counted separately, so failed modules count too
+    assert stats.modules_done == 0
+    stats.module_done()
+    stats.module_done()
+    assert stats.snapshot()['modules_done'] == 2
+
+def test_snapshot_rates():
+    stats = RunStats(window=2)
+    stats.add('gen1', 'Error')
+    stats.add('gen2', 'Success', 3)
+    snapshot = stats.snapshot()
+    assert snapshot['combined'] == {'Error': 1, 'Success': 3}
+    assert snapshot['success_rate'] == 0.75
+    assert snapshot['recent_success_rate'] == 1.0
+
+def test_status_writer(tmp_path):
+    stats = RunStats(total_modules=1)
+    stats.add('gen1', 'Success')
+    stats.module_done()
+    path = tmp_path / 'status' / 'status.json'
+    StatusWriter(stats, str(path)).update(force=True)
+    status = json.loads(path.read_text())
+    assert status['modules_done'] == 1
+    assert format_status(status).split()[1:3] == ['1/1', 'modules']
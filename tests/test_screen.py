@@ -0,0 +1,47 @@
+import json
+import os
+
+from screen import OutputScreen
+
+def outputs(tmp_path, variant, contents):
+    results = []
+    os.makedirs(tmp_path / variant, exist_ok=True)
+    for i, data in enumerate(contents):
+        path = tmp_path / variant / f'{i:08d}.bin'
+        path.write_bytes(data)
+        results.append({'result_type': 'Success', 'output_file': str(path)})
+    return results
+
+def remaining(tmp_path, variant):
+    return sorted(os.listdir(tmp_path / variant))
+
+def test_drops_empty_and_own_duplicates(tmp_path):
+    screen = OutputScreen()
+    results = outputs(tmp_path, 'gen1/var_0001', [b'a', b'', b'a', b'b'])
+    results.append({'result_type': 'Error', 'output_file': None})
+    stats = screen.screen('gen1/var_0001', results)
+    assert remaining(tmp_path, 'gen1/var_0001') == ['00000000.bin', '00000003.bin']
+    assert (stats['kept'], stats['empty'], stats['dup_self'], stats['dup_other']) == (2, 1, 1, 0)
+
+def test_duplicates_across_variants_credit_the_first(tmp_path):
+    screen = OutputScreen()
+    screen.screen('gen1/var_0001', outputs(tmp_path, 'gen1/var_0001', [b'a', b'b']))
+    stats = screen.screen('gen1/var_0002', outputs(tmp_path, 'gen1/var_0002', [b'b', b'c', b'a']))
+    # The first variant keeps both its outputs; the second only its new one
+    assert remaining(tmp_path, 'gen1/var_0001') == ['00000000.bin', '00000001.bin']
+    assert remaining(tmp_path, 'gen1/var_0002') == ['00000001.bin']
+    assert stats['kept'] == 1 and stats['dup_other'] == 2
+    assert dict(stats['shared']) == {'gen1/var_0001': 2}
+    summary_path = tmp_path / 'screen.json'
+    screen.write(str(summary_path))
+    summary = json.loads(summary_path.read_text())
+    assert summary['totals'] == {'kept': 3, 'dup_other': 2}
+    assert summary['variants']['gen1/var_0002']['shared'] == {'gen1/var_0001': 2}
+    assert '2 duplicate (2 across variants)' in screen.describe()
+
+def test_bucket_cap(tmp_path):
+    screen = OutputScreen(bucket_cap=1)
+    stats = screen.screen('gen1/var_0001', outputs(tmp_path, 'gen1/var_0001', [b'a', b'b', b'cc']))
+    # 'a' and 'b' share the 1-byte bucket; 'cc' is in the next one
+    assert remaining(tmp_path, 'gen1/var_0001') == ['00000000.bin', '00000002.bin']
+    assert stats['over_bucket_cap'] == 1
@@ -0,0 +1,65 @@
+import hashlib
+import os
+import random
+
+from seedindex import INDEX_NAME, SeedEntry, SeedIndex, read_seed_list, write_seed_list
+
+def make_seeds(tmp_path):
+    seed_dir = tmp_path / 'seeds'
+    (seed_dir / 'sub').mkdir(parents=True)
+    contents = {'b': b'bb', 'a': b'a', 'sub/c': b'ccc', 'e': b''}
+    for name, data in contents.items():
+        (seed_dir / name).write_bytes(data)
+    return str(seed_dir), contents
+
+def test_build_and_read_entries(tmp_path):
+    seed_dir, contents = make_seeds(tmp_path)
+    index = SeedIndex.open(seed_dir, str(tmp_path / 'index'))
+    entries = list(index)
+    assert [e.path for e in entries] == sorted(os.path.join(seed_dir, n) for n in contents)
+    for entry in entries:
+        data = contents[os.path.relpath(entry.path, seed_dir)]
+        assert entry == SeedEntry(hashlib.sha256(data).hexdigest(), len(data), entry.path)
+    assert len(index) == 4
+    assert index[2] == entries[2]
+
+def test_open_reuses_and_rebuilds(tmp_path):
+    seed_dir, _ = make_seeds(tmp_path)
+    index_dir = str(tmp_path / 'index')
+    index_path = os.path.join(index_dir, INDEX_NAME)
+    SeedIndex.open(seed_dir, index_dir)
+    mtime = os.stat(index_path).st_mtime_ns
+    SeedIndex.open(seed_dir, index_dir)
+    assert os.stat(index_path).st_mtime_ns == mtime
+    # An index built from another directory is rebuilt
+    other = tmp_path / 'other'
+    other.mkdir()
+    (other / 'x').write_bytes(b'x')
+    index = SeedIndex.open(str(other), index_dir)
+    assert [e.path for e in index] == [str(other / 'x')]
+
+def test_empty_directory(tmp_path):
+    seed_dir = tmp_path / 'empty'
+    seed_dir.mkdir()
+    index = SeedIndex.open(str(seed_dir), str(tmp_path / 'index'))
+    assert len(index) == 0
+    assert index.sample() == []
+
+def test_sample(tmp_path):
+    seed_dir, _ = make_seeds(tmp_path)
+    index = SeedIndex.open(seed_dir, str(tmp_path / 'index'))
+    assert index.sample() == list(index)
+    assert index.sample(-1) == list(index)
+    picked = index.sample(2, random.Random(7))
+    assert picked == index.sample(2, random.Random(7))
+    assert len(set(picked)) == 2 and set(picked) <= set(index)
+
+def test_seed_lists(tmp_path):
+    seed_dir, _ = make_seeds(tmp_path)
+    index = SeedIndex.open(seed_dir, str(tmp_path / 'index'))
+    paths = [e.path for e in index]
+    # A seed index reads as a seed list of its paths
+    assert read_seed_list(index.path) == paths
+    seed_list = write_seed_list(str(tmp_path / 'seeds.txt'), paths[:2])
+    assert seed_list.count == 2
+    assert read_seed_list(seed_list.path) == paths[:2]
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+from tgi_client import AIMDLimiter, TGIClient
+from tgi_standin import StandinHandler
+
+class BadGatewayHandler(StandinHandler):
+    """Answers /generate like a proxy whose upstream is down"""
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = b'<html><body><h1>502 Bad Gateway</h1></body></html>'
+        self.send_response(502)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def test_non_json_response_releases_slot():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BadGatewayHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f'http://127.0.0.1:{server.server_address[1]}'
+
+    async def run():
+        async with TGIClient(max_per_endpoint=1, adaptive=True, initial=1) as client:
+            # With a leaked slot the second request would wait forever
+            results = []
+            for _ in range(3):
+                results.append(await asyncio.wait_for(
+                    client.generate(endpoint, {'inputs': 'x'}), timeout=10))
+            return results, client.limiter(endpoint).in_flight
+
+    try:
+        results, in_flight = asyncio.run(run())
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert in_flight == 0
+    for res in results:
+        assert res['error_type'] == 'client'
+        assert 'generated_text' not in res
+
+def complete(limiter, n, latency=0.1, **kw):
+    async def run():
+        for _ in range(n):
+            await limiter.acquire()
+            await limiter.release(latency=latency, queue_time=kw.get('queue_time'),
+                                  token_latency=kw.get('token_latency'), error=kw.get('error', False))
+    asyncio.run(run())
+
+def test_limiter_slow_start_then_backoff():
+    limiter = AIMDLimiter('e', initial=1, max_limit=16)
+    complete(limiter, 5)
+    assert int(limiter.limit) == 6
+    complete(limiter, 1, error=True)
+    assert int(limiter.limit) == 3
+    assert not limiter.slow_start
+    # Only one decrease per round of requests, however many errors it has
+    complete(limiter, 3, latency=60, error=True)
+    assert int(limiter.limit) == 3
+
+def test_limiter_additive_increase_and_ceiling():
+    limiter = AIMDLimiter('e', initial=4, max_limit=5)
+    limiter.slow_start = False
+    complete(limiter, 4)
+    assert 4.9 < limiter.limit <= 5
+    complete(limiter, 20)
+    assert limiter.limit == 5
+
+def test_limiter_backs_off_on_queue_time_and_token_latency():
+    limiter = AIMDLimiter('e', initial=8, max_limit=8, target_queue_time=1.0)
+    complete(limiter, 1, queue_time=5.0)
+    assert int(limiter.limit) == 4
+    limiter = AIMDLimiter('e', initial=8, max_limit=8, latency_tolerance=2.0)
+    complete(limiter, 1, token_latency=0.01)
+    complete(limiter, 1, token_latency=0.05)
+    assert int(limiter.limit) == 4
+
+def test_limiter_holds_requests_over_the_limit():
+    limiter = AIMDLimiter('e', initial=2, max_limit=2)
+
+    async def run():
+        await limiter.acquire()
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        await limiter.release(latency=0.1, queue_time=None, token_latency=None, error=False)
+        await asyncio.wait_for(waiter, timeout=1)
+        return limiter.in_flight, limiter.peak_in_flight
+    assert asyncio.run(run()) == (2, 2)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+import asyncio
+import sys
+import time
+from typing import Dict, Optional
+import aiohttp
+
+class AIMDLimiter:
+    """Adaptive limit on the number of requests in flight to one server.
+
+    Works like TCP congestion control: the limit grows by one per request
+    during slow start and by one per round of requests afterwards (additive
+    increase), and is multiplied by `backoff` when the server shows signs of
+    saturation (multiplicative decrease). Saturation is any of: an error
+    response, a queue time above `target_queue_time`, or a per-token latency
+    more than `latency_tolerance` times the best one seen so far. At most one
+    decrease happens per round so that a burst of slow responses to the same
+    overload only counts once.
+    """
+    def __init__(self,
+                 name: str,
+                 initial: int,
+                 max_limit: int,
+                 min_limit: int = 1,
+                 backoff: float = 0.5,
+                 target_queue_time: float = 1.0,
+                 latency_tolerance: float = 2.0,
+                 ):
+        self.name = name
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.target_queue_time = target_queue_time
+        self.latency_tolerance = latency_tolerance
+        self.slow_start = True
+        self.in_flight = 0
+        self.best_token_latency = None
+        self.last_decrease = 0.0
+        self.smoothed_latency = None
+        self.cond = asyncio.Condition()
+        # For the summary: time-weighted average of requests in flight
+        self.start_time = time.monotonic()
+        self.last_change = self.start_time
+        self.in_flight_area = 0.0
+        self.peak_in_flight = 0
+        self.reported_limit = int(self.limit)
+
+    def _account(self):
+        now = time.monotonic()
+        self.in_flight_area += self.in_flight * (now - self.last_change)
+        self.last_change = now
+
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self._account()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    async def release(self, latency: float, queue_time: Optional[float],
+                      token_latency: Optional[float], error: bool):
+        async with self.cond:
+            self._account()
+            self.in_flight -= 1
+            self._update(latency, queue_time, token_latency, error)
+            self.cond.notify_all()
+
+    def _update(self, latency, queue_time, token_latency, error):
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency = 0.875 * self.smoothed_latency + 0.125 * latency
+        if token_latency is not None:
+            if self.best_token_latency is None or token_latency < self.best_token_latency:
+                self.best_token_latency = token_latency
+        congested = (
+            error
+            or (queue_time is not None and queue_time > self.target_queue_time)
+            or (token_latency is not None
+                and token_latency > self.latency_tolerance * self.best_token_latency)
+        )
+        now = time.monotonic()
+        if congested:
+            # Only back off once per round of requests
+            if now - self.last_decrease > self.smoothed_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.last_decrease = now
+                self.slow_start = False
+        elif self.slow_start:
+            self.limit = min(self.max_limit, self.limit + 1)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        if int(self.limit) != self.reported_limit:
+            self.reported_limit = int(self.limit)
+            print(f'[{self.name}] concurrency -> {self.reported_limit} '
+                  f'(in flight: {self.in_flight}, latency: {latency:.2f}s, '
+                  f'queue: {queue_time if queue_time is not None else float("nan"):.2f}s'
+                  f'{", error" if error else ""})', file=sys.stderr, flush=True)
+
+    def summary(self) -> str:
+        self._account()
+        elapsed = self.last_change - self.start_time
+        average = self.in_flight_area / elapsed if elapsed > 0 else 0.0
+        return (f'[{self.name}] final concurrency {int(self.limit)}, '
+                f'average in flight {average:.1f}, peak in flight {self.peak_in_flight}')
+
+def _header_seconds(headers, name: str) -> Optional[float]:
+    """TGI reports its timings in milliseconds in the x-*-time headers"""
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value) / 1000
+    except ValueError:
+        return None
+
+class TGIClient:
+    """Asyncio client for text-generation-inference servers.
+
+    All requests share one keep-alive connection pool. At most
+    `max_connections` sockets are open in total, and at most
+    `max_per_endpoint` requests are in flight against a single endpoint;
+    further requests wait for a free connection instead of opening a new one.
+
+    If `adaptive` is set, the number of requests in flight against each
+    endpoint is further controlled by an AIMDLimiter, with `max_per_endpoint`
+    as its ceiling. Any extra keyword arguments are passed to the limiters.
+    """
+    def __init__(self,
+                 max_connections: int = 256,
+                 max_per_endpoint: int = 16,
+                 timeout: Optional[float] = None,
+                 keepalive_timeout: float = 60,
+                 adaptive: bool = False,
+                 **limiter_args,
+                 ):
+        self.max_connections = max_connections
+        self.max_per_endpoint = max_per_endpoint
+        self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.adaptive = adaptive
+        self.limiter_args = limiter_args
+        self.limiters: Dict[str, AIMDLimiter] = {}
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_per_endpoint,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.session.close()
+        self.session = None
+        for limiter in self.limiters.values():
+            print(limiter.summary(), file=sys.stderr, flush=True)
+
+    def limiter(self, endpoint: str) -> Optional[AIMDLimiter]:
+        if not self.adaptive:
+            return None
+        if endpoint not in self.limiters:
+            self.limiters[endpoint] = AIMDLimiter(
+                endpoint,
+                max_limit=self.max_per_endpoint,
+                **self.limiter_args,
+            )
+        return self.limiters[endpoint]
+
+    async def info(self, endpoint: str) -> dict:
+        """Get information about the model served at `endpoint`."""
+        async with self.session.get(f'{endpoint}/info') as resp:
+            return await resp.json(content_type=None)
+
+    async def generate(self, endpoint: str, data: dict) -> dict:
+        """POST a request to `endpoint`/generate and return the decoded response.
+
+        Transport errors are returned as a TGI-style error response rather than
+        raised, so that a single dropped connection only loses one variant.
+        """
+        limiter = self.limiter(endpoint)
+        if limiter is not None:
+            await limiter.acquire()
+        start = time.monotonic()
+        queue_time = None
+        token_latency = None
+        res = None
+        try:
+            async with self.session.post(f'{endpoint}/generate', json=data) as resp:
+                queue_time = _header_seconds(resp.headers, 'x-queue-time')
+                token_latency = _header_seconds(resp.headers, 'x-time-per-token')
+                res = await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            # ValueError: a body that isn't JSON, e.g. a proxy's HTML error page
+            res = {
+                'error': f'{e.__class__.__name__}: {e}',
+                'error_type': 'client',
+            }
+        finally:
+            # Always give the slot back, or the endpoint's limit shrinks for good
+            if limiter is not None:
+                if queue_time is None and isinstance(res, dict):
+                    # Fall back to the timings in the details block, if the
+                    # server puts them there
+                    queue_time = res.get('details', {}).get('queue_time')
+                await limiter.release(
+                    latency=time.monotonic() - start,
+                    queue_time=queue_time,
+                    token_latency=token_latency,
+                    error=not isinstance(res, dict) or 'generated_text' not in res,
+                )
+        return res
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# A stand-in for a text-generation-inference server, for trying out changes to
+# the variant generation client without a GPU. It answers /info and /generate
+# like TGI does and simulates the costs that matter for the client: a fixed
+# number of batch slots, a prefill cost for every prompt character that isn't
+# covered by its prefix cache, and a per-token decoding cost.
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict
+
+class PrefixCache:
+    """LRU cache of recently seen prompts, used to find the longest shared prefix"""
+    def __init__(self, size: int):
+        self.size = size
+        self.prompts = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, prompt: str) -> int:
+        """Return the length of the longest cached prefix of `prompt` and cache it."""
+        best = 0
+        with self.lock:
+            for cached in self.prompts:
+                n = 0
+                limit = min(len(cached), len(prompt))
+                while n < limit and cached[n] == prompt[n]:
+                    n += 1
+                best = max(best, n)
+            self.prompts[prompt] = True
+            self.prompts.move_to_end(prompt)
+            while len(self.prompts) > self.size:
+                self.prompts.popitem(last=False)
+        return best
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, obj, status=200, headers=None):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/info':
+            self.send_json({'error': 'not found'}, status=404)
+            return
+        self.send_json({
+            'model_id': self.server.args.model_id,
+            'max_concurrent_requests': self.server.args.slots,
+        })
+
+    def do_POST(self):
+        if self.path != '/generate':
+            self.send_json({'error': 'not found'}, status=404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        data = json.loads(self.rfile.read(length))
+        args = self.server.args
+        prompt = data['inputs']
+        params = data.get('parameters', {})
+        max_new_tokens = params.get('max_new_tokens', 20)
+
+        queued = time.monotonic()
+        with self.server.slots:
+            queue_time = time.monotonic() - queued
+            cached = self.server.cache.lookup(prompt)
+            prefill = (len(prompt) - cached) * args.prefill_ms_per_char / 1000
+            tokens = random.randint(1, max(1, max_new_tokens))
+            decode = tokens * args.ms_per_token / 1000
+            time.sleep(prefill + decode)
+
+        text = ' '.join(f'x{random.randrange(1000)}' for _ in range(tokens))
+        self.send_json({
+            'generated_text': text,
+            'details': {
+                'finish_reason': 'length' if tokens == max_new_tokens else 'eos_token',
+                'generated_tokens': tokens,
+            },
+        }, headers={
+            'x-queue-time': f'{queue_time * 1000:.0f}',
+            'x-time-per-token': f'{args.ms_per_token:.0f}',
+            'x-prefill-cached-chars': str(cached),
+        })
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Stand-in for a text-generation-inference server',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8192)
+    parser.add_argument('--model-id', type=str, default='standin/model')
+    parser.add_argument('--slots', type=int, default=8,
+                        help='Number of requests processed at once')
+    parser.add_argument('--prefill-ms-per-char', type=float, default=0.01,
+                        help='Prefill cost per prompt character not in the prefix cache')
+    parser.add_argument('--ms-per-token', type=float, default=1.0,
+                        help='Decoding cost per generated token')
+    parser.add_argument('--prefix-cache-size', type=int, default=16,
+                        help='Number of recent prompts kept in the prefix cache')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), StandinHandler)
+    server.daemon_threads = True
+    server.args = args
+    server.slots = threading.BoundedSemaphore(args.slots)
+    server.cache = PrefixCache(args.prefix_cache_size)
+    print(f'Serving {args.model_id} on http://{args.host}:{args.port}', flush=True)
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()